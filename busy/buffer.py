@@ -0,0 +1,236 @@
+"""エディタの内容をPython側で保持する、テキストバッファを提供するモジュール.
+
+Textウィジェットから内容を取り出すと、その度にTclが呼ばれ、文字列のコピーが作られます。
+TextBufferはウィジェットと同じ内容を行ごとに保持し、Tclを呼ばずに読めるようにします。
+
+行はBLOCK_SIZE行程度のブロックに分けて持ち、
+ブロックごとの行数と文字数をFenwick木(累積和を対数時間で求められる木)で管理します。
+そのため、行番号や文字の位置からブロックを探すのは O(log n)、
+編集はそのブロックの中だけを書き換えるので、文書全体のコピーは起きません。
+ブロックのリストは書き換えずに新しいリストで置き換えるので、
+copyで作った複製は元のバッファが編集されても変わらず、他のスレッドから読めます。
+
+行番号はTkに合わせて1始まり、列は0始まりです。
+
+"""
+BLOCK_SIZE = 512  # 1つのブロックの行数の目安
+
+
+class FenwickTree:
+    """値の更新と、先頭からの累積和をO(log n)で行う木."""
+
+    def __init__(self, values=()):
+        self.size = len(values)
+        self.tree = [0] * (self.size + 1)
+        for i, value in enumerate(values, 1):
+            self.tree[i] += value
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def add(self, index, delta):
+        """index番目(0始まり)の値にdeltaを足す."""
+        i = index + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, index):
+        """0番目からindex番目の手前までの値の合計を返す."""
+        total = 0
+        i = index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, target):
+        """累積和がtargetを超える最初の位置と、その手前までの合計を返す.
+
+        return:
+            (位置, その位置の手前までの値の合計)
+        """
+        pos = 0
+        total = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            next_pos = pos + step
+            if next_pos <= self.size and total + self.tree[next_pos] <= target:
+                pos = next_pos
+                total += self.tree[next_pos]
+            step >>= 1
+        return pos, total
+
+
+class TextBuffer:
+    """行のブロックで内容を保持するテキストバッファ."""
+
+    def __init__(self, text=''):
+        """初期化.
+
+        args:
+            text: 最初の内容
+
+        """
+        self.set_text(text)
+
+    def set_text(self, text):
+        """内容を全て置き換える."""
+        blocks = self._to_blocks(text.split('\n'))
+        self._set_blocks(blocks, [self._count_chars(block) for block in blocks])
+
+    @staticmethod
+    def _to_blocks(lines):
+        """行のリストを、BLOCK_SIZE行程度のブロックのリストにする."""
+        count = max(1, -(-len(lines) // BLOCK_SIZE))
+        size = -(-len(lines) // count)
+        return [lines[i:i+size] for i in range(0, len(lines), size)]
+
+    def _set_blocks(self, blocks, block_chars):
+        """ブロックを置き換え、行数と文字数の木を作り直す.
+
+        args:
+            blocks: ブロックのリスト
+            block_chars: 各ブロックの文字数のリスト
+
+        """
+        self.blocks = blocks
+        self.block_chars = block_chars
+        self.line_tree = FenwickTree([len(block) for block in blocks])
+        self.char_tree = FenwickTree(block_chars)
+
+    def copy(self):
+        """同じ内容のTextBufferを返す. ブロックのリストは共有するので、ブロックの数に比例する時間で作れます."""
+        buffer = TextBuffer.__new__(TextBuffer)
+        buffer._set_blocks(list(self.blocks), list(self.block_chars))
+        return buffer
+
+    @staticmethod
+    def _count_chars(lines):
+        """行のリストの文字数を返す. 各行の末尾の改行も数える."""
+        return sum(len(line) for line in lines) + len(lines)
+
+    @property
+    def line_count(self):
+        """行数."""
+        return self.line_tree.prefix(len(self.blocks))
+
+    @property
+    def char_count(self):
+        """文字数. 最後の行の末尾には改行がないので、その分を引く."""
+        return self.char_tree.prefix(len(self.blocks)) - 1
+
+    def _locate(self, line):
+        """行番号から、(ブロックの位置, ブロック内の位置)を返す."""
+        block, before = self.line_tree.find(min(max(line, 1), self.line_count) - 1)
+        return block, line - 1 - before
+
+    def get_line(self, line):
+        """line行目のテキストを、末尾の改行なしで返す."""
+        block, i = self._locate(line)
+        return self.blocks[block][i]
+
+    def iter_lines(self, start=1, stop=None):
+        """start行目からstop行目の手前までの、各行のテキストを返すイテレータ."""
+        line_count = self.line_count
+        stop = line_count + 1 if stop is None else min(stop, line_count + 1)
+        if start >= stop:
+            return
+        block, i = self._locate(start)
+        remaining = stop - start
+        while remaining > 0:
+            lines = self.blocks[block][i:i+remaining]
+            yield from lines
+            remaining -= len(lines)
+            block += 1
+            i = 0
+
+    def get_lines(self, start=1, stop=None):
+        """start行目からstop行目の手前までの、各行のテキストのリストを返す."""
+        return list(self.iter_lines(start, stop))
+
+    def get_text(self):
+        """全ての内容を返す."""
+        return '\n'.join(self.iter_lines())
+
+    def get(self, start, end):
+        """startからendの手前までのテキストを返す.
+
+        args:
+            start: (行番号, 列)
+            end: (行番号, 列)
+
+        """
+        (start_line, start_col), (end_line, end_col) = start, end
+        if start_line == end_line:
+            return self.get_line(start_line)[start_col:end_col]
+        lines = self.get_lines(start_line, end_line + 1)
+        lines[0] = lines[0][start_col:]
+        lines[-1] = lines[-1][:end_col]
+        return '\n'.join(lines)
+
+    def index_to_offset(self, line, col):
+        """(行番号, 列)を、先頭からの文字数にする."""
+        block, i = self._locate(line)
+        offset = self.char_tree.prefix(block)
+        offset += self._count_chars(self.blocks[block][:i])
+        return offset + min(col, len(self.blocks[block][i]))
+
+    def offset_to_index(self, offset):
+        """先頭からの文字数を、(行番号, 列)にする."""
+        offset = min(max(offset, 0), self.char_count)
+        block, before = self.char_tree.find(offset)
+        block = min(block, len(self.blocks) - 1)
+        before = self.char_tree.prefix(block)
+        line = self.line_tree.prefix(block) + 1
+        for text in self.blocks[block]:
+            if offset - before <= len(text):
+                return line, offset - before
+            before += len(text) + 1
+            line += 1
+        return line - 1, len(self.blocks[block][-1])
+
+    def get_word_before(self, line, col, separators=' \t'):
+        """(行番号, 列)の手前にある、separatorsで区切られた単語と、その開始列を返す."""
+        text = self.get_line(line)[:col]
+        start = max(text.rfind(separator) for separator in separators) + 1
+        return text[start:], start
+
+    def replace_lines(self, first, last, lines):
+        """first行目からlast行目までを、linesで置き換える.
+
+        args:
+            first: 置き換える最初の行番号
+            last: 置き換える最後の行番号
+            lines: 新しい各行のテキストのリスト(末尾の改行なし)
+
+        """
+        first_block, first_i = self._locate(first)
+        last_block, last_i = self._locate(last)
+        block_lines = self.blocks[first_block:last_block+1]
+        merged = block_lines[0][:first_i] + list(lines) + block_lines[-1][last_i+1:]
+
+        # 小さくなったブロックは、次のブロックとまとめる
+        if len(merged) < BLOCK_SIZE // 2 and last_block + 1 < len(self.blocks):
+            last_block += 1
+            merged += self.blocks[last_block]
+
+        if first_block == last_block and 0 < len(merged) <= BLOCK_SIZE * 2:
+            # 1つのブロックの中の変更ならば、木はそのブロックの分だけ更新する
+            # ブロックが空になる場合は、空のブロックを残さないよう下で作り直す
+            chars = self._count_chars(merged)
+            self.line_tree.add(first_block, len(merged) - len(self.blocks[first_block]))
+            self.char_tree.add(first_block, chars - self.block_chars[first_block])
+            self.blocks[first_block] = merged
+            self.block_chars[first_block] = chars
+            return
+
+        # ブロックの数が変わる場合は、木を作り直す
+        new_blocks = self._to_blocks(merged) if merged else []
+        new_chars = [self._count_chars(block) for block in new_blocks]
+        blocks = self.blocks[:first_block] + new_blocks + self.blocks[last_block+1:]
+        block_chars = (
+            self.block_chars[:first_block] + new_chars + self.block_chars[last_block+1:])
+        if not blocks:
+            blocks, block_chars = [['']], [1]
+        self._set_blocks(blocks, block_chars)
@@ -4,28 +4,34 @@
 エディタのスタイルオブジェクトを返すget_code_style関数を提供します。
 
 """
-import os
-
 from .base import BaseCodeStyle
 from .python import PythonCodeStyle
 from .html import HTMLCodeStyle
 from .css import CSSCodeStyle
 from .js import JSCodeStyle
+from .generic import GenericCodeStyle
+from .registry import (
+    find_code_style_class, get_lexer_for_path, register_code_style
+)
+
+register_code_style(PythonCodeStyle, '*.py', '*.pyw')
+register_code_style(HTMLCodeStyle, '*.html', '*.htm')
+register_code_style(CSSCodeStyle, '*.css')
+register_code_style(JSCodeStyle, '*.js')
 
 
 def get_code_style(editor_frame, path=None):
     """エディタのスタイルオブジェクトを返す."""
     if path is None:
         return BaseCodeStyle(editor_frame)
-    else:
-        _, extension = os.path.splitext(path)
-        if extension == '.py':
-            return PythonCodeStyle(editor_frame)
-        elif extension == '.html':
-            return HTMLCodeStyle(editor_frame)
-        elif extension == '.css':
-            return CSSCodeStyle(editor_frame)
-        elif extension == '.js':
-            return JSCodeStyle(editor_frame)
-        else:
-            return BaseCodeStyle(editor_frame)
+
+    # 専用のスタイルがあれば、それを使う
+    code_style_cls = find_code_style_class(path)
+    if code_style_cls is not None:
+        return code_style_cls(editor_frame)
+
+    # なければ、Pygmentsがファイル名から判断できるレキサーでハイライトする
+    lexer = get_lexer_for_path(path)
+    if lexer is not None:
+        return GenericCodeStyle(editor_frame, lexer)
+    return BaseCodeStyle(editor_frame)
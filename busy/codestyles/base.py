@@ -1,4 +1,6 @@
 """コードスタイルの基底クラス、機能を集めたモジュール."""
+from .highlight import Highlighter
+from .registry import get_lexer_by_alias
 
 
 class BaseCodeStyle:
@@ -6,12 +8,24 @@ class BaseCodeStyle:
 
     one_indent = ' \t'  # タブ
     next_is_indent = ['(', '{', '[']  # これらの後にエンターを押すと、次行はインデント一つたされる
+    lexer_name = None  # ハイライトに使うPygmentsのレキサーのエイリアス名。Noneならハイライトしない
 
     def __init__(self, editor_frame):
         """初期化."""
         self.editor = editor_frame
         self.text = editor_frame.text
         self.indent_length = len(self.one_indent)
+        self.tag_names = set()  # ハイライトのために定義したタグ名
+        self.token_tags = {}  # トークン: タグ名 のキャッシュ
+        lexer = self.get_lexer()
+        if lexer is None:
+            self.highlighter = None
+        else:
+            self.highlighter = Highlighter(
+                self.text, lexer, tag_func=self.get_tag,
+                symbol_func=self.get_symbol, symbol_listener=self.on_symbols,
+                buffer=self.text.buffer,
+            )
 
     def tab(self):
         """タブキー."""
@@ -37,8 +51,7 @@ class BaseCodeStyle:
         if first and last:
             for row in range(first, last+1):
                 # 各行のテキスト
-                current_line_text = self.text.get(
-                    '{0}.0'.format(row), '{0}.end'.format(row))
+                current_line_text = self.text.buffer.get_line(row)
 
                 # 各行の最初がインデントならば、それを消す
                 indent_range_text = current_line_text[:self.indent_length]
@@ -101,13 +114,100 @@ class BaseCodeStyle:
         return 'break'
 
     def lint(self):
-        """スタイルガイドのチェックを行う."""
+        """スタイルガイドのチェックを行う.
+
+        return:
+            すぐに結果が分かった場合はその結果出力。それ以外はNone
+        """
+        return None
+
+    def get_lexer(self):
+        """ハイライトに使うPygmentsのレキサーを返す.
+
+        ハイライトを行わないスタイルではNoneを返します。
+
+        """
+        if self.lexer_name is None:
+            return None
+        return get_lexer_by_alias(self.lexer_name)
+
+    def tag_configure(self, tag, **kwargs):
+        """ハイライトに使うタグを定義する."""
+        self.text.tag_configure(tag, **kwargs)
+        self.tag_names.add(tag)
+        self.token_tags = {}
+
+    def get_tag(self, token):
+        """トークンに付けるタグ名を返す.
+
+        定義したタグの中で、トークン自身か最も近い親のタグ名を返します。
+        Token.Keyword.Constantならば、Token.Keywordのタグで表示されます。
+        タグが定義されていなければ、Noneを返します(タグを付けない)。
+
+        """
+        try:
+            return self.token_tags[token]
+        except KeyError:
+            pass
+        tag = None
+        parent = token
+        while parent is not None:
+            if str(parent) in self.tag_names:
+                tag = str(parent)
+                break
+            parent = parent.parent
+        self.token_tags[token] = tag
+        return tag
+
+    def get_symbol(self, token, content):
+        """補完に使う名前ならば、その名前を返す.
+
+        ハイライト時に、ワーカースレッドからトークンごとに呼ばれます。
+        名前でなければNoneを返してください。
+
+        """
+        return None
+
+    def on_symbols(self, removed, added):
+        """行の変更で、なくなった名前と増えた名前を受け取る."""
         pass
 
+    def on_edit(self, first, last, delta):
+        """テキストが変更された際に、変更された行の範囲を受け取る."""
+        if self.highlighter is not None:
+            self.highlighter.edit(first, last, delta)
+
     def line_highlight(self):
-        """現在行をハイライトする."""
-        pass
+        """変更された行をハイライトし直す.
+
+        見えている範囲だけをすぐにハイライトし、残りはバックグラウンドで行います。
+
+        """
+        self.view_highlight()
+
+    def view_highlight(self):
+        """見えている範囲を先にハイライトし、残りをバックグラウンドで行う."""
+        if self.highlighter is not None:
+            self.highlighter.schedule()
 
     def all_highlight(self):
         """全行をハイライトする."""
-        pass
+        if self.highlighter is not None:
+            self.highlighter.reset()
+            self.highlighter.highlight()
+
+    def get_highlight_stats(self):
+        """ハイライトのタグ範囲の数等、デバッグ用の情報を文字列で返す."""
+        if self.highlighter is None:
+            return 'no highlight'
+        counts = self.highlighter.count_ranges()
+        lines = ['tag ranges: {0}'.format(sum(counts.values()))]
+        for tag, count in sorted(counts.items()):
+            lines.append('    {0}: {1}'.format(tag, count))
+        lines.append(str(self.highlighter.stats))
+        return '\n'.join(lines)
+
+    def close(self):
+        """スタイルを使い終わった際の後始末."""
+        if self.highlighter is not None:
+            self.highlighter.clear()
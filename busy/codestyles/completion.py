@@ -0,0 +1,227 @@
+"""コード補完の候補を検索する機能を提供するモジュール.
+
+PrefixIndexは名前をソート済みのリストで持ち、前方一致する名前を二分探索で探します。
+候補の数がいくら増えても、1回の検索のコストは log(名前の数) + 返す候補の数 で済みます。
+
+FuzzyCompleterは、入力した文字が順番通りに含まれていれば候補にするあいまい検索です。
+単語の区切り(snake_caseの_の後、camelCaseの大文字)での一致や、最近選んだ名前を上位にします。
+名前ごとの小文字や区切りの位置は一度だけ計算して使い回し、
+入力が続けば前回一致した候補だけを絞り込むので、キー入力ごとのコストは小さく済みます。
+
+"""
+import heapq
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import islice
+
+COMPLETION_LIMIT = 50  # 補完リストに表示する候補の数の上限
+FULL_SCAN_LIMIT = 5000  # これより大きい索引は、最初の1文字が一致する名前だけを候補にする
+RECENT_SIZE = 100  # 覚えておく、最近選んだ名前の数
+
+# あいまい検索の点数
+FIRST_BONUS = 8  # 名前の先頭で一致
+BOUNDARY_BONUS = 6  # 単語の区切りで一致
+CONSECUTIVE_BONUS = 4  # 前の文字に続けて一致
+PREFIX_BONUS = 10  # 入力通りの大文字小文字で、名前が始まる
+RECENT_BONUS = 10  # 最近選んだ名前
+SOURCE_BONUS = 4  # 優先する索引の名前。索引の優先度ごとに加点
+GAP_PENALTY_MAX = 3  # 飛ばした文字による減点の上限
+
+_keys = {}  # 名前: CompletionKey のキャッシュ
+
+
+class PrefixIndex:
+    """名前を前方一致で検索するための、ソート済みの索引."""
+
+    def __init__(self, names=()):
+        self.names = sorted(set(names))
+
+    def __contains__(self, name):
+        i = bisect_left(self.names, name)
+        return i < len(self.names) and self.names[i] == name
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """名前を追加する."""
+        i = bisect_left(self.names, name)
+        if i == len(self.names) or self.names[i] != name:
+            self.names.insert(i, name)
+
+    def discard(self, name):
+        """名前を削除する. なければ何もしない."""
+        i = bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name:
+            del self.names[i]
+
+    def clear(self):
+        """全ての名前を削除する."""
+        self.names = []
+
+    def iter_prefix(self, prefix):
+        """prefixで始まる名前を、辞書順に返すイテレータ."""
+        names = self.names
+        i = bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix):
+            yield names[i]
+            i += 1
+
+    def search(self, prefix, limit=COMPLETION_LIMIT):
+        """prefixで始まる名前を、辞書順にlimit個まで返す."""
+        return list(islice(self.iter_prefix(prefix), limit))
+
+
+class CompletionKey:
+    """あいまい検索のために、名前から事前に計算しておく値."""
+
+    __slots__ = ('name', 'lower', 'boundaries', 'boundary_set')
+
+    def __init__(self, name):
+        self.name = name
+        self.lower = name.lower()
+        boundaries = []
+        for i, char in enumerate(name):
+            before = name[i-1] if i else ''
+            if i == 0 or (before in '_.' and char not in '_.') or \
+                    (char.isupper() and before.islower()):
+                boundaries.append(i)
+        self.boundaries = tuple(boundaries)  # 単語の区切りとなる位置
+        self.boundary_set = frozenset(boundaries)
+
+
+def get_key(name):
+    """名前のCompletionKeyを返す. 一度計算したものは使い回す."""
+    try:
+        return _keys[name]
+    except KeyError:
+        key = _keys[name] = CompletionKey(name)
+        return key
+
+
+def _fuzzy_score(query, key, jump):
+    """fuzzy_scoreの本体. jumpがTrueなら、連続しない文字は単語の区切りでの一致を優先する."""
+    lower = key.lower
+    score = 0
+    pos = 0
+    prev = -1
+    for char in query:
+        i = lower.find(char, pos)
+        if i < 0:
+            return None
+        if jump and i != prev + 1:
+            for boundary in key.boundaries:
+                if boundary >= i and lower[boundary] == char:
+                    i = boundary
+                    break
+        if i == 0:
+            score += FIRST_BONUS
+        elif i in key.boundary_set:
+            score += BOUNDARY_BONUS
+        if i == prev + 1:
+            score += CONSECUTIVE_BONUS
+        else:
+            score -= min(i - pos, GAP_PENALTY_MAX)
+        prev = i
+        pos = i + 1
+    return score
+
+
+def fuzzy_score(query, key):
+    """queryの文字が順番通りにkeyの名前に含まれていれば点数を、なければNoneを返す.
+
+    args:
+        query: 入力中の単語
+        key: 名前のCompletionKey
+
+    return:
+        点数。大きいほど上位になる
+    """
+    lower_query = query.lower()
+    score = _fuzzy_score(lower_query, key, True)
+    if score is None:
+        # 区切りを優先したせいで一致しなくなった場合
+        score = _fuzzy_score(lower_query, key, False)
+        if score is None:
+            return None
+    if key.name.startswith(query):
+        score += PREFIX_BONUS
+    return score
+
+
+class FuzzyCompleter:
+    """あいまい検索で補完の候補を探し、並べ替えるクラス."""
+
+    def __init__(self, get_indexes):
+        """初期化.
+
+        args:
+            get_indexes: 候補にするPrefixIndexのリストを返す関数。先の索引ほど優先する
+
+        """
+        self.get_indexes = get_indexes
+        self.recent = OrderedDict()  # 最近選んだ名前。後ろほど新しい
+        self.reset()
+
+    def reset(self):
+        """前回の検索結果を捨てる. 索引の内容が変わった可能性がある場合に呼んでください."""
+        self.query = None
+        self.matches = []  # 前回一致した [(CompletionKey, 優先度), ...]
+
+    def use(self, name):
+        """名前が選ばれたことを記録する."""
+        self.recent.pop(name, None)
+        self.recent[name] = True
+        if len(self.recent) > RECENT_SIZE:
+            self.recent.popitem(last=False)
+
+    def iter_candidates(self, query):
+        """検索の対象とする(CompletionKey, 優先度)を返すイテレータ."""
+        indexes = self.get_indexes()
+        seen = set()
+        for priority, index in enumerate(indexes):
+            priority = len(indexes) - 1 - priority
+            if len(index) > FULL_SCAN_LIMIT:
+                # 大きな索引は、最初の1文字が一致する名前だけにする
+                first = query[:1]
+                names = index.iter_prefix(first.lower())
+                if first.upper() != first.lower():
+                    names = list(names) + list(index.iter_prefix(first.upper()))
+            else:
+                names = index.names
+            for name in names:
+                if name not in seen:
+                    seen.add(name)
+                    yield get_key(name), priority
+
+    def search(self, query, limit=COMPLETION_LIMIT):
+        """queryに一致する名前を、点数の高い順にlimit個まで返す."""
+        if not query:
+            # os. の直後等、まだ何も入力していなければ、全ての候補を最近選んだ順、辞書順に返す
+            self.reset()
+            names = []
+            for index in self.get_indexes():
+                names.extend(index.names)
+            names = list(OrderedDict.fromkeys(names))
+            names.sort(key=lambda name: name not in self.recent)
+            return names[:limit]
+        if self.query and query.startswith(self.query):
+            # 入力が続いた場合は、前回一致したものから絞り込む
+            candidates = self.matches
+        else:
+            candidates = self.iter_candidates(query)
+
+        matches = []
+        scored = []
+        for key, priority in candidates:
+            score = fuzzy_score(query, key)
+            if score is None:
+                continue
+            matches.append((key, priority))
+            score += priority * SOURCE_BONUS
+            if key.name in self.recent:
+                score += RECENT_BONUS
+            scored.append((-score, len(key.name), key.name))
+        self.query = query
+        self.matches = matches
+        return [item[-1] for item in heapq.nsmallest(limit, scored)]
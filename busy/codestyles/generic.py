@@ -0,0 +1,54 @@
+"""Pygmentsのレキサーでハイライトだけを行う、汎用的なコードスタイル."""
+from busy.codestyles import BaseCodeStyle
+
+
+class GenericCodeStyle(BaseCodeStyle):
+    """専用のスタイルがないファイルのエディタスタイル.
+
+    YAMLやSQL、シェルスクリプト等、Pygmentsがファイル名から判断できるレキサーでハイライトします。
+
+    """
+
+    def __init__(self, editor_frame, lexer):
+        """初期化.
+
+        args:
+            editor_frame: エディタのフレーム
+            lexer: ハイライトに使うPygmentsのレキサー
+
+        """
+        self.lexer = lexer
+        super().__init__(editor_frame)
+        self.create_text_tag()
+
+    def create_text_tag(self):
+        """タグの定義."""
+        # 黄色く表示する
+        self.tag_configure(
+            'Token.Keyword', foreground='#CC7A00')  # キーワード
+        self.tag_configure(
+            'Token.Name.Tag', foreground='#CC7A00')  # YAMLのキー、HTMLのタグ
+
+        # 青く表示する
+        self.tag_configure(
+            'Token.Name.Builtin', foreground='#003D99')  # 組み込みの名前
+        self.tag_configure(
+            'Token.Name.Class', foreground='#003D99')  # クラス名
+        self.tag_configure(
+            'Token.Name.Function', foreground='#003D99')  # 関数名
+
+        # 緑表示する
+        self.tag_configure(
+            'Token.Name.Attribute', foreground='#248F24')  # 属性名
+        self.tag_configure(
+            'Token.Literal.String', foreground='#248F24')  # 文字列
+
+        # 赤表示する
+        self.tag_configure(
+            'Token.Literal.Number', foreground='#dc143c')  # 数字
+        self.tag_configure(
+            'Token.Comment', foreground='#dc143c')  # コメント
+
+    def get_lexer(self):
+        """ハイライトに使うPygmentsのレキサーを返す."""
+        return self.lexer
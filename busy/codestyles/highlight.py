@@ -0,0 +1,728 @@
+"""インクリメンタルハイライトの機能を提供するモジュール.
+
+各行の先頭でのPygmentsレキサーの状態スタックを保存しておき、
+変更された最初の行から字句解析をやり直します。
+保存済みの状態と同じ状態になった時点で解析を打ち切るので、
+キー入力ごとのコストは編集の大きさに比例し、ファイルの大きさには比例しません。
+
+解析は行ごとではなく、解析を始める行から文書の最後までのテキストに対して続けて行います。
+そのため、複数行のコメントのような行をまたぐトークンも、文書全体を解析した場合と同じになります。
+状態を保存するのはトークンの区切りが行の先頭にある行だけで、トークンの途中から始まる行は、
+そのトークンが始まる行まで遡って解析し直します。
+/* */のように1つの正規表現で複数行を読むルールが、閉じていないために一致しなかった行も記録しておき、
+それより後ろが編集されれば、その行も解析し直します。後ろの行で閉じられれば、前の行の結果も変わるためです。
+RegexLexerの処理を上書きしているレキサーは、行ごとの状態を保存できないので、毎回文書全体を解析します。
+
+字句解析はワーカースレッドで行い、Tkのスレッドでは結果のタグ付けだけを行います。
+補完に使う名前(シンボル)も行ごとに記録し、行が変更・削除されればその行の名前を取り除きます。
+ワーカースレッドには解析する行のテキストと、変更の度に増える番号を渡します。
+結果が返るまでにテキストが変更された場合、その結果は捨てて解析し直します。
+
+"""
+import re
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+
+from pygments.lexer import RegexLexer
+from pygments.token import Error, Whitespace, _TokenType
+
+from .tagging import TagBatch, TagStats
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse  # Python 3.11以降
+except ImportError:
+    import sre_constants
+    import sre_parse
+
+ROOT_STATE = ('root',)
+JOB_LINES = 500  # ワーカースレッドに一度に解析させる行数の目安
+APPLY_LINES = 500  # アイドル時に一度にタグ付けする行数の上限
+POLL_INTERVAL = 5  # ワーカースレッドの結果を確認する間隔(ミリ秒)
+
+REPEATS = (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT)
+CATEGORY_REGEXES = {
+    sre_constants.CATEGORY_DIGIT: re.compile(r'\d'),
+    sre_constants.CATEGORY_NOT_DIGIT: re.compile(r'\D'),
+    sre_constants.CATEGORY_SPACE: re.compile(r'\s'),
+    sre_constants.CATEGORY_NOT_SPACE: re.compile(r'\S'),
+    sre_constants.CATEGORY_WORD: re.compile(r'\w'),
+    sre_constants.CATEGORY_NOT_WORD: re.compile(r'\W'),
+}
+
+_executor = None
+_scan_rules = {}  # レキサーのクラス: get_scan_rulesの結果
+
+
+def is_incremental(lexer):
+    """行ごとに状態を保存しながら解析できるレキサーかを返す.
+
+    lex_linesはRegexLexer.get_tokens_unprocessedと同じ処理を行うので、
+    それを上書きしているレキサー(ExtendedRegexLexerや、トークンを加工するCLexer等)は含みません。
+
+    """
+    return isinstance(lexer, RegexLexer) and \
+        type(lexer).get_tokens_unprocessed is RegexLexer.get_tokens_unprocessed
+
+
+def can_start_with(nodes, char, flags):
+    """正規表現の解析結果が、charから始まる文字列に一致し得るかを返す. 分からなければTrue."""
+    for op, av in nodes:
+        if op is sre_constants.LITERAL:
+            return chr(av) == char or bool(flags & re.IGNORECASE) and chr(av).lower() == char
+        elif op is sre_constants.NOT_LITERAL:
+            return chr(av) != char
+        elif op is sre_constants.ANY:
+            return char != '\n' or bool(flags & re.DOTALL)
+        elif op is sre_constants.IN:
+            negate = matched = False
+            for item_op, item_av in av:
+                if item_op is sre_constants.NEGATE:
+                    negate = True
+                elif item_op is sre_constants.LITERAL:
+                    matched |= chr(item_av) == char
+                elif item_op is sre_constants.RANGE:
+                    matched |= item_av[0] <= ord(char) <= item_av[1]
+                elif item_op is sre_constants.CATEGORY:
+                    regex = CATEGORY_REGEXES.get(item_av)
+                    matched |= regex is None or regex.match(char) is not None
+                else:
+                    matched = True
+            return matched != negate
+        elif op is sre_constants.BRANCH:
+            return any(can_start_with(branch, char, flags) for branch in av[1])
+        elif op is sre_constants.SUBPATTERN:
+            return can_start_with(av[-1], char, flags)
+        elif op in REPEATS:
+            if can_start_with(av[2], char, flags):
+                return True
+            if av[0]:
+                return False
+        elif op not in (sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            return True
+    return False
+
+
+def find_scan_prefix(nodes, flags, has_tail=False):
+    """改行をまたいで読み進み、その後にまだ一致させる部分がある繰り返しを探す.
+
+    /* */のコメントの中身を読む .*? のような繰り返しです。閉じる部分がなければ文書の最後まで読んでから一致しないので、
+    一致しなかった結果は、後ろの行の内容によって変わります。
+
+    return:
+        その繰り返しより前の、固定の文字列。繰り返しがなければNone
+    """
+    prefix = ''
+    for i, (op, av) in enumerate(nodes):
+        # 行末の$等だけが続く場合は、最初の行末で止まるので、続きがあるとはみなさない
+        tail = has_tail or any(node[0] is not sre_constants.AT for node in nodes[i+1:])
+        if op is sre_constants.LITERAL and not flags & re.IGNORECASE:
+            prefix += chr(av)
+            continue
+        if op in REPEATS:
+            if av[1] > 1 and tail and can_start_with(av[2], '\n', flags) and \
+                    can_start_with(av[2], 'a', flags):
+                return prefix
+            inner = find_scan_prefix(av[2], flags, tail)
+        elif op is sre_constants.SUBPATTERN:
+            inner = find_scan_prefix(av[-1], flags, tail)
+        elif op is sre_constants.BRANCH:
+            # 枝ごとに固定の文字列が違うので、枝の中の文字列は使わない
+            found = any(find_scan_prefix(branch, flags, tail) is not None for branch in av[1])
+            inner = '' if found else None
+        else:
+            return None
+        return None if inner is None else prefix + inner
+    return None
+
+
+def get_scan_rules(lexer):
+    """レキサーの状態ごとに、改行をまたいで読み進むルールを返す.
+
+    return:
+        {状態: [(ルールの番号, ルールの先頭の固定の文字列), ...]}
+    """
+    lexer_class = type(lexer)
+    if lexer_class not in _scan_rules:
+        scan_rules = {}
+        for state, rules in lexer._tokens.items():
+            for index, (rexmatch, _, _) in enumerate(rules):
+                regex = rexmatch.__self__
+                try:
+                    prefix = find_scan_prefix(list(sre_parse.parse(regex.pattern, regex.flags)),
+                                              regex.flags)
+                except (re.error, TypeError):
+                    prefix = ''  # 解析できなければ、閉じていないかもしれないとみなす
+                if prefix is not None:
+                    scan_rules.setdefault(state, []).append((index, prefix))
+        _scan_rules[lexer_class] = scan_rules
+    return _scan_rules[lexer_class]
+
+
+def lex_lines(lexer, lines, start, state, old_states, to_line, stop=None):
+    """start行から字句解析する. ワーカースレッドで実行されます.
+
+    RegexLexer.get_tokens_unprocessedと同じ処理を、start行から最後の行までのテキストに行います。
+    行の先頭がトークンの区切りならば、その時点の状態スタックをその行の状態とし、
+    トークンの途中から始まる行の状態はNoneとします。
+
+    args:
+        lexer: RegexLexerのインスタンス
+        lines: start行から最後の行までの、各行のテキスト(末尾の改行なし)のイテラブル
+        start: 最初の行の行番号(0始まり)
+        state: 最初の行の先頭での状態スタック
+        old_states: 2行目以降の各行の、保存済みの状態のリスト。解析済みでなければNone
+        to_line: 1行分のトークンを、(範囲のリスト, 名前のタプル)にする関数
+        stop: この行数を解析したら、次に状態を保存できる行で打ち切る。Noneならば最後まで解析する
+
+    return:
+        (各行の(範囲のリスト, 名前のタプル)のリスト, 各行の次の行の状態のリスト, 保存済みの状態と一致したか,
+         改行をまたいで読み進むルールが、閉じていないために一致しなかった行の行番号のリスト)
+    """
+    # 前に行があれば改行を付けておき、行頭での^や後読みを文書全体の場合と同じにする
+    prefix = '\n' if start else ''
+    text = prefix + '\n'.join(lines) + '\n'
+    end = len(text)
+    tokendefs = lexer._tokens
+    scan_rules = get_scan_rules(lexer)
+    statestack = list(state)
+    statetokens = tokendefs[statestack[-1]]
+    scans = scan_rules.get(statestack[-1])
+
+    results = []
+    end_states = []
+    open_lines = []
+    line_tokens = []  # 解析中の行の[(列, トークン, 文字列), ...]
+    pos = line_start = len(prefix)
+    next_start = text.find('\n', line_start) + 1 or end + 1  # 次の行の先頭の位置
+
+    def next_line():
+        """解析中の行を終え、次の行に進む. 次の行の状態は、分かるまでNoneにしておく."""
+        nonlocal line_tokens, line_start, next_start
+        results.append(to_line(line_tokens))
+        end_states.append(None)
+        line_tokens = []
+        line_start = next_start
+        next_start = text.find('\n', line_start) + 1 or end + 1
+
+    while pos < end:
+        token_start = pos
+        for index, (rexmatch, action, new_state) in enumerate(statetokens):
+            m = rexmatch(text, pos)
+            if m:
+                if action is None:
+                    tokens = ()
+                elif type(action) is _TokenType:
+                    tokens = ((pos, action, m.group()),)
+                else:
+                    tokens = action(lexer, m)
+                pos = m.end()
+                if new_state is not None:
+                    # 状態の遷移
+                    if isinstance(new_state, tuple):
+                        for state in new_state:
+                            if state == '#pop':
+                                if len(statestack) > 1:
+                                    statestack.pop()
+                            elif state == '#push':
+                                statestack.append(statestack[-1])
+                            else:
+                                statestack.append(state)
+                    elif isinstance(new_state, int):
+                        if abs(new_state) >= len(statestack):
+                            del statestack[1:]
+                        else:
+                            del statestack[new_state:]
+                    elif new_state == '#push':
+                        statestack.append(statestack[-1])
+                    statetokens = tokendefs[statestack[-1]]
+                break
+        else:
+            # どのルールにもマッチしなかった場合
+            index = len(statetokens)
+            if text[pos] == '\n':
+                statestack = list(ROOT_STATE)
+                statetokens = tokendefs[statestack[-1]]
+                tokens = ((pos, Whitespace, '\n'),)
+            else:
+                tokens = ((pos, Error, text[pos]),)
+            pos += 1
+
+        if scans:
+            # 一致したルールより前の、改行をまたぐルールが始まっていれば、閉じていなかった
+            for scan_index, opener in scans:
+                if scan_index >= index:
+                    break
+                if text.startswith(opener, token_start):
+                    open_lines.append(start + len(results))
+                    break
+        scans = scan_rules.get(statestack[-1])
+
+        # トークンを行ごとに分ける
+        for token_pos, token, content in tokens:
+            while token_pos >= next_start:
+                next_line()
+            while token_pos + len(content) > next_start:
+                split = next_start - token_pos
+                line_tokens.append((token_pos - line_start, token, content[:split]))
+                token_pos, content = next_start, content[split:]
+                next_line()
+            line_tokens.append((token_pos - line_start, token, content))
+
+        if pos >= next_start:
+            while pos >= next_start:
+                next_line()
+            if pos == line_start:
+                # 行の先頭がトークンの区切りなので、状態を保存できる
+                state = tuple(statestack)
+                end_states[-1] = state
+                done = len(end_states)
+                # 以前と同じ状態になったら、これ以降の行は解析済みのものと同じ
+                if done <= len(old_states) and old_states[done-1] == state:
+                    return results, end_states, True, open_lines
+                if stop is not None and done >= stop:
+                    return results, end_states, False, open_lines
+    return results, end_states, False, open_lines
+
+
+def lex_document(lexer, lines, to_line):
+    """状態を保存できないレキサーで、文書全体を字句解析する. ワーカースレッドで実行されます.
+
+    args:
+        lexer: Pygmentsのレキサー
+        lines: 各行のテキスト(末尾の改行なし)のイテラブル
+        to_line: 1行分のトークンを、(範囲のリスト, 名前のタプル)にする関数
+
+    return:
+        (各行の(範囲のリスト, 名前のタプル)のリスト, 各行の行末での状態のリスト, True, [])
+    """
+    text = '\n'.join(lines) + '\n'
+    tokens = lexer.get_tokens_unprocessed(text)
+    results = [to_line(line) for line in split_lines(tokens)]
+    results = results[:text.count('\n')]
+    return results, [ROOT_STATE] * len(results), True, []
+
+
+def get_executor():
+    """字句解析を行うワーカースレッドを返す."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1)
+    return _executor
+
+
+def split_lines(tokens):
+    """文書全体のトークンを、行ごとのトークンに分割する.
+
+    args:
+        tokens: [(位置, トークン, 文字列), ...]
+
+    return:
+        [[(列, トークン, 文字列), ...], ...] 行ごとのリスト
+    """
+    lines = [[]]
+    col = 0
+    for _, token, content in tokens:
+        parts = content.split('\n')
+        for i, part in enumerate(parts):
+            if i:
+                lines.append([])
+                col = 0
+            if part:
+                lines[-1].append((col, token, part))
+                col += len(part)
+    return lines
+
+
+class Highlighter:
+    """Textウィジェットのインクリメンタルハイライトを行うクラス.
+
+    行番号は内部では0始まりで扱い、Tkのインデックスにする際に+1しています。
+
+    """
+
+    def __init__(self, text, lexer, tag_func=str, symbol_func=None, symbol_listener=None,
+                 buffer=None):
+        """初期化.
+
+        args:
+            text: ハイライトするTextウィジェット
+            lexer: Pygmentsのレキサー
+            tag_func: トークンからタグ名を返す関数。Noneを返すとタグを付けない
+            symbol_func: (トークン, 文字列)から、補完に使う名前を返す関数。名前でなければNoneを返す
+                ワーカースレッドから呼ばれることに注意してください
+            symbol_listener: 行の名前が変わった際に、(なくなった名前, 増えた名前)を受け取る関数
+                どちらも同じ名前が複数回含まれることがあります。Tkのスレッドから呼ばれます
+            buffer: テキストと同じ内容のTextBuffer。あれば、テキストはTclを呼ばずにここから読む
+
+        """
+        self.text = text
+        self.buffer = buffer
+        self.lexer = lexer
+        self.tag_func = tag_func
+        self.symbol_func = symbol_func
+        self.symbol_listener = symbol_listener
+        self.line_symbols = []
+        self.incremental = is_incremental(lexer)
+        self.applied_tags = set()
+        self.applied_spans = []
+        self.stats = TagStats()  # タグ付けでのTclの呼び出し回数
+        self.revision = 0  # テキストが変更される度に増える番号
+        self.future = None  # ワーカースレッドで実行中の解析
+        self.job = None  # 実行中の解析の(番号, 最初の行, 最初の行の状態)
+        self.poll_job = None
+        self.apply_job = None
+        self.reset()
+
+    def reset(self):
+        """保存している状態を破棄し、全行を解析し直す対象にする."""
+        if self.buffer is None:
+            line_count = int(self.text.index('end-1c').split('.')[0])
+        else:
+            line_count = self.buffer.line_count
+        self.states = [ROOT_STATE] + [None] * (line_count - 1)  # 各行の先頭での状態
+        self.line_spans = [None] * line_count  # 各行の[(タグ名, 開始列, 終了列), ...]
+        self._update_symbols(self.line_symbols, ())
+        self.line_symbols = [()] * line_count  # 各行の補完に使う名前
+        self.dirty = [0]  # 解析し直す必要のある行
+        self.open_lines = set()  # 閉じていないために、改行をまたぐルールが一致しなかった行
+        self.unapplied = []  # 解析済みで、まだタグ付けしていない範囲 [(最初の行, 最後の行+1), ...]
+        if len(self.applied_spans) != line_count:
+            # 各行に最後にタグ付けした範囲
+            # 編集された行は、付いている可能性のあるタグのfrozenset。全く分からなければNone
+            self.applied_spans = [None] * line_count
+        self.revision += 1
+
+    def edit(self, first, last, delta):
+        """テキストの変更を記録する.
+
+        args:
+            first: 変更された範囲の最初の行番号(Tkの行番号)
+            last: 変更された範囲の、変更前の最後の行番号(Tkの行番号)
+            delta: 変更で増えた行数。減った場合は負の数
+
+        """
+        self.revision += 1
+        line_count = len(self.line_spans)
+        first = min(first, line_count) - 1
+        # 変更後も範囲には少なくとも1行が残るので、減った行が範囲になければ広げる
+        last = min(max(last - 1, first, first - delta), line_count - 1)
+        count = max(last - first + 1 + delta, 1)  # 変更後の範囲の行数
+        delta = count - (last - first + 1)
+
+        # 各行の配列は、全て同じ範囲を同じ行数で置き換える
+        # 変更範囲の行は未解析とし、それ以降の行はずらしておく
+        # ずらした行の状態は、解析を打ち切るかの判断に使う
+        self.states[first+1:last+1] = [None] * (count - 1)
+        self.line_spans[first:last+1] = [None] * count
+
+        # 変更範囲の行の名前は一旦取り除き、解析し直した際に改めて追加する
+        self._update_symbols(self.line_symbols[first:last+1], ())
+        self.line_symbols[first:last+1] = [()] * count
+
+        # 変更範囲の行にどのタグが残っているかは分からないが、
+        # 変更前にその範囲に付けていたタグのどれかなので、それを覚えておく
+        tags = set()
+        for spans in self.applied_spans[first:last+1]:
+            if spans is None:
+                tags = None
+                break
+            tags.update(span[0] for span in spans)
+        unknown = None if tags is None else frozenset(tags)
+        self.applied_spans[first:last+1] = [unknown] * count
+
+        # 前の行のトークンも、先読みで変更範囲のテキストを見ていることがあるので、前の行から解析し直す
+        dirty = [max(first - 1, 0)]
+        for line in self.dirty:
+            if line > last:
+                dirty.append(line + delta)
+            elif line < first:
+                dirty.append(line)
+        # 閉じていなかった行は、変更範囲で閉じられたかもしれないので解析し直す
+        open_lines = set()
+        for line in self.open_lines:
+            if line > last:
+                open_lines.add(line + delta)
+            elif line < first:
+                open_lines.add(line)
+                dirty.append(line)
+        self.open_lines = open_lines
+        self.dirty = dirty
+
+        # タグ付けがまだの範囲から、変更範囲を除いてずらしておく
+        unapplied = []
+        for start, end in self.unapplied:
+            if start < first:
+                unapplied.append((start, min(end, first)))
+            if end > last + 1:
+                unapplied.append((max(start, last + 1) + delta, end + delta))
+        self.unapplied = unapplied
+
+    def get_lines(self, start):
+        """start行から最後の行までの、各行のテキストを末尾の改行なしで返すイテラブル.
+
+        バッファがあれば、その複製から読むイテレータを返します。
+        複製はブロックのリストを共有するだけなので、文書全体のコピーは起きず、
+        ワーカースレッドで読んでもTkのスレッドでの編集の影響を受けません。
+
+        """
+        if self.buffer is not None:
+            return self.buffer.copy().iter_lines(start + 1)
+        return self.text.get('{0}.0'.format(start + 1), 'end-1c').split('\n')
+
+    def get_old_states(self, start, stop):
+        """start行の次の行からstop行までの、解析済みの状態を返す."""
+        line_count = len(self.line_spans)
+        return [
+            self.states[line] if line < line_count and self.line_spans[line] is not None else None
+            for line in range(start + 1, stop + 1)
+        ]
+
+    def to_line(self, tokens):
+        """1行分のトークンを、((タグ名, 開始列, 終了列)のリスト, 名前のタプル)にする."""
+        spans = []
+        symbols = []
+        for col, token, content in tokens:
+            if self.symbol_func is not None:
+                symbol = self.symbol_func(token, content)
+                if symbol is not None:
+                    symbols.append(symbol)
+            content = content.rstrip('\n')
+            tag = self.tag_func(token)
+            if not content or tag is None:
+                continue  # 空白や、色を付けないトークンにはタグを付けない
+            end = col + len(content)
+            if spans and spans[-1][0] == tag and spans[-1][2] == col:
+                # 隣り合う同じタグの範囲はまとめる
+                spans[-1] = (tag, spans[-1][1], end)
+            else:
+                spans.append((tag, col, end))
+        return spans, tuple(symbols)
+
+    def get_view_lines(self):
+        """見えている範囲の、最初の行と最後の行+1を返す."""
+        first = int(self.text.index('@0,0').split('.')[0]) - 1
+        bottom = self.text.index('@0,{0}'.format(self.text.winfo_height()))
+        last = min(int(bottom.split('.')[0]), len(self.line_spans))
+        return first, last
+
+    def highlight(self):
+        """未解析の行を全て解析し、ハイライトする.
+
+        結果を待つので、Ctrl+Lのように全体をすぐにハイライトしたい場合に使ってください。
+
+        """
+        self.revision += 1  # ワーカースレッドで実行中の解析の結果は捨てる
+        line_count = len(self.line_spans)
+        if not self.incremental:
+            if self.dirty:
+                self._merge(0, ROOT_STATE, *lex_document(
+                    self.lexer, self.get_lines(0), self.to_line))
+        else:
+            pos = 0
+            for start in sorted(set(self.dirty)):
+                if start < pos or start >= len(self.line_spans):
+                    continue  # 既に解析し直した範囲
+                start, _, state = self._find_start(start)
+                result = lex_lines(
+                    self.lexer, self.get_lines(start), start, state,
+                    self.get_old_states(start, line_count), self.to_line,
+                )
+                self._merge(start, state, *result)
+                pos = start + len(result[0])
+        self.dirty = []
+        while self.unapplied:
+            self.apply(*self.unapplied.pop())
+
+    def schedule(self):
+        """未解析の行の解析を、ワーカースレッドに依頼する.
+
+        見えている範囲の行を優先して解析し、結果はアイドル時に少しずつタグ付けします。
+
+        """
+        if self.future is None:
+            self._submit()
+
+    def cancel(self):
+        """ワーカースレッドでの解析と、予約しているタグ付けを取り消す."""
+        self.revision += 1
+        if self.poll_job is not None:
+            self.text.after_cancel(self.poll_job)
+            self.poll_job = None
+        if self.apply_job is not None:
+            self.text.after_cancel(self.apply_job)
+            self.apply_job = None
+        self.future = None
+        self.job = None
+
+    def _find_start(self, start, top=0):
+        """解析を始める行と、その行の状態を返す.
+
+        状態が保存されている行まで遡ります。top行まで遡っても未解析の行しかなければ、
+        仮の状態から解析します。仮の結果は、前の行の解析が追いついた際に状態が違えば上書きされます。
+        解析済みでも、トークンの途中から始まる行ならば、top行より前でもそのトークンの始まりまで遡ります。
+
+        return:
+            (解析を始める行, 解析を打ち切る目安の行, 最初の行の状態)
+        """
+        while self.states[start] is None and start > 0:
+            if start <= top and self.line_spans[start] is None:
+                break
+            start -= 1
+        state = self.states[start] or ROOT_STATE
+        stop = min(start + JOB_LINES, len(self.line_spans))
+        return start, stop, state
+
+    def _next_job(self):
+        """次にワーカースレッドで解析する(最初の行, 解析を打ち切る目安の行, 最初の行の状態)を返す."""
+        if not self.dirty:
+            return None
+        if not self.incremental:
+            return 0, len(self.line_spans), ROOT_STATE
+
+        # 見えている範囲に未解析の行があれば、そこを優先する
+        first, last = self.get_view_lines()
+        for line in range(first, last):
+            if self.line_spans[line] is None:
+                start, stop, state = self._find_start(line, top=first)
+                return start, min(stop, last), state
+
+        return self._find_start(min(self.dirty))
+
+    def _submit(self):
+        """次の解析をワーカースレッドに依頼する."""
+        job = self._next_job()
+        if job is None:
+            return
+        start, stop, state = job
+        lines = self.get_lines(start)
+        if self.incremental:
+            self.future = get_executor().submit(
+                lex_lines, self.lexer, lines, start, state,
+                self.get_old_states(start, stop), self.to_line, stop - start,
+            )
+        else:
+            self.future = get_executor().submit(
+                lex_document, self.lexer, lines, self.to_line)
+        self.job = (self.revision, start, state)
+        if self.poll_job is None:
+            self.poll_job = self.text.after(POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        """ワーカースレッドの解析が終わっていれば、結果を受け取る."""
+        self.poll_job = None
+        if self.future is None:
+            return
+        if not self.future.done():
+            self.poll_job = self.text.after(POLL_INTERVAL, self._poll)
+            return
+
+        result = self.future.result()
+        revision, start, state = self.job
+        self.future = None
+        self.job = None
+
+        # 解析中にテキストが変更されていれば、結果は捨てる
+        if revision == self.revision:
+            self._merge(start, state, *result)
+            self._schedule_apply()
+        self._submit()
+
+    def _merge(self, start, state, results, end_states, converged, open_lines):
+        """解析の結果を保存する."""
+        line_count = len(self.line_spans)
+        end = start + len(results)
+        self.open_lines = {line for line in self.open_lines if not start <= line < end}
+        self.open_lines.update(open_lines)
+        self.states[start] = state
+        self.line_spans[start:end] = [spans for spans, _ in results]
+        line_symbols = [symbols for _, symbols in results]
+        self._update_symbols(self.line_symbols[start:end], line_symbols)
+        self.line_symbols[start:end] = line_symbols
+        count = min(end + 1, line_count) - (start + 1)
+        self.states[start+1:start+1+count] = end_states[:count]
+
+        # 解析した範囲の行は、解析し直す必要がなくなる
+        self.dirty = [line for line in self.dirty if not start <= line < end]
+        if not converged and end < line_count:
+            # 状態が変わったので、続きの行も解析し直す
+            self.line_spans[end] = None
+            self.dirty.append(end)
+        self.unapplied.append((start, end))
+
+    def _update_symbols(self, old_symbols, new_symbols):
+        """行の名前が変わったことを、symbol_listenerに知らせる.
+
+        args:
+            old_symbols: 変更前の、各行の名前のタプルのリスト
+            new_symbols: 変更後の、各行の名前のタプルのリスト
+
+        """
+        if self.symbol_listener is None:
+            return
+        removed = list(chain.from_iterable(old_symbols))
+        added = list(chain.from_iterable(new_symbols))
+        if removed or added:
+            self.symbol_listener(removed, added)
+
+    def _schedule_apply(self):
+        """タグ付けがまだの範囲があれば、アイドル時にタグ付けするよう予約する."""
+        if self.apply_job is None and self.unapplied:
+            self.apply_job = self.text.after_idle(self._apply_pending)
+
+    def _apply_pending(self):
+        """タグ付けがまだの範囲を、決められた行数までタグ付けする."""
+        self.apply_job = None
+        remaining = APPLY_LINES
+        while self.unapplied and remaining > 0:
+            start, end = self.unapplied.pop(0)
+            if end - start > remaining:
+                self.unapplied.insert(0, (start + remaining, end))
+                end = start + remaining
+            self.apply(start, end)
+            remaining -= end - start
+        self._schedule_apply()
+
+    def apply(self, start, end):
+        """start行からend行の手前までのハイライトをTextウィジェットに反映する.
+
+        前回タグ付けした範囲と比べて、外す範囲と付ける範囲だけをTkに送ります。
+        選択範囲(sel)等、ハイライト以外のタグには触れません。
+
+        """
+        batch = TagBatch(self.stats)
+        for line in range(start, end):
+            new_spans = self.line_spans[line]
+            if new_spans is None:
+                continue  # 未解析の行
+            old_spans = self.applied_spans[line]
+            if old_spans is None or isinstance(old_spans, frozenset):
+                # 編集された行は、どこにタグが付いているか分からないので外しておく
+                tags = self.applied_tags if old_spans is None else old_spans
+                for tag in tags:
+                    batch.remove(tag, line + 1, 0, 'end')
+                old_spans = ()
+
+            old_spans = set(old_spans)
+            new_spans_set = set(new_spans)
+            for tag, start_col, end_col in old_spans - new_spans_set:
+                batch.remove(tag, line + 1, start_col, end_col)
+            for tag, start_col, end_col in new_spans_set - old_spans:
+                batch.add(tag, line + 1, start_col, end_col)
+            self.applied_spans[line] = new_spans
+        self.applied_tags.update(batch.ranges)
+        batch.apply(self.text)
+
+    def count_ranges(self):
+        """Textウィジェットに付いている、タグごとの範囲の数を返す."""
+        return {
+            tag: len(self.text.tag_ranges(tag)) // 2
+            for tag in self.applied_tags
+        }
+
+    def clear(self):
+        """バックグラウンドの解析を取り消し、付けたハイライトを全て外す."""
+        self.cancel()
+        for tag in self.applied_tags:
+            self.text.tag_remove(tag, '1.0', 'end')
+        self.applied_tags = set()
+        self.applied_spans = [None] * len(self.line_spans)
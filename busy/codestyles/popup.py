@@ -0,0 +1,143 @@
+"""コード補完のポップアップを提供するモジュール.
+
+ポップアップのListboxはエディタごとに1つだけ作り、表示と非表示を切り替えて使い回します。
+表示中もフォーカスはエディタに残るので、そのまま入力を続けると候補が絞り込まれます。
+表示する行数はMAX_ROWSまでなので、候補がいくら多くても描画のコストは変わりません。
+
+"""
+import tkinter as tk
+
+MAX_ROWS = 10  # ポップアップに表示する候補の数の上限
+
+
+class CompletionPopup:
+    """コード補完の候補を表示するポップアップ.
+
+    表示中は、Textウィジェットのbindtagsの先頭に専用のタグを追加し、
+    上下キー、エンター、タブ、エスケープをポップアップの操作に使います。
+
+    """
+
+    def __init__(self, text, completer, get_word):
+        """初期化.
+
+        args:
+            text: 補完を行うTextウィジェット
+            completer: 候補を探すFuzzyCompleter
+            get_word: (入力中の単語, 開始位置, 終了位置)を返す関数
+
+        """
+        self.text = text
+        self.completer = completer
+        self.get_word = get_word
+        self.visible = False
+        self.listbox = tk.Listbox(
+            text, height=MAX_ROWS, exportselection=False,
+            takefocus=0, activestyle='none',
+        )
+        self.listbox.bind('<ButtonRelease-1>', self.select)
+
+        self.bindtag = 'CompletionPopup{0}'.format(id(self))
+        self.bindings = {
+            '<<Change>>': self.on_change,  # 入力の度に絞り込む
+            '<Up>': self.up,
+            '<Down>': self.down,
+            '<Return>': self.select,
+            '<Tab>': self.select,
+            '<Escape>': self.hide,
+            '<Left>': self.on_move,
+            '<Right>': self.on_move,
+            '<Button-1>': self.on_move,
+            '<FocusOut>': self.on_move,
+        }
+        for sequence, func in self.bindings.items():
+            text.bind_class(self.bindtag, sequence, func)
+
+    def show(self):
+        """カーソル位置の下に、入力中の単語の候補を表示する. 候補がなければ何もしない."""
+        self.completer.reset()
+        if not self.update():
+            return
+        dline = self.text.dlineinfo('insert')
+        if dline is None:
+            self.hide()
+            return
+        # (x,y,width,height,baseline)
+        x, y, _, height, _ = dline
+        self.listbox.place(x=x, y=y+height)
+        if not self.visible:
+            self.text.bindtags((self.bindtag,) + self.text.bindtags())
+            self.visible = True
+
+    def update(self):
+        """入力中の単語で候補を絞り込む. 候補がなくなれば隠してFalseを返す."""
+        word, _, _ = self.get_word()
+        names = self.completer.search(word, MAX_ROWS)
+        if not names:
+            self.hide()
+            return False
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *names)
+        self.listbox.configure(height=len(names))
+        self.listbox.selection_set(0)
+        self.listbox.activate(0)
+        return True
+
+    def hide(self, event=None):
+        """ポップアップを隠す."""
+        if self.visible:
+            self.listbox.place_forget()
+            self.text.bindtags(
+                [tag for tag in self.text.bindtags() if tag != self.bindtag])
+            self.visible = False
+        self.completer.reset()
+        return 'break'
+
+    def select(self, event=None):
+        """選んでいる候補で、入力中の単語を置き換える."""
+        select_index = self.listbox.curselection()
+        if select_index:
+            name = self.listbox.get(select_index)
+            _, start, end = self.get_word()
+            self.text.delete(start, end)
+            self.text.insert('insert', name)
+            self.completer.use(name)
+        self.hide()
+        self.text.focus()
+        return 'break'
+
+    def move(self, step):
+        """選んでいる候補を、step個ずらす."""
+        select_index = self.listbox.curselection()
+        current = select_index[0] if select_index else 0
+        index = max(0, min(current + step, self.listbox.size() - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.activate(index)
+        self.listbox.see(index)
+
+    def up(self, event=None):
+        """一つ上の候補を選ぶ."""
+        self.move(-1)
+        return 'break'
+
+    def down(self, event=None):
+        """一つ下の候補を選ぶ."""
+        self.move(1)
+        return 'break'
+
+    def on_change(self, event=None):
+        """テキストが変更された際に、候補を絞り込む."""
+        if self.visible:
+            self.update()
+
+    def on_move(self, event=None):
+        """カーソルが移動したり、フォーカスが外れた場合は隠す."""
+        self.hide()
+
+    def destroy(self):
+        """ポップアップを破棄する."""
+        self.hide()
+        for sequence in self.bindings:
+            self.text.unbind_class(self.bindtag, sequence)
+        self.listbox.destroy()
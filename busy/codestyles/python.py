@@ -1,18 +1,70 @@
 """Pythonコードのスタイル."""
-import tkinter as tk
+import os
+import re
+from collections import Counter
 
-from pygments import lex
-from pygments.lexers import PythonLexer
+from pygments.token import Name
 
 from busy import mediator
 from busy.codestyles import BaseCodeStyle
-from busy.utils import run_flake8
+from busy.codestyles.completion import FuzzyCompleter, PrefixIndex
+from busy.codestyles.popup import CompletionPopup
+from busy.codestyles.symbols import MemberCache
+from busy.lint import LintRunner, get_lint_cache
 
 
 # 組み込みの関数や例外の名前リスト
 import __main__
 builtins = __main__.__builtins__
 BUILTIN_KEYWORD = [x for x in dir(builtins) if not x.startswith('__')]
+BUILTIN_INDEX = PrefixIndex(BUILTIN_KEYWORD)
+
+# import名、関数名、クラス名は補完リストに使う
+SYMBOL_TOKENS = frozenset([Name.Namespace, Name.Class, Name.Function])
+
+# import文から、モジュールの別名を調べるための正規表現
+IMPORT_RE = re.compile(r'^[ \t]*import[ \t]+([\w. \t,]+)', re.M)
+FROM_IMPORT_RE = re.compile(
+    r'^[ \t]*from[ \t]+(\w[\w.]*)[ \t]+import[ \t]+(?:\(([^)]*)\)|([\w \t,]+))', re.M)
+WORD_RE = re.compile(r'[\w.]*$')  # カーソルの前の、os.path.jo のような部分
+# カーソルの前が from os.path import jo のような、from importの名前の部分か
+FROM_IMPORT_LINE_RE = re.compile(
+    r'^[ \t]*from[ \t]+(\.?\w[\w.]*)[ \t]+import[ \t]+\(?[ \t]*'
+    r'(?:\w+(?:[ \t]+as[ \t]+\w+)?[ \t]*,[ \t]*)*\w*$')
+
+MEMBER_CACHE = MemberCache()  # 全てのエディタで共有する、モジュールの属性名のキャッシュ
+MEMBER_POLL_INTERVAL = 20  # モジュールの解析が終わったかを確認する間隔(ミリ秒)
+
+# 入力が止まってから、チェックを始めるまでの時間(ミリ秒)。負の値ならば入力中はチェックしない
+LINT_DELAY = mediator.busy_settings.get('lint_delay', 500)
+
+
+def get_import_names(src):
+    """ソースコードのimport文から、{名前: モジュール名}の辞書を作る.
+
+    import numpy as np ならば {'np': 'numpy'}、
+    from os import path ならば {'path': 'os.path'} のようになります。
+
+    """
+    names = {}
+    for match in IMPORT_RE.finditer(src):
+        for part in match.group(1).split(','):
+            module, _, alias = part.strip().partition(' as ')
+            module = module.strip()
+            alias = alias.strip()
+            if alias:
+                names[alias] = module
+            elif module:
+                names[module] = module
+                names[module.split('.')[0]] = module.split('.')[0]
+    for match in FROM_IMPORT_RE.finditer(src):
+        package = match.group(1)
+        for part in (match.group(2) or match.group(3)).split(','):
+            name, _, alias = part.strip().partition(' as ')
+            name = name.strip()
+            if name:
+                names[alias.strip() or name] = '{0}.{1}'.format(package, name)
+    return names
 
 
 class PythonCodeStyle(BaseCodeStyle):
@@ -20,67 +72,74 @@ class PythonCodeStyle(BaseCodeStyle):
 
     one_indent = ' ' * 4  # 半角スペース4つ
     next_is_indent = ['(', '{', '[', ':']  # これらの後にエンターを押すと、次行はインデント一つたされる
+    lexer_name = 'python'  # ハイライトに使うPygmentsのレキサー
 
     def __init__(self, *args, **kwargs):
         """初期化."""
         super().__init__(*args, **kwargs)
-        self.var_name_list = set()
+        self.var_name_list = PrefixIndex()
+        self.var_name_counts = Counter()  # 名前: その名前が出てくる行の数
+        self.completer = FuzzyCompleter(self.get_indexes)
+        self.popup = None  # コード補完のポップアップ。最初の補完時に作る
+        self.lint_runner = LintRunner(self.text, self.on_lint)
+        self.lint_key = None  # チェック中の内容の、LintCacheのキー
+        self.lint_job = None  # 入力が止まった後のチェックの予約
         self.create_text_tag()
 
     def create_text_tag(self):
         """タグの定義."""
         # 黄色く表示する
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Keyword', foreground='#CC7A00'
         )  # def class if for else return pass with try except finally print
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Keyword.Namespace', foreground='#CC7A00')  # from import
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Decorator', foreground='#CC7A00')  # @deco
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Operator.Word', foreground='#CC7A00')  # and, in
 
         # 青く表示する
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Namespace', foreground='#003D99'
         )  # import a のa
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Class', foreground='#003D99')  # クラス名
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Exception', foreground='#003D99')  # エラー名
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Function', foreground='#003D99')  # 関数名
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Function.Magic', foreground='#003D99')  # __init__
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Builtin', foreground='#003D99'
         )  # len range input enumerate dir
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name.Builtin.Pseudo', foreground='#003D99')  # self cls
 
         # 緑表示する
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Literal.String.Doc', foreground='#248F24'  # """docstring"""
         )
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Literal.String.Double', foreground='#248F24')  # "文字"
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Literal.String.Single', foreground='#248F24')  # '文字'
 
         # 赤表示する
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Comment.Single', foreground='#dc143c')  # #コメント
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Literal.Number.Integer', foreground='#dc143c')  # 1 2 数字
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Literal.String.Escape', foreground='#dc143c')  # \t \n
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Operator', foreground='#dc143c')  # . + - / * == =
 
         # 黒く表示
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Punctuation', foreground='#000000')  # : [] () {} ,
-        self.text.tag_configure(
+        self.tag_configure(
             'Token.Name', foreground='#000000')  # 変数名など
 
     def tab(self):
@@ -98,105 +157,172 @@ class PythonCodeStyle(BaseCodeStyle):
                 return self.auto_complete()
 
     def lint(self):
-        """スタイルガイドのチェックを行う."""
-        if self.editor.path:
-            output = run_flake8(self.editor.path)
-            mediator.event.update_lint(text=output)
-
-    def _highlight(self, start_pos, text):
-        """テキストをハイライトする."""
-        self.text.mark_set('range_start', start_pos)
-        for token, content in lex(text, PythonLexer()):
-            self.text.mark_set(
-                'range_end', 'range_start+{0}c'.format(len(content))
-            )
-            self.text.tag_add(str(token), 'range_start', 'range_end')
-            self.text.mark_set('range_start', 'range_end')
-            # import名、関数名、クラス名は補完リストに使うので保存しておく
-            if str(token) in ('Token.Name.Namespace', 'Token.Name.Class', 'Token.Name.Function'):
-                self.var_name_list.add(content)
-
-    def line_highlight(self):
-        """現在行をハイライトする."""
-        # 現在行のテキストを取得
-        current_line_text = self.editor.get_line_text()
-
-        start = 'insert linestart'
-        end = 'insert lineend'
-
-        # その行のハイライトを一度解除する
-        for tag in self.text.tag_names():
-            self.text.tag_remove(tag, start, end)
-
-        # ハイライトする
-        self._highlight(start, current_line_text)
-
-    def all_highlight(self):
-        """全行をハイライトする."""
-        # 全てのテキストを取得
-        all_text = self.editor.get_src()
-
-        # 全てのハイライトを一度解除する
-        for tag in self.text.tag_names():
-            self.text.tag_remove(tag, '1.0', 'end')
-
-        # 全ての候補リストを初期化
-        self.var_name_list = set()
-
-        # ハイライトする
-        self._highlight('1.0', all_text)
+        """スタイルガイドのチェックを行う. 結果はチェックが終わり次第、お知らせ欄に表示する.
+
+        ファイルではなくエディタの内容をチェックするので、保存していなくても結果が分かります。
+        内容が前回のチェックから変わっていなければ、保存しておいた結果をすぐに表示します。
+
+        return:
+            保存しておいた結果出力。チェックを始めた場合はNone
+        """
+        if self.lint_job is not None:
+            self.text.after_cancel(self.lint_job)
+            self.lint_job = None
+        path = self.editor.path
+        src = self.editor.get_src()
+        cache = get_lint_cache()
+        key = cache.get_key(path or '', src)
+        output = cache.get(key)
+        if output is not None:
+            self.lint_runner.cancel()  # 古い内容のチェックの結果は、もう表示しない
+            self.show_lint(output)
+            return output
+        self.lint_key = key
+        self.lint_runner.submit_source(src, path)
+        return None
+
+    def on_edit(self, first, last, delta):
+        """テキストが変更された際に、入力が止まってからのチェックを予約し直す."""
+        super().on_edit(first, last, delta)
+        if LINT_DELAY < 0:
+            return
+        self.lint_runner.cancel()  # 古い内容のチェックは不要になった
+        if self.lint_job is not None:
+            self.text.after_cancel(self.lint_job)
+        self.lint_job = self.text.after(LINT_DELAY, self.lint)
+
+    def on_lint(self, output):
+        """チェックが終わった際に、結果を保存して表示する."""
+        # flake8自体のエラーは保存しない
+        if not output.startswith('Traceback'):
+            get_lint_cache().set(self.lint_key, output)
+        self.show_lint(output)
+
+    def show_lint(self, output):
+        """スタイルガイドのチェックの結果を表示する."""
+        mediator.event.update_lint(text=output)
+
+    def get_symbol(self, token, content):
+        """補完に使う名前ならば、その名前を返す."""
+        if token in SYMBOL_TOKENS:
+            return content
+        return None
+
+    def on_symbols(self, removed, added):
+        """行の変更で、なくなった名前と増えた名前を受け取る.
+
+        名前ごとに出てくる数を数えておき、どこにも出てこなくなった名前は補完リストから外します。
+
+        """
+        counts = self.var_name_counts
+        for name in added:
+            counts[name] += 1
+            if counts[name] == 1:
+                self.var_name_list.add(name)
+        for name in removed:
+            counts[name] -= 1
+            if counts[name] <= 0:
+                del counts[name]
+                self.var_name_list.discard(name)
 
     def auto_complete(self):
         """コード補完."""
-        auto_complete_list = tk.Listbox(self.text)
-
-        # エンターでそのキーワードを選択
-        auto_complete_list.bind('<Return>', self.selection)
-
-        # エスケープ、タブ、他の場所をクリックで補完リスト削除
-        auto_complete_list.bind('<Escape>', self.remove_list)
-        auto_complete_list.bind('<Tab>', self.remove_list)
-        auto_complete_list.bind('<FocusOut>', self.remove_list)
-
-        # (x,y,width,height,baseline)
-        x, y, _, height, _ = self.text.dlineinfo(
-            'insert')
-        # 現在のカーソル位置のすぐ下に補完リストを貼る
-        auto_complete_list.place(x=x, y=y+height)
-
-        # 補完リストの候補を作成
-        for word in self.get_keywords():
-            auto_complete_list.insert(tk.END, word)
-
-        # 補完リストをフォーカスし、0番目を選択している状態に
-        auto_complete_list.focus_set()
-        auto_complete_list.selection_set(0)
-        self.auto_complete_list = auto_complete_list  # self.でアクセスできるように
+        # ポップアップは一度だけ作り、使い回す
+        if self.popup is None:
+            self.popup = CompletionPopup(
+                self.text, self.completer, self.get_completion_word)
+        self.popup.show()
+
+        # モジュールの属性名がまだ解析中ならば、解析が終わってから表示する
+        module_name = self.get_member_module()
+        if module_name and self.get_members(module_name) is None:
+            self.text.after(
+                MEMBER_POLL_INTERVAL, self.wait_members, self.text.index('insert'))
         return 'break'
 
-    def selection(self, event=None):
-        """コード補完リストでの選択後の処理."""
-        # リストの選択位置を取得
-        select_index = self.auto_complete_list.curselection()
-        if select_index:
-            # リストの表示名を取得
-            value = self.auto_complete_list.get(select_index)
-
-            # 現在入力中の単語位置の取得
-            _, start, end = self.editor.get_current_insert_word()
-            self.text.delete(start, end)
-            self.text.insert('insert', value)
-            self.remove_list()
-
-    def remove_list(self, event=None):
-        """コード補完リストの削除処理."""
-        self.auto_complete_list.destroy()
-        self.text.focus()
-
-    def get_keywords(self):
-        """コード補完リストの候補キーワードを作成する."""
-        # 現在入力中の単語を取得
-        text, _, _ = self.editor.get_current_insert_word()
-        # 自作のクラス名や関数名+組み込みの関数、例外クラス
-        keywords = list(self.var_name_list) + BUILTIN_KEYWORD
-        return [x for x in keywords if x.startswith(text) or x.startswith(text.title())]
+    def wait_members(self, insert_index):
+        """モジュールの解析が終わるのを待って、補完のポップアップを表示する."""
+        # 待っている間にカーソルが動いた場合は、表示しない
+        if self.popup is None or self.text.index('insert') != insert_index:
+            return
+        if self.get_members(self.get_member_module()) is None:
+            self.text.after(MEMBER_POLL_INTERVAL, self.wait_members, insert_index)
+        else:
+            self.popup.show()
+
+    def get_completion_word(self):
+        """補完する単語と位置を返す. os.path.jo ならば、最後の . の後のjoの部分."""
+        word = WORD_RE.search(self.editor.get_line_text_before_cursor()).group()
+        prefix = word.rpartition('.')[2]
+        return prefix, 'insert-{0}c'.format(len(prefix)), 'insert'
+
+    def get_member_module(self):
+        """カーソルの前がモジュールの属性名を補完する場所ならば、そのモジュール名を返す.
+
+        os.path.jo や from os.path import jo ならば'os.path'を返します。
+        import numpy as np の np.ar のような別名は、元のモジュール名にします。
+        importしていない名前の属性ならば''を、属性名を補完する場所でなければNoneを返します。
+
+        """
+        text = self.editor.get_line_text_before_cursor()
+        match = FROM_IMPORT_LINE_RE.match(text)
+        if match:
+            # from .x import ならば、編集中のファイルのディレクトリにあるxを探す
+            return match.group(1).lstrip('.')
+
+        module_expr = WORD_RE.search(text).group().rpartition('.')[0]
+        if not module_expr:
+            return None
+        imports = get_import_names(self.editor.get_src())
+        head, _, rest = module_expr.partition('.')
+        if module_expr in imports:
+            return imports[module_expr]
+        elif head in imports:
+            return '{0}.{1}'.format(imports[head], rest)
+        return ''
+
+    def get_members(self, module_name):
+        """モジュールの属性名のPrefixIndexを返す.
+
+        モジュール名が空ならば空のPrefixIndexを、まだ解析中ならばNoneを返します。
+
+        """
+        if not module_name:
+            return PrefixIndex()
+
+        # 編集中のファイルのディレクトリと、ルートディレクトリからも探す
+        paths = []
+        if self.editor.path:
+            paths.append(os.path.dirname(os.path.abspath(self.editor.path)))
+        symbol_index = mediator.event.get_symbol_index()
+        if symbol_index is not None:
+            paths.append(symbol_index.root_path)
+        return MEMBER_CACHE.get(module_name, paths)
+
+    def get_indexes(self):
+        """コード補完の候補にする索引のリストを返す."""
+        module_name = self.get_member_module()
+        if module_name is not None:
+            # os. の後や from os import の後ならば、モジュールの属性名
+            members = self.get_members(module_name)
+            return [] if members is None else [members]
+        if not self.get_completion_word()[0]:
+            return []  # 何も入力していなければ、候補は出さない
+
+        # 自作のクラス名や関数名+組み込みの関数、例外クラス+プロジェクト内の名前
+        indexes = [self.var_name_list, BUILTIN_INDEX]
+        symbol_index = mediator.event.get_symbol_index()
+        if symbol_index is not None:
+            indexes.append(symbol_index.index)
+        return indexes
+
+    def close(self):
+        """スタイルを使い終わった際の後始末."""
+        if self.popup is not None:
+            self.popup.destroy()
+            self.popup = None
+        if self.lint_job is not None:
+            self.text.after_cancel(self.lint_job)
+            self.lint_job = None
+        self.lint_runner.cancel()
+        super().close()
@@ -0,0 +1,76 @@
+"""ファイル名とコードスタイル、Pygmentsのレキサーを対応付けるモジュール.
+
+register_code_styleでファイル名のパターンとコードスタイルのクラスを登録します。
+登録されていないファイルは、Pygmentsがファイル名から判断できるレキサーでハイライトします。
+
+レキサーのモジュールは、そのファイルが初めて開かれた際にimportされます。
+レキサーのインスタンスはキャッシュし、全てのエディタで使い回します。
+
+"""
+from fnmatch import fnmatch
+import functools
+import os
+
+from pygments.lexers import find_lexer_class_by_name, find_lexer_class_for_filename
+from pygments.lexers.special import TextLexer
+
+_code_styles = []  # [(ファイル名のパターン, コードスタイルのクラス), ...]
+_lexers = {}  # レキサーのクラス: インスタンス
+
+
+def register_code_style(code_style_cls, *patterns):
+    """ファイル名のパターンに、コードスタイルのクラスを対応付ける.
+
+    args:
+        code_style_cls: コードスタイルのクラス
+        patterns: '*.py'や'Makefile'のようなファイル名のパターン
+
+    """
+    for pattern in patterns:
+        _code_styles.append((pattern, code_style_cls))
+
+
+def find_code_style_class(path):
+    """パスに対応付けられたコードスタイルのクラスを返す。なければNone."""
+    name = os.path.basename(path)
+    for pattern, code_style_cls in reversed(_code_styles):
+        if fnmatch(name, pattern):
+            return code_style_cls
+    return None
+
+
+def get_lexer(lexer_cls):
+    """レキサーのインスタンスを返す. 一度作ったものはキャッシュしておく."""
+    try:
+        return _lexers[lexer_cls]
+    except KeyError:
+        lexer = _lexers[lexer_cls] = lexer_cls()
+        return lexer
+
+
+def get_lexer_by_alias(alias):
+    """'python'のようなエイリアス名から、レキサーのインスタンスを返す."""
+    return get_lexer(_find_lexer_class_by_alias(alias))
+
+
+def get_lexer_for_path(path):
+    """ファイル名からレキサーのインスタンスを返す. ハイライトできなければNone."""
+    lexer_cls = _find_lexer_class_for_filename(os.path.basename(path))
+    if lexer_cls is None:
+        return None
+    return get_lexer(lexer_cls)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_lexer_class_by_alias(alias):
+    """エイリアス名からレキサーのクラスを返す."""
+    return find_lexer_class_by_name(alias)
+
+
+@functools.lru_cache(maxsize=None)
+def _find_lexer_class_for_filename(name):
+    """ファイル名からレキサーのクラスを返す. プレーンテキストならNone."""
+    lexer_cls = find_lexer_class_for_filename(name)
+    if lexer_cls is None or lexer_cls is TextLexer:
+        return None
+    return lexer_cls
@@ -0,0 +1,517 @@
+"""プロジェクト全体のPythonのシンボルを索引にする機能を提供するモジュール.
+
+ルートディレクトリ以下の.pyファイルをastで解析し、
+クラス、関数、モジュールレベルの名前、importした名前を記録します。
+結果はパス、更新日時、サイズと一緒にディスクに保存し、
+次回起動時には変更のあったファイルだけを解析し直します。
+
+MemberCacheは、import したモジュールの属性名(os.path の path 等)を、
+モジュールのソースファイルをastで解析して調べます。モジュール自体はインポートしません。
+from posix import * のような*でのimportは、MAX_IMPORT_DEPTHの深さまで辿って属性名に加えます。
+os.path のような、パッケージではないモジュールがimportしたモジュールも、同じ深さまで辿ります。
+
+解析はバックグラウンドのスレッドで行うので、エディタの操作を止めることはありません。
+
+"""
+import ast
+import hashlib
+import json
+import os
+import sys
+import sysconfig
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from importlib.machinery import PathFinder
+from importlib.util import module_from_spec, spec_from_file_location
+
+from busy.utils import iter_python_files
+
+from .completion import PrefixIndex
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.busy_cache')
+CACHE_VERSION = 3
+MEMBER_CACHE_SIZE = 128  # メモリに保持しておくモジュールの数
+MAX_IMPORT_DEPTH = 3  # *でのimportや、importしたモジュールを辿る深さ
+STDLIB_DIR = sysconfig.get_paths()['platstdlib']
+
+
+def iter_module_body(nodes):
+    """モジュールレベルの文を返すイテレータ. if文やtry文の中の文も含めます."""
+    for node in nodes:
+        if isinstance(node, ast.If):
+            yield from iter_module_body(node.body)
+            yield from iter_module_body(node.orelse)
+        elif isinstance(node, ast.Try):
+            yield from iter_module_body(node.body)
+            for handler in node.handlers:
+                yield from iter_module_body(handler.body)
+            yield from iter_module_body(node.orelse)
+            yield from iter_module_body(node.finalbody)
+        else:
+            yield node
+
+
+def parse_symbols(source):
+    """Pythonのソースコードから、シンボルを取り出す.
+
+    args:
+        source: ソースコードの文字列
+
+    return:
+        [(名前, 種類), ...] 種類は'class'、'function'、'method'、'name'、'import'のいずれか
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    return get_symbols(tree)
+
+
+def get_symbols(tree):
+    """astのモジュールから、シンボルを取り出す. 戻り値はparse_symbolsと同じです."""
+    symbols = []
+    for node in iter_module_body(tree.body):
+        if isinstance(node, ast.ClassDef):
+            symbols.append((node.name, 'class'))
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    symbols.append((child.name, 'method'))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append((node.name, 'function'))
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                if alias.name != '*':
+                    name = alias.asname or alias.name.split('.')[0]
+                    symbols.append((name, 'import'))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name_node in ast.walk(target):
+                    if isinstance(name_node, ast.Name):
+                        symbols.append((name_node.id, 'name'))
+    return symbols
+
+
+def resolve_relative(module, level, package):
+    """from . import x のような相対importのモジュール名を、絶対的な名前にする.
+
+    args:
+        module: fromの後のモジュール名。from . import x ならばNone
+        level: 先頭の . の数
+        package: importを書いたモジュールのパッケージ名
+
+    return:
+        モジュール名。パッケージの外を指している場合はNone
+    """
+    if not level:
+        return module
+    parts = package.split('.') if package else []
+    if level > len(parts):
+        return None
+    parts = parts[:len(parts) - level + 1]
+    if module:
+        parts.append(module)
+    return '.'.join(parts)
+
+
+def get_imports(tree, package=''):
+    """astのモジュールから、モジュールレベルのimportを取り出す.
+
+    import posixpath as path ならば {'path': 'posixpath'}、
+    from . import x ならば {'x': 'パッケージ名.x'} のように記録します。
+    同じ名前を何度もimportしている場合は、最初のものを使います。
+
+    args:
+        tree: astのモジュール
+        package: そのモジュールのパッケージ名。相対importの解決に使う
+
+    return:
+        ({名前: モジュール名}, [*でimportしたモジュール名, ...])
+    """
+    imports = {}
+    star_imports = []
+    for node in iter_module_body(tree.body):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.asname:
+                    imports.setdefault(alias.asname, alias.name)
+                else:
+                    head = alias.name.split('.')[0]
+                    imports.setdefault(head, head)
+        elif isinstance(node, ast.ImportFrom):
+            module = resolve_relative(node.module, node.level, package)
+            if module is None:
+                continue
+            for alias in node.names:
+                if alias.name == '*':
+                    star_imports.append(module)
+                else:
+                    name = alias.asname or alias.name
+                    imports.setdefault(name, '{0}.{1}'.format(module, alias.name))
+    return imports, star_imports
+
+
+def find_module(name, paths=()):
+    """モジュールのファイルを探す. モジュールはインポートしません.
+
+    args:
+        name: モジュール名。os.path のようなドット区切りの名前も可
+        paths: sys.pathより優先して探すディレクトリのリスト
+
+    return:
+        (モジュールのファイルのパス, パッケージならそのディレクトリのリスト)
+        見つからなければ(None, None)
+    """
+    search_paths = list(paths) + sys.path
+    parts = name.split('.')
+    spec = None
+    for i in range(len(parts)):
+        spec = PathFinder.find_spec('.'.join(parts[:i+1]), search_paths)
+        if spec is None:
+            return None, None
+        search_paths = spec.submodule_search_locations
+        if search_paths is None and i < len(parts) - 1:
+            return None, None  # パッケージではないので、サブモジュールはない
+    origin = spec.origin
+    if origin is not None and not os.path.isfile(origin):
+        origin = None
+    locations = spec.submodule_search_locations
+    return origin, None if locations is None else list(locations)
+
+
+def iter_submodules(locations):
+    """パッケージのディレクトリにある、サブモジュールの名前を返すイテレータ."""
+    for location in locations:
+        try:
+            entries = list(os.scandir(location))
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            if entry.is_file() and name.endswith('.py') and name != '__init__.py':
+                yield name[:-3]
+            elif entry.is_dir() and name.isidentifier() and \
+                    os.path.exists(os.path.join(entry.path, '__init__.py')):
+                yield name
+
+
+def is_stdlib_extension(path):
+    """標準ライブラリのC拡張モジュール(math等)のファイルかを返す."""
+    path = os.path.abspath(path)
+    return path.startswith(STDLIB_DIR + os.sep) and 'site-packages' not in path
+
+
+def get_extension_members(name, path=None):
+    """ソースのない組み込みモジュールやC拡張モジュールの属性名を返す.
+
+    C拡張モジュールはpathのファイルを直接読み込み、sys.pathからは探しません。
+    カレントディレクトリ等にある同じ名前のファイルを、誤って実行しないためです。
+    ユーザーのコードではない、Pythonに付属するモジュールだけに使ってください。
+
+    args:
+        name: モジュール名
+        path: C拡張モジュールのファイルのパス。組み込みモジュールならばNone
+
+    """
+    module = sys.modules.get(name)
+    try:
+        if path is None:
+            # 組み込みモジュールは、sys.pathより先に見つかる
+            if module is None:
+                module = import_module(name)
+        elif getattr(module, '__file__', None) is None or \
+                os.path.abspath(module.__file__) != os.path.abspath(path):
+            spec = spec_from_file_location(name, path)
+            module = module_from_spec(spec)
+            spec.loader.exec_module(module)
+    except (ImportError, OSError):
+        return []
+    return [attr for attr in dir(module) if not attr.startswith('__')]
+
+
+def get_stat(path):
+    """ファイルの(更新日時, サイズ)を返す. なければNone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime, stat.st_size
+
+
+class MemberCache:
+    """モジュールの属性名を調べ、キャッシュするクラス.
+
+    メモリ上には最近使ったMEMBER_CACHE_SIZE個のモジュールを、
+    ディスクにはソースファイルのパス、更新日時、サイズと一緒に解析結果を保存します。
+
+    """
+
+    def __init__(self, cache_dir=os.path.join(CACHE_DIR, 'members'), size=MEMBER_CACHE_SIZE):
+        """初期化.
+
+        args:
+            cache_dir: 解析結果を保存するディレクトリ
+            size: メモリに保持しておくモジュールの数
+
+        """
+        self.cache_dir = cache_dir
+        self.size = size
+        self.cache = OrderedDict()  # (モジュール名, 探すパス): (パス, (更新日時, サイズ), PrefixIndex)
+        self.futures = {}  # (モジュール名, 探すパス): 解析中のFuture
+        self.executor = None
+
+    def get(self, name, paths=()):
+        """モジュールの属性名のPrefixIndexを返す.
+
+        まだ解析していなければバックグラウンドで解析を始め、Noneを返します。
+        少し待ってからもう一度呼んでください。
+
+        args:
+            name: モジュール名
+            paths: sys.pathより優先して探すディレクトリのリスト
+
+        """
+        key = (name, tuple(paths))
+        entry = self.cache.get(key)
+        if entry is not None:
+            path, stat, index = entry
+            if path is None or get_stat(path) == stat:
+                self.cache.move_to_end(key)
+                return index
+            del self.cache[key]  # ソースファイルが更新された
+
+        future = self.futures.get(key)
+        if future is None:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            self.futures[key] = self.executor.submit(self.load, name, paths)
+            return None
+        if not future.done():
+            return None
+
+        del self.futures[key]
+        path, stat, names = future.result()
+        index = PrefixIndex(names)
+        self.cache[key] = (path, stat, index)
+        if len(self.cache) > self.size:
+            self.cache.popitem(last=False)
+        return index
+
+    def get_cache_path(self, path):
+        """ソースファイルの解析結果を保存するパスを返す."""
+        key = hashlib.md5(path.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key + '.json')
+
+    def load(self, name, paths, depth=0):
+        """モジュールの属性名を調べる. バックグラウンドのスレッドで実行されます.
+
+        *でimportしたモジュールの属性名も加えます。
+        os.path のように、パッケージではないモジュールの属性になっているモジュールは、
+        親のモジュールのimportから、実際のモジュール(posixpath等)を探します。
+
+        args:
+            name: モジュール名
+            paths: sys.pathより優先して探すディレクトリのリスト
+            depth: *でのimportや、importしたモジュールを辿った深さ
+
+        return:
+            (ソースファイルのパス, (更新日時, サイズ), 属性名のリスト)
+        """
+        path, stat, names, _, star_imports = self.read_module(name, paths)
+        if depth >= MAX_IMPORT_DEPTH:
+            return path, stat, names
+
+        if path is None and not names and '.' in name:
+            parent, _, attr = name.rpartition('.')
+            parent_imports = self.read_module(parent, paths)[3]
+            if attr in parent_imports and parent_imports[attr] != name:
+                return self.load(parent_imports[attr], paths, depth + 1)
+
+        for module in star_imports:
+            if module != name:
+                star_names = self.load(module, paths, depth + 1)[2]
+                names = names + [attr for attr in star_names if not attr.startswith('_')]
+        return path, stat, names
+
+    def read_module(self, name, paths):
+        """モジュール1つを解析する. importは辿りません.
+
+        return:
+            (ソースファイルのパス, (更新日時, サイズ), 属性名のリスト,
+             {importした名前: モジュール名}, [*でimportしたモジュール名, ...])
+        """
+        if name in sys.builtin_module_names:
+            return None, None, get_extension_members(name), {}, []
+
+        try:
+            path, locations = find_module(name, paths)
+        except (ImportError, ValueError):
+            path, locations = None, None
+        if path is not None and not path.endswith('.py'):
+            # 標準ライブラリのC拡張モジュールだけは、インポートして調べる
+            if is_stdlib_extension(path):
+                return path, get_stat(path), get_extension_members(name, path), {}, []
+            path = None
+        names = list(iter_submodules(locations)) if locations else []
+        stat = None if path is None else get_stat(path)
+        if stat is None:
+            return None, None, names, {}, []
+
+        cache_path = self.get_cache_path(path)
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == CACHE_VERSION and data['path'] == path and \
+                    tuple(data['stat']) == stat and data['module'] == name:
+                return path, stat, names + data['names'], data['imports'], data['star_imports']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # 相対importは、パッケージならば自身から、モジュールならば親のパッケージから辿る
+        package = name if locations is not None else name.rpartition('.')[0]
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                tree = ast.parse(file.read())
+        except (OSError, UnicodeDecodeError, SyntaxError, ValueError):
+            tree = ast.Module(body=[], type_ignores=[])
+        members = [
+            name for name, kind in get_symbols(tree)
+            if kind != 'method' and not name.startswith('__')
+        ]
+        imports, star_imports = get_imports(tree, package)
+        data = {
+            'version': CACHE_VERSION, 'path': path, 'stat': stat, 'module': name,
+            'names': members, 'imports': imports, 'star_imports': star_imports,
+        }
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                json.dump(data, file)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+        return path, stat, names + members, imports, star_imports
+
+
+class SymbolIndex:
+    """ルートディレクトリ以下のPythonのシンボルの索引."""
+
+    def __init__(self, root_path, cache_dir=CACHE_DIR):
+        """初期化.
+
+        args:
+            root_path: 索引を作るルートディレクトリ
+            cache_dir: 索引を保存するディレクトリ
+
+        """
+        self.root_path = os.path.abspath(root_path)
+        key = hashlib.md5(self.root_path.encode('utf-8')).hexdigest()
+        self.cache_path = os.path.join(cache_dir, key + '.json')
+        self.files = {}  # パス: {'mtime': 更新日時, 'size': サイズ, 'symbols': [[名前, 種類], ...]}
+        self.index = PrefixIndex()  # 全てのファイルのシンボル名
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """バックグラウンドで索引の作成を始める."""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._build, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """索引の作成を中断する."""
+        self.stopped.set()
+
+    def refresh(self):
+        """変更のあったファイルを解析し直す."""
+        self.start()
+
+    def search(self, prefix, limit=None):
+        """prefixで始まるシンボル名を返す."""
+        return self.index.search(prefix, limit)
+
+    def load(self):
+        """ディスクに保存した索引を読み込む."""
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CACHE_VERSION and data.get('root') == self.root_path:
+            with self.lock:
+                self.files = data['files']
+            self._update_index()
+
+    def save(self):
+        """索引をディスクに保存する. 書き込み途中のファイルが残らないよう、一時ファイルから置き換える."""
+        with self.lock:
+            data = {'version': CACHE_VERSION, 'root': self.root_path, 'files': dict(self.files)}
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, self.cache_path)
+
+    def update_file(self, path):
+        """1つのファイルを解析し直す. 変更がなければ何もせずFalseを返す."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            with self.lock:
+                return self.files.pop(path, None) is not None
+
+        entry = self.files.get(path)
+        if entry and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return False
+
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                symbols = parse_symbols(file.read())
+        except (OSError, UnicodeDecodeError):
+            symbols = []
+        with self.lock:
+            self.files[path] = {
+                'mtime': stat.st_mtime, 'size': stat.st_size,
+                'symbols': [list(symbol) for symbol in symbols],
+            }
+        return True
+
+    def _update_index(self):
+        """全てのファイルのシンボルから、検索用の索引を作り直す."""
+        with self.lock:
+            names = {
+                name for entry in self.files.values()
+                for name, _ in entry['symbols']
+            }
+        self.index = PrefixIndex(names)
+
+    def _build(self):
+        """索引を作成する. バックグラウンドのスレッドで実行されます."""
+        if not self.files:
+            self.load()
+
+        changed = False
+        found = set()
+        for path in iter_python_files(self.root_path):
+            if self.stopped.is_set():
+                return
+            found.add(path)
+            changed |= self.update_file(path)
+
+        # 消えたファイルは索引から外す
+        with self.lock:
+            removed = [path for path in self.files if path not in found]
+            for path in removed:
+                del self.files[path]
+        if changed or removed:
+            self._update_index()
+            try:
+                self.save()
+            except OSError:
+                pass
@@ -0,0 +1,339 @@
+"""ルートディレクトリ以下のファイルを、パスのあいまい検索で探す機能を提供するモジュール.
+
+FileIndexはバックグラウンドのスレッドでディレクトリを辿り、無視するパス以外のファイルを
+ディレクトリごとのリストで持ちます。変更されたディレクトリだけを読み直せるので、
+ツリーの更新に合わせて索引を最新に保てます。
+
+FileSearchは1つの入力に対する検索で、決まった時間ごとに区切って進めます。
+そのため、ファイルがいくら多くても最初の結果はすぐに表示でき、残りはアイドル時に検索します。
+入力が続けば、前回の検索で一致したファイルだけを絞り込みます。
+
+    index = FileIndex('/path/to/root')
+    index.start()
+    search = FileSearch('mdpy', index.snapshot())
+    while not search.run(0.02):
+        pass
+    search.results()  # ['busy/mediator.py', ...]
+
+"""
+import heapq
+import os
+import re
+import threading
+import time
+from itertools import chain
+
+from busy.ignore import DEFAULT_IGNORE, IgnoreMatcher
+
+SEARCH_LIMIT = 50  # 検索結果に表示するファイルの数の上限
+CHECK_EVERY = 256  # 何個のファイルを調べるごとに、検索の時間を確認するか
+
+# パスのあいまい検索の点数
+NAME_BONUS = 100  # ファイル名だけで一致。パスの途中で一致するものより必ず上位にする
+FIRST_BONUS = 8  # ファイル名・ディレクトリ名の先頭で一致
+BOUNDARY_BONUS = 6  # 単語の区切りで一致
+CONSECUTIVE_BONUS = 4  # 前の文字に続けて一致
+GAP_PENALTY_MAX = 3  # 飛ばした文字による減点の上限
+
+BOUNDARY_CHARS = '/_-. '  # 直後が単語の区切りになる文字
+
+
+def is_boundary(path, i):
+    """パスのi番目の文字が、単語の区切りならばTrue."""
+    if i == 0:
+        return True
+    before = path[i-1]
+    return before in BOUNDARY_CHARS or (path[i].isupper() and before.islower())
+
+
+def _path_score(query, path, lower, start, jump):
+    """path_scoreの本体. lowerのstart番目以降で、queryの文字を順に探す.
+
+    jumpがTrueなら、続けて一致しない文字は単語の区切りでの一致を優先します。
+
+    """
+    score = 0
+    pos = start
+    prev = -1
+    for char in query:
+        i = lower.find(char, pos)
+        if i < 0:
+            return None
+        if jump and i != prev + 1:
+            j = i
+            while j >= 0 and not is_boundary(path, j):
+                j = lower.find(char, j + 1)
+            if j >= 0:
+                i = j
+        if i == start or path[i-1] == '/':
+            score += FIRST_BONUS
+        elif is_boundary(path, i):
+            score += BOUNDARY_BONUS
+        if i == prev + 1:
+            score += CONSECUTIVE_BONUS
+        else:
+            score -= min(i - pos, GAP_PENALTY_MAX)
+        prev = i
+        pos = i + 1
+    return score
+
+
+def path_score(query, path, lower):
+    """queryの文字が順番通りにパスに含まれていれば点数を、なければNoneを返す.
+
+    ファイル名だけで一致するものを、ディレクトリ名にまたがって一致するものより上位にします。
+
+    args:
+        query: 小文字にした入力
+        path: ルートからの/区切りのパス
+        lower: pathを小文字にしたもの
+
+    return:
+        点数。大きいほど上位になる
+    """
+    name_start = lower.rfind('/') + 1
+    for start, bonus in ((name_start, NAME_BONUS), (0, 0)):
+        score = _path_score(query, path, lower, start, True)
+        if score is None:
+            # 区切りを優先したせいで一致しなくなった場合
+            score = _path_score(query, path, lower, start, False)
+        if score is not None:
+            return score + bonus
+    return None
+
+
+class FileSearch:
+    """1つの入力に対する、途中で区切って進められるファイルの検索."""
+
+    def __init__(self, query, candidates, limit=SEARCH_LIMIT):
+        """初期化.
+
+        args:
+            query: 入力
+            candidates: 検索する[(パス, 小文字のパス), ...]のリストのイテラブル
+            limit: 結果の数の上限
+
+        """
+        self.query = query
+        self.lower = query.lower()
+        # 点数を計算する前に、文字が順番通りに含まれるかを正規表現で素早く調べる
+        self.regex = re.compile('.*?'.join(re.escape(char) for char in self.lower))
+        self.candidates = chain.from_iterable(candidates)
+        self.limit = limit
+        self.matches = []  # 一致した(パス, 小文字のパス)
+        self.best = []  # 点数の高いlimit個の(点数, -パスの長さ, パス)のヒープ
+        self.done = False
+
+    def run(self, timeout):
+        """timeout秒まで検索を進める. 全て調べ終えたらTrueを返す."""
+        deadline = time.perf_counter() + timeout
+        query = self.lower
+        search = self.regex.search
+        matches = self.matches
+        best = self.best
+        limit = self.limit
+        count = 0
+        for item in self.candidates:
+            path, lower = item
+            if search(lower):
+                matches.append(item)
+                score = path_score(query, path, lower)
+                entry = (score, -len(path), path)
+                if len(best) < limit:
+                    heapq.heappush(best, entry)
+                elif entry > best[0]:
+                    heapq.heapreplace(best, entry)
+            count += 1
+            if count % CHECK_EVERY == 0 and time.perf_counter() > deadline:
+                return False
+        self.done = True
+        return True
+
+    def results(self):
+        """今までに見つかったファイルのパスを、点数の高い順に返す."""
+        return [path for _, _, path in sorted(self.best, reverse=True)]
+
+    def narrow(self, query):
+        """入力が続いた場合に、今までに一致したものと、まだ調べていないものだけを検索するFileSearchを返す."""
+        return FileSearch(query, [self.matches, self.candidates], self.limit)
+
+
+class FileIndex:
+    """ルートディレクトリ以下の、無視するパス以外のファイルの索引."""
+
+    def __init__(self, root_path, patterns=DEFAULT_IGNORE):
+        """初期化.
+
+        args:
+            root_path: 索引を作るルートディレクトリ
+            patterns: .gitignoreに加えて使う、無視するパターンのリスト
+
+        """
+        self.root_path = os.path.abspath(root_path)
+        self.patterns = patterns
+        self.dirs = {}  # ルートからの/区切りのディレクトリのパス: [(パス, 小文字のパス), ...]
+        self.version = 0  # 索引が変わる度に増える
+        self.pending = set()  # 読み直すディレクトリの絶対パス
+        self.rebuild = False  # 全て読み直すならTrue
+        self.thread = None
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def building(self):
+        """索引を作成中ならばTrue."""
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self):
+        """バックグラウンドで索引の作成を始める."""
+        with self.lock:
+            self.rebuild = True
+        self._start_thread()
+
+    def stop(self):
+        """索引の作成を中断する."""
+        self.stopped.set()
+
+    def refresh(self):
+        """全てのディレクトリを読み直す. 読み終えるまでは、今の索引で検索できます."""
+        self.start()
+
+    def update_dir(self, path):
+        """ディレクトリを読み直す. 中身が変わったディレクトリを、ツリーから知らせてもらいます."""
+        with self.lock:
+            self.pending.add(path)
+        self._start_thread()
+
+    def snapshot(self):
+        """今の索引の、ディレクトリごとの[(パス, 小文字のパス), ...]のリストを返す.
+
+        各ディレクトリのリストは書き換えずに置き換えるので、返したものは索引の作成中も変わりません。
+
+        """
+        with self.lock:
+            return list(self.dirs.values())
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(files) for files in self.dirs.values())
+
+    def _start_thread(self):
+        if self.building:
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        """依頼された読み直しを、なくなるまで行う. バックグラウンドのスレッドで実行されます."""
+        while not self.stopped.is_set():
+            with self.lock:
+                rebuild = self.rebuild
+                pending = self.pending
+                self.rebuild = False
+                self.pending = set()
+            if rebuild:
+                # 全て読み直す場合は、それまでに依頼されたディレクトリも読み直される
+                self._build()
+            elif pending:
+                matcher = IgnoreMatcher(self.root_path, self.patterns)
+                for path in pending:
+                    self._update(matcher, path)
+            else:
+                return
+            # スレッドの終了前に依頼されたものを、取りこぼさないようにする
+            with self.lock:
+                if not self.rebuild and not self.pending:
+                    self.thread = None
+                    return
+
+    def _scan(self, matcher, rel_dir):
+        """1つのディレクトリを読む.
+
+        return:
+            ([(パス, 小文字のパス), ...], [サブディレクトリのパス, ...])
+        """
+        files = []
+        sub_dirs = []
+        try:
+            entries = list(os.scandir(os.path.join(self.root_path, rel_dir)))
+        except OSError:
+            return files, sub_dirs
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                # シンボリックリンクのディレクトリは、循環しないよう辿らない
+                if is_dir and entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            if matcher.is_ignored_name(rel_dir, entry.name, is_dir):
+                continue
+            path = rel_dir + '/' + entry.name if rel_dir else entry.name
+            if is_dir:
+                sub_dirs.append(path)
+            else:
+                files.append((path, path.lower()))
+        files.sort()
+        return files, sub_dirs
+
+    def _walk(self, matcher, rel_dir, dirs):
+        """ディレクトリ以下を辿り、dirsにファイルのリストを入れる. 中断されたらFalseを返す."""
+        stack = [rel_dir]
+        while stack:
+            if self.stopped.is_set():
+                return False
+            rel_dir = stack.pop()
+            files, sub_dirs = self._scan(matcher, rel_dir)
+            with self.lock:
+                dirs[rel_dir] = files
+                self.version += 1
+            stack.extend(reversed(sub_dirs))
+        return True
+
+    def _build(self):
+        """全てのディレクトリを読み、索引を作り直す."""
+        matcher = IgnoreMatcher(self.root_path, self.patterns)
+        if not self.dirs:
+            # 初回は、読んだ分から検索できるようにする
+            self._walk(matcher, '', self.dirs)
+            return
+        dirs = {}
+        if self._walk(matcher, '', dirs):
+            with self.lock:
+                self.dirs = dirs
+                self.version += 1
+
+    def _remove(self, rel_dir):
+        """ディレクトリとその中のディレクトリを、索引から取り除く."""
+        prefix = rel_dir + '/'
+        with self.lock:
+            for key in [key for key in self.dirs if key == rel_dir or key.startswith(prefix)]:
+                del self.dirs[key]
+            self.version += 1
+
+    def _update(self, matcher, path):
+        """1つのディレクトリを読み直す. 増えたサブディレクトリは辿り、消えたものは取り除く."""
+        rel_dir = matcher.to_rel_dir(path)
+        if rel_dir.startswith('..'):
+            return
+        if rel_dir not in self.dirs:
+            # まだ辿っていない(無視するディレクトリの中等)
+            return
+        if not os.path.isdir(path):
+            self._remove(rel_dir)
+            return
+
+        files, sub_dirs = self._scan(matcher, rel_dir)
+        with self.lock:
+            self.dirs[rel_dir] = files
+            self.version += 1
+        prefix = rel_dir + '/' if rel_dir else ''
+        sub_dir_set = set(sub_dirs)
+        for key in list(self.dirs):
+            if key.startswith(prefix) and key != rel_dir and '/' not in key[len(prefix):] \
+                    and key not in sub_dir_set:
+                self._remove(key)
+        for sub_dir in sub_dirs:
+            if sub_dir not in self.dirs:
+                self._walk(matcher, sub_dir, self.dirs)
@@ -0,0 +1,629 @@
+"""ディレクトリ以下の全てのファイルから、テキストを検索する機能を提供するモジュール.
+
+ファイルの一覧作りはスレッドで行い、見つけたそばからプロセスプールに渡して分担して検索します。
+ファイルは文字列にせずバイト列のまま検索するので、デコードのコストはかかりません。
+小さなファイルは一度にまとめて読み、大きなファイルはmmapで読むので、
+ファイルの大きさに関わらずメモリの使用量は増えません。
+先頭にNULバイトがあるファイルはバイナリとみなし、検索しません。
+
+結果はファイルごとに、検索が終わった順にコールバックへ渡されます。
+
+    searcher = ProjectSearcher(widget, on_result, on_progress)
+    searcher.start('/path/to/root', 'def main')
+
+ProjectReplacerは、検索したファイルをプロセスプールで分担して置換します。
+置換したファイルは同じディレクトリの一時ファイルに書いてからos.replaceで置き換えるので、
+中断したりエラーになっても、書きかけのファイルが残ることはありません。
+
+"""
+import mmap
+import multiprocessing
+import os
+import queue
+import re
+import stat
+import tempfile
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from busy import mediator
+from busy.ignore import DEFAULT_IGNORE, iter_files
+
+POLL_INTERVAL = 50  # 結果を確認する間隔(ミリ秒)
+SEARCH_CHUNK_SIZE = 32  # 1つのプロセスにまとめて渡すファイルの数
+REPLACE_CHUNK_SIZE = 8  # 置換で、1つのプロセスにまとめて渡すファイルの数
+MMAP_THRESHOLD = 1024 * 1024  # これより大きいファイルは、mmapで読む
+SNIFF_SIZE = 8192  # バイナリか判定するために調べる、先頭のバイト数
+MAX_FILE_MATCHES = 1000  # 1つのファイルで返す、一致した行の数の上限
+MAX_MATCHES = 20000  # 一致した行がこれを超えたら、検索をやめる(置換のプレビューでは、やめない)
+MAX_LINE_LENGTH = 300  # 結果に含める行の文字数の上限
+
+_search_executor = None
+_replace_executor = None
+
+
+def compile_query(query, use_regex=False, match_case=False):
+    """検索する文字列を、バイト列の正規表現にする. 正規表現が正しくなければre.errorを送出する.
+
+    大文字小文字を区別しない場合、区別しないのはASCIIの文字だけです。
+
+    return:
+        (正規表現のバイト列, フラグ, 正規表現でなければ、先に探すバイト列)
+    """
+    pattern = query.encode('utf-8')
+    literal = None
+    if not use_regex:
+        literal = pattern if match_case else pattern.lower()
+        pattern = re.escape(pattern)
+    flags = re.MULTILINE
+    if not match_case:
+        flags |= re.IGNORECASE
+    re.compile(pattern, flags)
+    return pattern, flags, literal
+
+
+def compile_replacement(compiled, replacement, use_regex=False):
+    """置換後の文字列を、re.subに渡すバイト列のテンプレートにする.
+
+    正規表現で置換する場合は、\\1等でグループを参照できます。
+    テンプレートが正しくなければre.errorを送出します。
+
+    args:
+        compiled: compile_queryの結果
+        replacement: 置換後の文字列
+        use_regex: 正規表現で置換するならTrue
+
+    """
+    if not use_regex:
+        replacement = replacement.replace('\\', '\\\\')
+    template = replacement.encode('utf-8')
+    pattern, flags, _ = compiled
+    re.compile(pattern, flags).sub(template, b'')  # テンプレートを解析させ、誤りを見つける
+    return template
+
+
+def compile_text_replace(query, replacement, use_regex=False, match_case=False):
+    """エディタのテキストを、ファイルと同じように置換するための正規表現とテンプレートを返す.
+
+    return:
+        (文字列の正規表現, 文字列のテンプレート)
+    """
+    pattern = query if use_regex else re.escape(query)
+    if not use_regex:
+        replacement = replacement.replace('\\', '\\\\')
+    flags = re.MULTILINE
+    if not match_case:
+        # バイト列の検索と合わせ、大文字小文字はASCIIの文字だけ区別しない
+        flags |= re.IGNORECASE | re.ASCII
+    return re.compile(pattern, flags), replacement
+
+
+def is_binary(data):
+    """ファイルの先頭のバイト列から、バイナリのファイルならばTrueを返す."""
+    return b'\0' in data[:SNIFF_SIZE]
+
+
+def decode_line(line):
+    """結果に含める行を、文字列にする."""
+    return line.decode('utf-8', 'replace').rstrip('\r')[:MAX_LINE_LENGTH]
+
+
+def decode_replaced_line(line):
+    """置換のプレビューに含める行を、文字列にする. 置換で改行が入った場合は、\\nで表示する."""
+    line = line[:MAX_LINE_LENGTH * 4].replace(b'\r\n', b'\n').replace(b'\n', b'\\n')
+    return decode_line(line)
+
+
+def find_line_end(data, pos):
+    """posを含む行の、終わりの改行の位置を返す. 最後の行ならばデータの長さ."""
+    line_end = data.find(b'\n', pos)
+    return len(data) if line_end < 0 else line_end
+
+
+def search_data(data, regex, template=None):
+    """バイト列(又はmmap)から、正規表現に一致する行を探す.
+
+    templateを渡した場合、置換した後の行はreplace_fileと同じくデータ全体の一致から作ります。
+    そのため、改行をまたいで一致した場合は、またいだ先の行までを1つの置換した後の行にします。
+
+    args:
+        data: バイト列かmmap
+        regex: バイト列の正規表現
+        template: compile_replacementの結果。渡せば、置換した後の行も返す
+
+    return:
+        [(行番号, 行の文字列, 置換した後の行の文字列かNone), ...] 同じ行で複数一致しても、1つだけ
+    """
+    matches = []
+    line_no = 1
+    counted = 0  # 行番号を数え終えた位置
+    line_end = -1  # 最後に結果にした行の、終わりの改行の位置
+    replaced = []  # 最後に結果にした行の、置換した後の部分のリスト
+    replaced_pos = 0  # 置換した後の行に、加え終えた位置
+    for match in regex.finditer(data):
+        start = match.start()
+        if start > line_end:
+            if template is not None and matches:
+                replaced.append(data[replaced_pos:line_end])
+                matches[-1][2] = decode_replaced_line(b''.join(replaced))
+            if len(matches) >= MAX_FILE_MATCHES:
+                break
+            line_start = data.rfind(b'\n', 0, start) + 1
+            # 前に一致した位置から、この行までの改行の数を数える
+            line_no += data[counted:line_start].count(b'\n')
+            counted = line_start
+            line_end = find_line_end(data, start)
+            line = bytes(data[line_start:min(line_end, line_start + MAX_LINE_LENGTH * 4)])
+            matches.append([line_no, decode_line(line), None])
+            replaced = []
+            replaced_pos = line_start
+        elif template is None:
+            continue  # 結果にした行の中での、2つ目以降の一致
+        if template is not None:
+            replaced += [data[replaced_pos:start], match.expand(template)]
+            replaced_pos = match.end()
+            if replaced_pos > line_end:
+                line_end = find_line_end(data, replaced_pos)
+    if template is not None and matches and matches[-1][2] is None:
+        replaced.append(data[replaced_pos:line_end])
+        matches[-1][2] = decode_replaced_line(b''.join(replaced))
+    return [tuple(match) for match in matches]
+
+
+def search_file(path, regex, literal=None, template=None):
+    """ファイルから、正規表現に一致する行を探す. バイナリか読めないファイルならば空のリストを返す.
+
+    literalを渡した場合は、まずbytes.findで探し、含まれるファイルだけを正規表現で調べます。
+    大文字小文字を区別しない正規表現は遅いので、ほとんどのファイルではこちらで済ませます。
+
+    """
+    try:
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size == 0:
+                return []
+            if size <= MMAP_THRESHOLD:
+                data = file.read()
+                if is_binary(data):
+                    return []
+                if literal is not None:
+                    haystack = data.lower() if regex.flags & re.IGNORECASE else data
+                    if haystack.find(literal) < 0:
+                        return []
+                return search_data(data, regex, template)
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if is_binary(data[:SNIFF_SIZE]):
+                    return []
+                return search_data(data, regex, template)
+    except (OSError, ValueError):
+        return []
+
+
+def search_files(paths, pattern, flags, literal=None, template=None):
+    """複数のファイルを検索する. プロセスプールのプロセスで実行されます.
+
+    args:
+        paths: ファイルのパスのリスト
+        pattern, flags, literal: compile_queryの結果
+        template: compile_replacementの結果。渡せば、置換した後の行も返す
+
+    return:
+        [(パス, search_dataの結果), ...] 一致したファイルの分だけ
+    """
+    regex = re.compile(pattern, flags)
+    results = []
+    for path in paths:
+        matches = search_file(path, regex, literal, template)
+        if matches:
+            results.append((path, matches))
+    return results
+
+
+def write_atomic(path, data, mode):
+    """ファイルを書き換える. 一時ファイルに書いてから置き換えるので、書きかけの状態にはならない."""
+    dir_name, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix='.' + name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def replace_file(path, regex, template, literal=None, dry_run=False):
+    """ファイルの中の、正規表現に一致する部分を全て置換する.
+
+    args:
+        path: ファイルのパス
+        regex: バイト列の正規表現
+        template: compile_replacementの結果
+        literal: compile_queryの結果。渡せば、含まないファイルは正規表現で調べない
+        dry_run: Trueならば、置換する数を数えるだけでファイルは書き換えない
+
+    return:
+        置換した(dry_runならば、置換する)数。バイナリのファイルは0
+    """
+    # シンボリックリンクを、普通のファイルで置き換えないようにする
+    path = os.path.realpath(path)
+    with open(path, 'rb') as file:
+        mode = stat.S_IMODE(os.fstat(file.fileno()).st_mode)
+        data = file.read()
+    if is_binary(data):
+        return 0
+    if literal is not None:
+        haystack = data.lower() if regex.flags & re.IGNORECASE else data
+        if haystack.find(literal) < 0:
+            return 0
+    new_data, count = regex.subn(template, data)
+    if count and not dry_run and new_data != data:
+        write_atomic(path, new_data, mode)
+    return count
+
+
+def replace_files(paths, pattern, flags, literal, template, dry_run=False):
+    """複数のファイルを置換する. プロセスプールのプロセスで実行されます.
+
+    1つのファイルでエラーになっても、残りのファイルは置換します。
+
+    return:
+        [(パス, 置換した数, エラーのメッセージかNone), ...]
+    """
+    regex = re.compile(pattern, flags)
+    results = []
+    for path in paths:
+        try:
+            results.append((path, replace_file(path, regex, template, literal, dry_run), None))
+        except (OSError, ValueError) as e:
+            results.append((path, 0, str(e)))
+    return results
+
+
+def get_search_executor():
+    """検索に使うプロセスプールを返す. Tkのプロセスをforkしないよう、プロセスはspawnで作ります."""
+    global _search_executor
+    if _search_executor is None:
+        _search_executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _search_executor
+
+
+def reset_search_executor():
+    """壊れたプロセスプールを捨てる. 次の検索で作り直されます.
+
+    壊れたプロセスプールに渡していた検索は、全てBrokenProcessPoolで終わっています。
+    取り消すと結果が届かず、進み具合が終わらなくなるので、取り消しはしません。
+
+    """
+    global _search_executor
+    if _search_executor is not None:
+        _search_executor.shutdown(wait=False)
+        _search_executor = None
+
+
+def get_replace_executor():
+    """置換に使うプロセスプールを返す.
+
+    検索とは別のプロセスプールにするので、検索のプロセスプールが作り直されても、
+    置換中のファイルが取り消されることはありません。
+
+    """
+    global _replace_executor
+    if _replace_executor is None:
+        _replace_executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _replace_executor
+
+
+def reset_replace_executor():
+    """壊れた置換のプロセスプールを捨てる. 次の置換で作り直されます."""
+    global _replace_executor
+    if _replace_executor is not None:
+        _replace_executor.shutdown(wait=False)
+        _replace_executor = None
+
+
+class ProjectSearcher:
+    """ディレクトリ以下の全てのファイルを、並列に検索するクラス.
+
+    .gitignoreと設定の無視リストにあるファイルは検索しません。
+
+    """
+
+    def __init__(self, widget, on_result, on_progress):
+        """初期化.
+
+        args:
+            widget: afterでの定期実行に使うウィジェット
+            on_result: [(パス, [(行番号, 行の文字列, 置換した後の行かNone), ...]), ...]を受け取る関数
+            on_progress: (検索したファイル数, 全体のファイル数, 終わったか)を受け取る関数
+
+        全体のファイル数は、ファイルの一覧を作り終わるまではNoneです。
+        どちらの関数もTkのスレッドから呼ばれます。
+
+        """
+        self.widget = widget
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.results = queue.Queue()  # (番号, 結果のリスト, ファイル数) か (番号, None, 全体のファイル数)
+        self.generation = 0  # 検索を始める度に増える番号
+        self.futures = set()  # 実行中の検索
+        self.lock = threading.Lock()
+        self.searched = 0
+        self.total = None
+        self.match_count = 0  # 一致した行の数
+        self.truncated = False  # 一致した行が多すぎて、検索をやめたならTrue
+        self.error = None  # 検索中に起きたエラーのトレースバック
+        self.max_matches = MAX_MATCHES
+        self.poll_job = None
+
+    @property
+    def running(self):
+        """検索中ならばTrue."""
+        return self.poll_job is not None
+
+    def start(self, root_path, query, use_regex=False, match_case=False, replacement=None,
+              sources=None):
+        """root_path以下の検索を始める. 前の検索は取り消す.
+
+        replacementを渡すと、一致した行を置換した後の行も結果に含めます(置換のプレビュー)。
+        プレビューでは置換するファイルを全て見つけるため、一致した行が多くても検索をやめません。
+        sourcesに{パス: 文字列}を渡すと、そのファイルはファイルの内容ではなく文字列から探します。
+        エディタで開いているファイルを、保存していない内容で検索するのに使います。
+        正規表現が正しくなければ、検索を始めずにre.errorを送出します。
+
+        """
+        compiled = compile_query(query, use_regex, match_case)
+        if replacement is not None:
+            compiled += (compile_replacement(compiled, replacement, use_regex),)
+        self.cancel()
+        self.searched = 0
+        self.total = None
+        self.match_count = 0
+        self.truncated = False
+        self.error = None
+        self.max_matches = MAX_MATCHES if replacement is None else None
+        patterns = mediator.busy_settings.get('ignore', DEFAULT_IGNORE)
+        sources = {os.path.abspath(path): src for path, src in (sources or {}).items()}
+        thread = threading.Thread(
+            target=self._collect, args=(self.generation, root_path, patterns, compiled, sources),
+            daemon=True,
+        )
+        thread.start()
+        self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def cancel(self):
+        """検索を取り消す. 実行中のファイルの結果は受け取らない."""
+        self.generation += 1
+        with self.lock:
+            futures, self.futures = self.futures, set()
+        for future in futures:
+            future.cancel()
+        if self.poll_job is not None:
+            self.widget.after_cancel(self.poll_job)
+            self.poll_job = None
+
+    def _collect(self, generation, root_path, patterns, compiled, sources):
+        """ファイルの一覧を作り、プロセスプールに渡す. スレッドで実行されます."""
+        chunk = []
+        total = 0
+        for path in iter_files(root_path, patterns):
+            if generation != self.generation:
+                return
+            total += 1
+            src = sources.get(os.path.abspath(path)) if sources else None
+            if src is not None:
+                self._search_source(generation, path, src, compiled)
+                continue
+            chunk.append(path)
+            if len(chunk) >= SEARCH_CHUNK_SIZE:
+                self._submit(generation, chunk, compiled)
+                chunk = []
+        if chunk:
+            self._submit(generation, chunk, compiled)
+        self.results.put((generation, None, total))
+
+    def _search_source(self, generation, path, src, compiled):
+        """ファイルの代わりに渡された文字列を、ファイルと同じように検索する."""
+        pattern, flags, _, *template = compiled
+        matches = search_data(src.encode('utf-8'), re.compile(pattern, flags), *template)
+        self.results.put((generation, [(path, matches)] if matches else [], 1))
+
+    def _submit(self, generation, chunk, compiled):
+        """ファイルのまとまりを、プロセスプールに渡す."""
+        try:
+            future = get_search_executor().submit(search_files, chunk, *compiled)
+        except RuntimeError:
+            # プロセスプールが壊れているか、終了している
+            reset_search_executor()
+            future = get_search_executor().submit(search_files, chunk, *compiled)
+        with self.lock:
+            if generation != self.generation:
+                future.cancel()
+                return
+            self.futures.add(future)
+        future.add_done_callback(
+            lambda future: self._on_done(generation, future, len(chunk)))
+
+    def _on_done(self, generation, future, count):
+        """検索が終わったまとまりの結果を、キューに入れる."""
+        with self.lock:
+            self.futures.discard(future)
+        # 取り消されたまとまりも、検索したファイル数には数える
+        # (cancelで取り消した場合は、番号が変わっているので_pollで捨てられる)
+        results = []
+        if not future.cancelled():
+            try:
+                results = future.result()
+            except Exception as e:
+                # 検索できなかったまとまりは飛ばし、最後のエラーだけを覚えておく
+                if isinstance(e, BrokenProcessPool):
+                    reset_search_executor()
+                self.error = traceback.format_exc()
+        self.results.put((generation, results, count))
+
+    def _poll(self):
+        """キューに届いた結果と進み具合を、コールバックに渡す."""
+        self.poll_job = None
+        found = []
+        while True:
+            try:
+                generation, results, count = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            if results is None:
+                self.total = count
+            else:
+                self.searched += count
+                found.extend(results)
+
+        finished = self.total is not None and self.searched >= self.total
+        if found:
+            self.match_count += sum(len(matches) for _, matches in found)
+            if self.max_matches is not None and self.match_count >= self.max_matches:
+                self.truncated = True
+                finished = True
+                self.cancel()
+            self.on_result(found)
+        self.on_progress(self.searched, self.total, finished)
+        if not finished:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+
+class ProjectReplacer:
+    """複数のファイルを、並列に置換するクラス.
+
+    プロセスプールに渡すのは、CPUの数の倍のまとまりまでにしておき、終わった分だけ次を渡します。
+    そのため中断した場合も、置換中のまとまりが終わるのを待つだけで済み、
+    どのファイルを置換したかは全てコールバックに渡されます。
+
+    """
+
+    def __init__(self, widget, on_result, on_progress):
+        """初期化.
+
+        args:
+            widget: afterでの定期実行に使うウィジェット
+            on_result: [(パス, 置換した数, エラーのメッセージかNone), ...]を受け取る関数
+            on_progress: (置換したファイル数, 全体のファイル数, 終わったか)を受け取る関数
+
+        どちらの関数もTkのスレッドから呼ばれます。
+
+        """
+        self.widget = widget
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.results = queue.Queue()  # (結果のリスト, ファイル数)
+        self.chunks = deque()  # まだプロセスプールに渡していない、ファイルのまとまり
+        self.args = None  # replace_filesに渡す引数
+        self.in_flight = 0  # プロセスプールで置換中のまとまりの数
+        self.max_in_flight = (os.cpu_count() or 1) * 2
+        self.replaced = 0
+        self.total = 0
+        self.dry_run = False
+        self.stopped = False
+        self.poll_job = None
+
+    @property
+    def running(self):
+        """置換中ならばTrue."""
+        return self.poll_job is not None
+
+    def start(self, paths, query, replacement, use_regex=False, match_case=False, dry_run=False):
+        """ファイルの置換を始める. 置換中ならば何もしない.
+
+        正規表現か置換後の文字列が正しくなければ、置換を始めずにre.errorを送出します。
+
+        args:
+            paths: 置換するファイルのパスのリスト
+            query, use_regex, match_case: compile_queryの引数
+            replacement: 置換後の文字列
+            dry_run: Trueならば、置換する数を数えるだけでファイルは書き換えない
+
+        """
+        if self.running:
+            return
+        pattern, flags, literal = compiled = compile_query(query, use_regex, match_case)
+        template = compile_replacement(compiled, replacement, use_regex)
+        self.args = (pattern, flags, literal, template, dry_run)
+        # シンボリックリンク等で同じファイルを指すパスは、1度だけ置換する
+        paths = list({os.path.realpath(path): path for path in paths}.values())
+        self.chunks = deque(
+            paths[i:i + REPLACE_CHUNK_SIZE] for i in range(0, len(paths), REPLACE_CHUNK_SIZE))
+        self.replaced = 0
+        self.total = len(paths)
+        self.dry_run = dry_run
+        self.stopped = False
+        self._fill()
+        self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def stop(self):
+        """置換を中断する. 置換中のまとまりは、終わるまで待って結果を受け取ります."""
+        self.stopped = True
+        self.chunks.clear()
+
+    def _fill(self):
+        """プロセスプールに渡すまとまりを、上限まで補充する."""
+        while self.chunks and self.in_flight < self.max_in_flight:
+            chunk = self.chunks.popleft()
+            try:
+                future = get_replace_executor().submit(replace_files, chunk, *self.args)
+            except RuntimeError:
+                # プロセスプールが壊れているか、終了している
+                reset_replace_executor()
+                future = get_replace_executor().submit(replace_files, chunk, *self.args)
+            self.in_flight += 1
+            future.add_done_callback(
+                lambda future, chunk=chunk: self._on_done(future, chunk))
+
+    def _on_done(self, future, chunk):
+        """置換が終わったまとまりの結果を、キューに入れる."""
+        if future.cancelled():
+            results = [(path, 0, 'cancelled') for path in chunk]
+        else:
+            try:
+                results = future.result()
+            except Exception as e:
+                # どのファイルまで置換したかは分からないが、書きかけのファイルは残らない
+                if isinstance(e, BrokenProcessPool):
+                    reset_replace_executor()
+                message = traceback.format_exc().strip().splitlines()[-1]
+                results = [(path, 0, message) for path in chunk]
+        self.results.put((results, len(chunk)))
+
+    def _poll(self):
+        """キューに届いた結果と進み具合を、コールバックに渡す."""
+        self.poll_job = None
+        found = []
+        while True:
+            try:
+                results, count = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight -= 1
+            self.replaced += count
+            found.extend(results)
+
+        if found:
+            self.on_result(found)
+        self._fill()
+        finished = self.in_flight == 0 and not self.chunks
+        self.on_progress(self.replaced, self.total, finished)
+        if not finished:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
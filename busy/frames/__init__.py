@@ -1,5 +1,6 @@
 from .search import create_search_box
 from .replace import create_replace_box
+from .finder import create_go_to_file_box
 from .display import InfoFrame
 from .tree import PathTreeFrame
 from .editor import EditorFrame
@@ -1,7 +1,19 @@
 import datetime
+import os
+import re
+import sys
+import time
 import tkinter as tk
 import tkinter.ttk as ttk
 
+from busy import mediator
+from busy.findfiles import ProjectReplacer, ProjectSearcher, compile_text_replace
+from busy.lint import ProjectLinter
+from busy.runner import ProcessRunner
+
+MAX_OUTPUT_LINES = 10000  # 実行結果欄に残す行数。超えた分は古いものから消す
+MAX_FIND_ROWS = 20000  # 検索結果に表示する行の数。超えた分は、ファイルだけを表示する
+
 
 class InfoFrame(ttk.Frame):
     """お知らせなどを表示するFrame."""
@@ -9,18 +21,94 @@ class InfoFrame(ttk.Frame):
     def __init__(self, master=None, **kwargs):
         super().__init__(master, **kwargs)
         self.create_widgets()
+        self.project_linter = ProjectLinter(
+            self, self.on_project_lint, self.on_project_lint_progress)
+        self.project_lint_start = None  # プロジェクトのチェックを始めた時刻
+        self.runner = ProcessRunner(self, self.on_run_output, self.on_run_exit)
+        self.run_path = None  # 実行中のファイルのパス
+        self.searcher = ProjectSearcher(self, self.on_find_result, self.on_find_progress)
+        self.find_root = None  # 検索しているディレクトリ
+        self.find_start = None  # 検索を始めた時刻
+        self.hits = {}  # 検索結果のノード: (ファイルのパス, 行番号)
+        self.found_paths = []  # 検索で一致したファイルのパス
+        self.find_options = None  # 実行中、又は最後の検索の(文字列, 正規表現か, 大文字小文字を区別するか, 置換後の文字列)
+        self.preview = None  # 最後に最後まで行えた、置換のプレビューのfind_options
+        self.replacer = ProjectReplacer(self, self.on_replace_result, self.on_replace_progress)
+        self.replace_count = 0  # 置換した数
+        self.replace_files = 0  # 置換したファイルの数
+        self.replace_errors = 0  # 置換できなかったファイルの数
 
     def create_widgets(self):
-        self.lint = tk.Text(self, font=('Helvetica', 14))
-        ysb_lint = ttk.Scrollbar(
-            self, orient=tk.VERTICAL, command=self.lint.yview)
-        self.lint.configure(yscroll=ysb_lint.set)
+        self.status = ttk.Label(self)
+        self.note = ttk.Notebook(self)
+        self.lint = self.create_text('Lint')
+        # プロジェクトのチェック結果は、編集中のファイルのチェックで消されないよう別のタブに表示する
+        self.project_lint = self.create_text('Lint Project')
+        self.output = self.create_text('Run')
+        self.create_find_tab()
 
-        self.lint.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
-        ysb_lint.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.status.grid(row=0, column=0, sticky=(tk.E, tk.W))
+        self.note.grid(row=1, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
 
         self.columnconfigure(0, weight=1)
-        self.rowconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+    def create_text(self, label):
+        """スクロールバー付きのTextを、タブとして追加する."""
+        frame = ttk.Frame(self.note)
+        text = tk.Text(frame, font=('Helvetica', 14))
+        ysb = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=text.yview)
+        text.configure(yscroll=ysb.set)
+
+        text.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.E, tk.W))
+        ysb.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(0, weight=1)
+        self.note.add(frame, text=label)
+        return text
+
+    def create_find_tab(self):
+        """ファイルを横断して検索する、Findタブを追加する."""
+        frame = ttk.Frame(self.note)
+        self.find_var = tk.StringVar()
+        self.find_entry = ttk.Entry(frame, textvariable=self.find_var)
+        self.regex_var = tk.BooleanVar()
+        self.case_var = tk.BooleanVar()
+        regex_check = ttk.Checkbutton(frame, text='Regex', variable=self.regex_var)
+        case_check = ttk.Checkbutton(frame, text='Match case', variable=self.case_var)
+        stop_button = ttk.Button(frame, text='Stop', command=self.stop_find)
+        self.replace_var = tk.StringVar()
+        replace_entry = ttk.Entry(frame, textvariable=self.replace_var)
+        self.dry_run_var = tk.BooleanVar()
+        dry_run_check = ttk.Checkbutton(frame, text='Dry run', variable=self.dry_run_var)
+        preview_button = ttk.Button(frame, text='Preview', command=self.preview_replace)
+        replace_button = ttk.Button(frame, text='Replace All', command=self.replace_all)
+
+        # 結果はファイルごとにまとめ、その下に一致した行を表示する
+        self.find_tree = ttk.Treeview(frame, show='tree')
+        ysb = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=self.find_tree.yview)
+        self.find_tree.configure(yscroll=ysb.set)
+
+        self.find_entry.grid(row=0, column=0, sticky=(tk.E, tk.W))
+        regex_check.grid(row=0, column=1)
+        case_check.grid(row=0, column=2)
+        stop_button.grid(row=0, column=3)
+        replace_entry.grid(row=1, column=0, sticky=(tk.E, tk.W))
+        dry_run_check.grid(row=1, column=1)
+        preview_button.grid(row=1, column=2)
+        replace_button.grid(row=1, column=3)
+        self.find_tree.grid(row=2, column=0, columnspan=4, sticky=(tk.N, tk.S, tk.E, tk.W))
+        ysb.grid(row=2, column=4, sticky=(tk.N, tk.S))
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(2, weight=1)
+        self.note.add(frame, text='Find')
+
+        # エンターで検索(置換欄では置換のプレビュー)、Escで中断、結果のダブルクリックでその行を開く
+        self.find_entry.bind('<Return>', self.start_find)
+        self.find_entry.bind('<Escape>', self.stop_find)
+        replace_entry.bind('<Return>', self.preview_replace)
+        replace_entry.bind('<Escape>', self.stop_find)
+        self.find_tree.bind('<Double-1>', self.choose_hit)
 
     def add_lint(self, text):
         """スタイルチェック欄にテキストを追加する."""
@@ -36,6 +124,219 @@ class InfoFrame(ttk.Frame):
         self.clear_lint()
         self.add_lint(text)
 
+    def update_status(self, text):
+        """お知らせ欄の上の、状態の表示を更新する."""
+        self.status['text'] = text
+
+    def lint_project(self, root_path):
+        """root_path以下の全てのPythonファイルをチェックし、結果を届いた順に表示する."""
+        self.note.select(self.project_lint.master)
+        self.project_lint.delete('1.0', tk.END)
+        self.project_lint_start = time.perf_counter()
+        self.update_status('Lint Project: {0}'.format(root_path))
+        self.project_linter.start(root_path)
+
+    def on_project_lint(self, outputs):
+        """プロジェクトのチェックの結果を、Lint Projectタブに追加する."""
+        # 1回のinsertにまとめ、ファイルの数だけウィジェットを更新しないようにする
+        self.project_lint.insert(tk.END, ''.join(outputs))
+
+    def on_project_lint_progress(self, checked, total, finished):
+        """プロジェクトのチェックの進み具合を表示する."""
+        if finished:
+            elapsed = time.perf_counter() - self.project_lint_start
+            self.update_status('Lint Project: {0} files, {1:.1f}s'.format(total, elapsed))
+        elif total is None:
+            self.update_status('Lint Project: {0} files...'.format(checked))
+        else:
+            self.update_status('Lint Project: {0}/{1} files'.format(checked, total))
+
+    def run_file(self, path):
+        """Pythonでファイルを実行し、出力を実行結果欄に表示する. 実行中のものは止める."""
+        self.note.select(self.output.master)
+        self.output.delete('1.0', tk.END)
+        self.run_path = path
+        self.update_status('Run: {0} (running)'.format(path))
+        self.runner.start([sys.executable, path], cwd=os.path.dirname(path) or None)
+
+    def stop_run(self):
+        """実行中のファイルを止める."""
+        self.runner.stop()
+
+    def on_run_output(self, text):
+        """実行したファイルの出力を、実行結果欄に追加する."""
+        # 末尾を見ている場合だけ、追加した出力までスクロールする
+        at_end = self.output.yview()[1] >= 1.0
+        self.output.insert(tk.END, text)
+        line_count = int(self.output.index('end-1c').split('.')[0])
+        if line_count > MAX_OUTPUT_LINES:
+            self.output.delete('1.0', '{0}.0'.format(line_count - MAX_OUTPUT_LINES + 1))
+        if at_end:
+            self.output.see(tk.END)
+
+    def on_run_exit(self, returncode, elapsed, stopped):
+        """実行したファイルが終了した際に、終了コードを表示する."""
+        state = 'stopped' if stopped else 'exit code {0}'.format(returncode)
+        self.update_status('Run: {0} ({1}, {2:.1f}s)'.format(self.run_path, state, elapsed))
+
+    def find_in_files(self, root_path):
+        """Findタブを表示し、root_path以下を検索できるようにする."""
+        self.note.select(self.find_tree.master)
+        self.find_root = root_path
+        self.find_entry.focus()
+        self.find_entry.select_range(0, tk.END)
+
+    def start_find(self, event=None, replacement=None):
+        """入力した文字列で、ファイルを横断した検索を始める.
+
+        replacementを渡すと、一致した行を置換した後の行も表示する(置換のプレビュー)。
+        ファイルは書き換えません。
+        エディタで開いているファイルは、replace_allと同じくエディタの内容から探します。
+
+        """
+        query = self.find_var.get()
+        if not query or self.find_root is None or self.replacer.running:
+            return 'break'
+        self.find_tree.delete(*self.find_tree.get_children())
+        self.hits.clear()
+        self.found_paths = []
+        self.find_options = (query, self.regex_var.get(), self.case_var.get(), replacement)
+        sources = {
+            editor.path: editor.get_src()
+            for editor in mediator.event.get_editors() if editor.path
+        }
+        try:
+            self.searcher.start(self.find_root, *self.find_options, sources=sources)
+        except re.error as e:
+            self.update_status('Find: {0}'.format(e))
+            return 'break'
+        self.find_start = time.perf_counter()
+        self.update_status('Find: {0}'.format(self.find_root))
+        return 'break'
+
+    def preview_replace(self, event=None):
+        """置換する行を、置換した後の行と並べて表示する."""
+        return self.start_find(replacement=self.replace_var.get())
+
+    def stop_find(self, event=None):
+        """検索か置換を中断する. 置換は、書き換え中のファイルが終わるのを待って止まります."""
+        if self.searcher.running:
+            self.searcher.cancel()
+            self.on_find_progress(self.searcher.searched, self.searcher.total, True, 'stopped')
+        if self.replacer.running:
+            self.replacer.stop()
+        return 'break'
+
+    def on_find_result(self, results):
+        """見つかったファイルと行を、検索結果に追加する."""
+        for path, matches in results:
+            self.found_paths.append(path)
+            rel_path = os.path.relpath(path, self.find_root)
+            node = self.find_tree.insert(
+                '', tk.END, text='{0} ({1})'.format(rel_path, len(matches)), open=True)
+            self.hits[node] = (path, 1)
+            if len(self.hits) > MAX_FIND_ROWS:
+                continue
+            for line_no, line, new_line in matches:
+                text = '{0}: {1}'.format(line_no, line.strip())
+                if new_line is not None:
+                    text += '  →  ' + new_line.strip()
+                child = self.find_tree.insert(node, tk.END, text=text)
+                self.hits[child] = (path, line_no)
+
+    def on_find_progress(self, searched, total, finished, state=None):
+        """検索の進み具合を表示する."""
+        if not finished:
+            self.update_status('Find: {0}/{1} files'.format(searched, total or '?'))
+            return
+        if state is None:
+            state = 'too many matches' if self.searcher.truncated else 'done'
+            if state == 'done' and not self.searcher.error and self.find_options[3] is not None:
+                # 全ての置換する行を表示できたプレビューだけ、置換に使える
+                self.preview = self.find_options
+        if self.searcher.error:
+            state += ', error'
+        elapsed = time.perf_counter() - self.find_start
+        self.update_status('Find: {0} matches in {1} files, {2}/{3} files searched ({4}, {5:.1f}s)'.format(
+            self.searcher.match_count, len(self.find_tree.get_children()),
+            searched, total or '?', state, elapsed))
+
+    def replace_all(self, event=None):
+        """プレビューしたファイルを全て置換する.
+
+        エディタで開いているファイルは、ファイルではなくエディタの内容を置換します。
+        Dry runにチェックがあれば、置換する数を数えるだけにします。
+
+        """
+        if self.searcher.running or self.replacer.running:
+            return 'break'
+        query = self.find_var.get()
+        replacement = self.replace_var.get()
+        use_regex = self.regex_var.get()
+        match_case = self.case_var.get()
+        if self.preview != (query, use_regex, match_case, replacement):
+            # 何を置換するかを、先に確認してもらう
+            self.update_status('Replace: Preview first')
+            return 'break'
+        dry_run = self.dry_run_var.get()
+
+        editors = {
+            os.path.realpath(editor.path): editor
+            for editor in mediator.event.get_editors() if editor.path
+        }
+        regex, template = compile_text_replace(query, replacement, use_regex, match_case)
+        self.replace_count = self.replace_files = self.replace_errors = 0
+        disk_paths = []
+        for path in self.found_paths:
+            editor = editors.pop(os.path.realpath(path), None)
+            if editor is None:
+                disk_paths.append(path)
+                continue
+            if dry_run:
+                count = sum(1 for _ in regex.finditer(editor.get_src()))
+            else:
+                count = editor.replace_all(regex, template)
+            self.replace_count += count
+            self.replace_files += bool(count)
+
+        if not dry_run:
+            # 置換した後は、プレビューの内容と違ってしまう
+            self.preview = None
+        self.find_start = time.perf_counter()
+        self.replacer.start(disk_paths, query, replacement, use_regex, match_case, dry_run)
+        return 'break'
+
+    def on_replace_result(self, results):
+        """置換したファイルの数を数え、置換できなかったファイルを検索結果の先頭に表示する."""
+        for path, count, error in results:
+            self.replace_count += count
+            self.replace_files += bool(count)
+            if error is not None:
+                self.replace_errors += 1
+                rel_path = os.path.relpath(path, self.find_root)
+                self.find_tree.insert('', 0, text='error: {0}: {1}'.format(rel_path, error))
+
+    def on_replace_progress(self, replaced, total, finished):
+        """置換の進み具合を表示する."""
+        label = 'Replace (dry run)' if self.replacer.dry_run else 'Replace'
+        if not finished:
+            self.update_status('{0}: {1}/{2} files'.format(label, replaced, total))
+            return
+        state = 'stopped' if self.replacer.stopped else 'done'
+        elapsed = time.perf_counter() - self.find_start
+        self.update_status('{0}: {1} replacements in {2} files, {3} errors ({4}, {5:.1f}s)'.format(
+            label, self.replace_count, self.replace_files, self.replace_errors, state, elapsed))
+
+    def choose_hit(self, event=None):
+        """検索結果をダブルクリックした際に、ファイルを開いてその行に移動する."""
+        node = self.find_tree.focus()
+        if node not in self.hits:
+            return
+        path, line_no = self.hits[node]
+        mediator.event.open_file(file_path=path)
+        mediator.event.go_to_line(line_no)
+        return 'break'
+
 
 def main():
     root = tk.Tk()
@@ -1,21 +1,66 @@
 import tkinter as tk
 import tkinter.ttk as ttk
 from busy import mediator
+from busy.buffer import TextBuffer
 from busy.codestyles import get_code_style
 from busy.frames import create_search_box, create_replace_box
 
 
 class CustomText(tk.Text):
-    """Textの、イベントを拡張したウィジェット."""
+    """Textの、イベントを拡張したウィジェット.
+
+    insert、replace、deleteが呼ばれると、変更された行の範囲を
+    edit_listenersに登録された関数に通知します。
+    関数は(変更範囲の最初の行, 変更前の最後の行, 増えた行数)を受け取ります。
+
+    また、同じ内容をPython側のTextBuffer(self.buffer)にも反映するので、
+    内容を読むだけならTclを呼ばずにself.bufferから読めます。
+
+    """
 
     def __init__(self, master=None, **kwargs):
         super().__init__(master, **kwargs)
+        self.edit_listeners = []
+        self.buffer = TextBuffer()
         self.tk.eval('''
-            proc widget_proxy {widget widget_command args} {
+            proc widget_proxy {widget widget_command callback args} {
+
+                # record the edited line range before the real command runs
+                set edit 0
+                set command [lindex $args 0]
+                if {$command in {insert replace delete}} {
+                    set edit [expr {![catch {
+                        set lines [lindex [split [$widget_command index end] .] 0]
+                        if {$command eq "insert"} {
+                            set indices [lrange $args 1 1]
+                        } elseif {$command eq "replace"} {
+                            set indices [lrange $args 1 2]
+                        } else {
+                            # "delete index" deletes one character, which may be a newline
+                            set indices [lrange $args 1 end]
+                            if {[llength $indices] % 2} {
+                                lappend indices "[lindex $indices end]+1c"
+                            }
+                        }
+                        set first $lines
+                        set last 0
+                        foreach index $indices {
+                            set line [lindex [split [$widget_command index $index] .] 0]
+                            if {$line < $first} {set first $line}
+                            if {$line > $last} {set last $line}
+                        }
+                    }]}]
+                }
 
                 # call the real tk widget command with the real args
                 set result [uplevel [linsert $args 0 $widget_command]]
 
+                # notify the edited line range and the number of added lines
+                if {$edit} {
+                    set delta [expr {[lindex [split [$widget_command index end] .] 0] - $lines}]
+                    $callback $first $last $delta
+                }
+
                 # generate the event for certain types of commands
                 if {([lrange $args 0 1] == {xview moveto}) ||
                     ([lrange $args 0 1] == {xview scroll}) ||
@@ -36,8 +81,27 @@ class CustomText(tk.Text):
             ''')
         self.tk.eval('''
             rename {widget} _{widget}
-            interp alias {{}} ::{widget} {{}} widget_proxy {widget} _{widget}
-        '''.format(widget=str(self)))
+            interp alias {{}} ::{widget} {{}} widget_proxy {widget} _{widget} {callback}
+        '''.format(widget=str(self), callback=self.register(self.on_edit)))
+
+    def on_edit(self, first, last, delta):
+        """テキストが変更された際に、Tcl側から呼ばれる."""
+        first, last, delta = int(first), int(last), int(delta)
+
+        # 変更後も、範囲には少なくとも1行が残る
+        # 減った行が範囲に含まれていなければ、範囲を広げて合わせる
+        line_count = self.buffer.line_count
+        first = min(first, line_count)
+        last = min(max(last, first, first - delta), line_count)
+        count = max(last - first + 1 + delta, 1)  # 変更後の範囲の行数
+
+        # 変更された行だけをウィジェットから読み、バッファに反映する
+        src = self.get('{0}.0'.format(first), '{0}.end'.format(first + count - 1))
+        self.buffer.replace_lines(first, last, src.split('\n'))
+
+        delta = count - (last - first + 1)
+        for listener in self.edit_listeners:
+            listener(first, last, delta)
 
 
 class EditorFrame(ttk.Frame):
@@ -45,6 +109,7 @@ class EditorFrame(ttk.Frame):
 
     def __init__(self, master, path=None, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
+        self.code_style = None
         self.create_widgets()
         self.create_event()
         self.path = path
@@ -64,6 +129,8 @@ class EditorFrame(ttk.Frame):
 
         """
         self._path = opening_file_path
+        if self.code_style is not None:
+            self.code_style.close()
         self.code_style = get_code_style(self, opening_file_path)
 
     def create_widgets(self):
@@ -93,6 +160,9 @@ class EditorFrame(ttk.Frame):
         # テキストの変更時
         self.text.bind('<<Change>>', self.on_change)
 
+        # テキストの変更時に、変更された行の範囲を受け取る
+        self.text.edit_listeners.append(self.on_edit)
+
         # Tab押下時(インデント、又はコード補完)
         self.text.bind('<Tab>', self.tab)
 
@@ -123,11 +193,19 @@ class EditorFrame(ttk.Frame):
         # Ctrl+Oで何もしない。Textウィジェット自体のイベントを消す
         self.text.bind('<Control-o>', self.o)
 
+        # Ctrl+Pでファイルを開くボックス。Textウィジェット自体のイベント(カーソルを上へ)を消す
+        self.text.bind('<Control-p>', self.go_to_file)
+
     def o(self, event=None):
         """TextウィジェットのCtrl+Oイベントを上書き..."""
         mediator.event.open_file()
         return 'break'
 
+    def go_to_file(self, event=None):
+        """ファイルのパスをあいまい検索して開くボックスの作成"""
+        mediator.event.go_to_file()
+        return 'break'
+
     def search(self, event=None):
         """検索ボックスの作成"""
         create_search_box(self.text)
@@ -141,6 +219,11 @@ class EditorFrame(ttk.Frame):
     def on_scroll(self, event=None):
         """スクロール時に呼ばれる"""
         self.update_line_number(event=event)  # 行番号更新
+        self.view_highlight(event=event)  # 見えるようになった範囲のハイライト
+
+    def on_edit(self, first, last, delta):
+        """テキストが変更された行の範囲を、コードスタイルに伝える."""
+        self.code_style.on_edit(first, last, delta)
 
     def on_change(self, event=None):
         """エディタの内容が変更された際に呼ばれる"""
@@ -188,33 +271,31 @@ class EditorFrame(ttk.Frame):
 
     def get_src(self):
         """エディタの内容を返す."""
-        return self.text.get('1.0', 'end-1c')
+        return self.text.buffer.get_text()
+
+    def get_insert_index(self):
+        """カーソル位置の(行番号, 列)を返す."""
+        line, col = self.text.index('insert').split('.')
+        return int(line), int(col)
 
     def get_line_text(self):
         """現在の行のテキストを返す."""
-        return self.text.get('insert linestart', 'insert lineend')
+        line, _ = self.get_insert_index()
+        return self.text.buffer.get_line(line)
 
     def get_line_text_before_cursor(self):
         """カーソルまでの現在の行のテキストを返す."""
-        return self.text.get('insert linestart', 'insert')
+        line, col = self.get_insert_index()
+        return self.text.buffer.get_line(line)[:col]
 
     def get_current_insert_word(self):
-        """現在入力中の単語と位置を取得する."""
-        text = ''
-        start_i = 1
-        end_i = 0
-        while True:
-            start = 'insert-{0}c'.format(start_i)
-            end = 'insert-{0}c'.format(end_i)
-            text = self.text.get(start, end)
-
-            # 1文字ずつ見て、スペース、改行、タブ、空文字にぶつかったら終わり
-            if text in (' ', '\t', '\n', ''):
-                text = self.text.get(end, 'insert')
-                return text, end, 'insert'
-
-            start_i += 1
-            end_i += 1
+        """現在入力中の単語と位置を取得する.
+
+        カーソルの前にある、スペース、タブ、行頭で区切られた単語を返します。
+
+        """
+        text, _ = self.text.buffer.get_word_before(*self.get_insert_index())
+        return text, 'insert-{0}c'.format(len(text)), 'insert'
 
     def get_selection_indices(self):
         """選択部分の始まりと終わりの行番号を返す."""
@@ -234,8 +315,45 @@ class EditorFrame(ttk.Frame):
         self.text.tag_add('sel', '1.0', 'end')
         return 'break'
 
+    def replace_all(self, regex, template):
+        """テキストの中の、正規表現に一致する部分を全て置換する. 置換した数を返す.
+
+        置換した後のテキストを先に作り、一致した最初の行から最後の行までを1度に書き換えます。
+        そのため元に戻すのも1度で済み、Tkに渡す位置は行番号だけなので、
+        Tkと文字の数え方が違う文字(絵文字等)があっても位置がずれません。
+
+        """
+        src = self.get_src()
+        matches = list(regex.finditer(src))
+        if not matches:
+            return 0
+        buffer = self.text.buffer
+        first, _ = buffer.offset_to_index(matches[0].start())
+        last, _ = buffer.offset_to_index(matches[-1].end())
+        start = buffer.index_to_offset(first, 0)
+        end = buffer.index_to_offset(last, len(buffer.get_line(last)))
+        parts = []
+        for match in matches:
+            parts.append(src[start:match.start()])
+            parts.append(match.expand(template))
+            start = match.end()
+        parts.append(src[start:end])
+        self.text.replace('{0}.0'.format(first), '{0}.end'.format(last), ''.join(parts))
+        return len(matches)
+
+    def go_to_line(self, line_no):
+        """指定した行にカーソルを移動し、その行を選択して表示する."""
+        index = '{0}.0'.format(line_no)
+        self.text.mark_set('insert', index)
+        self.text.tag_remove('sel', '1.0', 'end')
+        self.text.tag_add('sel', index, '{0} lineend'.format(index))
+        self.text.see(index)
+        self.text.focus_set()
+        # seeでは<<Scroll>>が起きないので、表示が変わった後に行番号とハイライトを更新する
+        self.after_idle(self.on_scroll)
+
     def lint(self):
-        """コードのスタイルガイドチェック."""
+        """コードのスタイルガイドチェック. 前回と内容が同じならば、その結果をすぐに返す."""
         return self.code_style.lint()
 
     def tab(self, event=None):
@@ -251,13 +369,22 @@ class EditorFrame(ttk.Frame):
         return self.code_style.dedent()
 
     def line_highlight(self, event=None):
-        """現在行をハイライトする."""
+        """変更された行をハイライトする."""
         return self.code_style.line_highlight()
 
+    def view_highlight(self, event=None):
+        """見えている範囲を先にハイライトし、残りをバックグラウンドで行う."""
+        return self.code_style.view_highlight()
+
     def all_highlight(self, event=None):
         """全行をハイライトする."""
         return self.code_style.all_highlight()
 
+    def highlight_stats(self, event=None):
+        """ハイライトのタグ範囲の数等を、お知らせ欄に表示する(デバッグ用)."""
+        mediator.event.update_lint(text=self.code_style.get_highlight_stats())
+        return 'break'
+
     def enter_indent(self, event=None):
         """エンター時のインデントを調節する."""
         return self.code_style.enter_indent()
@@ -0,0 +1,175 @@
+"""ファイル名のあいまい検索で、ファイルを開くボックスを提供するモジュール
+
+create_go_to_file_box関数に、busy.fileindex.FileIndexを渡せば利用できます。
+
+"""
+import os
+import tkinter as tk
+import tkinter.ttk as ttk
+
+from busy import mediator
+from busy.fileindex import FileIndex, FileSearch
+
+SEARCH_SLICE = 0.02  # 1回に検索を進める秒数。最初の結果はこの時間で表示される
+INDEX_WAIT = 200  # 索引の作成中に、検索し直す間隔(ミリ秒)
+
+
+class GoToFileBox(ttk.Frame):
+    """ファイルのパスをあいまい検索し、選んだファイルを開くボックス."""
+
+    def __init__(self, master, file_index, *args, **kwargs):
+        """初期化
+
+        file_index引数に、ファイルの索引(FileIndex)を渡してください
+        """
+        super().__init__(master, *args, **kwargs)
+        self.file_index = file_index
+        self.create_widgets()
+        self.current = None  # 実行中、又は最後に行ったFileSearch
+        self.version = None  # 検索を始めた時の索引のversion
+        self.search_job = None
+        self.wait_job = None
+        self.text.focus()  # 入力欄にフォーカスしとく
+
+    def create_widgets(self):
+        """ウィジェットの作成."""
+        # 検索文字の入力欄と、紐付けるStringVar
+        self.text_var = tk.StringVar()
+        self.text = ttk.Entry(self, textvariable=self.text_var, width=60)
+        self.text.grid(row=0, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+
+        # 検索結果
+        self.listbox = tk.Listbox(self, height=15, exportselection=False, activestyle='none')
+        self.listbox.grid(row=1, column=0, sticky=(tk.N, tk.S, tk.W, tk.E))
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+
+        # 入力の度に絞り込み、上下キーで選択、エンターかダブルクリックで開く
+        self.text_var.trace_add('write', self.on_input)
+        self.text.bind('<Up>', self.up)
+        self.text.bind('<Down>', self.down)
+        self.text.bind('<Return>', self.select)
+        self.listbox.bind('<Double-1>', self.select)
+        self.bind('<Destroy>', self.on_destroy)
+
+    def on_input(self, *args):
+        """入力が変わった際に、検索を始める."""
+        query = self.text_var.get()
+        self.cancel()
+        if not query:
+            self.current = None
+            self.show([])
+            return
+
+        version = self.file_index.version
+        if self.current is not None and query.startswith(self.current.query) \
+                and version == self.version:
+            # 入力が続いた場合は、前回一致したものと、まだ調べていないものだけを検索する
+            self.current = self.current.narrow(query)
+        else:
+            self.current = FileSearch(query, self.file_index.snapshot())
+            self.version = version
+        self.continue_search()
+
+    def continue_search(self):
+        """決まった時間だけ検索を進めて結果を表示し、残りはアイドル時に行う."""
+        self.search_job = None
+        done = self.current.run(SEARCH_SLICE)
+        self.show(self.current.results())
+        if not done:
+            self.search_job = self.after_idle(self.continue_search)
+        elif self.file_index.building or self.file_index.version != self.version:
+            # 検索中に索引が変わったならば、増えたファイルを含めて検索し直す
+            self.wait_job = self.after(INDEX_WAIT, self.retry)
+
+    def retry(self):
+        """索引が変わっていれば、最初から検索し直す."""
+        self.wait_job = None
+        if self.file_index.version != self.version:
+            self.current = None
+            self.on_input()
+        elif self.file_index.building:
+            self.wait_job = self.after(INDEX_WAIT, self.retry)
+
+    def cancel(self):
+        """途中の検索をやめる."""
+        if self.search_job is not None:
+            self.after_cancel(self.search_job)
+            self.search_job = None
+        if self.wait_job is not None:
+            self.after_cancel(self.wait_job)
+            self.wait_job = None
+
+    def show(self, paths):
+        """検索結果を表示する. 選択は先頭にする."""
+        self.listbox.delete(0, tk.END)
+        if paths:
+            self.listbox.insert(tk.END, *paths)
+            self.listbox.selection_set(0)
+            self.listbox.see(0)
+
+    def move(self, offset):
+        """選択している検索結果を、offsetだけ動かす."""
+        size = self.listbox.size()
+        if not size:
+            return
+        selection = self.listbox.curselection()
+        index = selection[0] + offset if selection else 0
+        index = max(0, min(index, size - 1))
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+
+    def up(self, event=None):
+        """上キーで、1つ上の検索結果を選ぶ."""
+        self.move(-1)
+        return 'break'
+
+    def down(self, event=None):
+        """下キーで、1つ下の検索結果を選ぶ."""
+        self.move(1)
+        return 'break'
+
+    def select(self, event=None):
+        """選んでいるファイルを開き、ボックスを閉じる."""
+        selection = self.listbox.curselection()
+        if not selection:
+            return 'break'
+        path = self.listbox.get(selection[0])
+        file_path = os.path.join(self.file_index.root_path, *path.split('/'))
+        self.winfo_toplevel().destroy()
+        mediator.event.open_file(file_path=file_path)
+        return 'break'
+
+    def on_destroy(self, event=None):
+        """閉じた際に、途中の検索をやめる."""
+        if event is None or event.widget is self:
+            self.cancel()
+
+
+def create_go_to_file_box(file_index, title='Go to File'):
+    """ファイルを開くボックスを作成する関数
+
+    args:
+        file_index: busy.fileindex.FileIndex
+        title: ボックスのタイトル
+
+    """
+    window = tk.Toplevel()
+    window.title(title)
+    box = GoToFileBox(window, file_index)
+    box.pack(fill=tk.BOTH, expand=True)
+    window.bind('<Escape>', lambda event: window.destroy())
+    return box
+
+
+if __name__ == '__main__':
+    root = tk.Tk()
+    root.title('Go to File Test')
+    index = FileIndex(os.curdir)
+    index.start()
+    root.bind(
+        '<Control-p>',
+        lambda event: create_go_to_file_box(file_index=index),
+    )
+    root.mainloop()
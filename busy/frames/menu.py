@@ -17,6 +17,7 @@ class EditorMenu(tk.Menu):
         self.create_file_menu()
         self.create_edit_menu()
         self.create_tree_menu()
+        self.create_run_menu()
         self.create_font_menu()
 
     def create_file_menu(self):
@@ -24,6 +25,7 @@ class EditorMenu(tk.Menu):
         menu_file = tk.Menu(self)
         menu_file.add_command(label='New', command=mediator.event.new_file, accelerator='Ctrl+N')
         menu_file.add_command(label='Open', command=mediator.event.open_file, accelerator='Ctrl+O')
+        menu_file.add_command(label='Go to File', command=mediator.event.go_to_file, accelerator='Ctrl+P')
         menu_file.add_command(label='Save', command=mediator.event.save_file, accelerator='Ctrl+S')
         menu_file.add_command(label='Delete', command=mediator.event.delete_tab, accelerator='Ctrl+D')
         menu_file.add_command(label='Save as...', command=mediator.event.save_as)
@@ -36,6 +38,7 @@ class EditorMenu(tk.Menu):
         menu_edit.add_command(label='Dedent', command=mediator.event.dedent, accelerator='Ctrl+[')
         menu_edit.add_command(label='Select All', command=mediator.event.select_all, accelerator='Ctrl+A')
         menu_edit.add_command(label='HighLight', command=mediator.event.highlight, accelerator='Ctrl+L')
+        menu_edit.add_command(label='HighLight Stats', command=mediator.event.highlight_stats)
         menu_edit.add_command(label='Search', command=mediator.event.search, accelerator='Ctrl+F')
         menu_edit.add_command(label='Replace', command=mediator.event.replace, accelerator='Ctrl+H')
         self.add_cascade(menu=menu_edit, label='Edit')
@@ -45,8 +48,17 @@ class EditorMenu(tk.Menu):
         menu_tree = tk.Menu(self)
         menu_tree.add_command(label='Change Root', command=mediator.event.change_dir, accelerator='F4')
         menu_tree.add_command(label='Update', command=mediator.event.update_dir, accelerator='F5')
+        menu_tree.add_command(label='Lint Project', command=mediator.event.lint_project, accelerator='F6')
+        menu_tree.add_command(label='Find in Files', command=mediator.event.find_in_files, accelerator='Ctrl+Shift+F')
         self.add_cascade(menu=menu_tree, label='Tree')
 
+    def create_run_menu(self):
+        """Runメニューの作成(ファイルの実行)."""
+        menu_run = tk.Menu(self)
+        menu_run.add_command(label='Run', command=mediator.event.run_file, accelerator='F9')
+        menu_run.add_command(label='Stop', command=mediator.event.stop_run, accelerator='Shift+F9')
+        self.add_cascade(menu=menu_run, label='Run')
+
     def create_font_menu(self):
         """フォント管理メニューの作成"""
         font_menu = tk.Menu(self)
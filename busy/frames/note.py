@@ -30,7 +30,7 @@ class EditorNoteBook(ttk.Notebook):
             name = os.path.basename(path)
             with open(path, 'r', encoding='utf-8') as file:
                 editor.text.insert('1.0', file.read())
-                editor.all_highlight()
+                editor.view_highlight()
 
         # NoteBookにエディタを追加
         self.add(editor, text=name)
@@ -64,9 +64,10 @@ class EditorNoteBook(ttk.Notebook):
             with open(current_editor.path, 'w', encoding='utf-8') as file:
                 file.write(src)
 
-        # セーブ後にコードのチェック、全てハイライト、変更フラグをFalse、タブ名の*を消去
+        # セーブ後にコードのチェック、変更フラグをFalse、タブ名の*を消去
+        # テキストは変わらないので、ハイライトは未解析の行(別名で保存し、コードスタイルが変わった場合等)だけを行う
         current_editor.lint()
-        current_editor.all_highlight()
+        current_editor.view_highlight()
         current_editor.changed = False
         self.reset_tab_name()
 
@@ -85,9 +86,10 @@ class EditorNoteBook(ttk.Notebook):
             with open(file_name, 'w', encoding='utf-8') as file:
                 file.write(src)
 
-        # セーブ後にコードのチェック、全てハイライト、変更フラグをFalse、タブ名の*を消去
+        # セーブ後にコードのチェック、変更フラグをFalse、タブ名の*を消去
+        # テキストは変わらないので、ハイライトは未解析の行(別名で保存し、コードスタイルが変わった場合等)だけを行う
         current_editor.lint()
-        current_editor.all_highlight()
+        current_editor.view_highlight()
         current_editor.changed = False
         self.reset_tab_name()
 
@@ -109,6 +111,10 @@ class EditorNoteBook(ttk.Notebook):
         else:
             self._delete_tab()
 
+    def get_editors(self):
+        """開いている全てのエディタを返す"""
+        return [self.children[tab.split('.')[-1]] for tab in self.tabs()]
+
     def get_current_editor(self):
         """選択中のエディタを返す"""
         current_widget_name = self.select().split('.')[-1]
@@ -132,8 +138,13 @@ class EditorNoteBook(ttk.Notebook):
             return self.add_tab(path=file_path)
 
     def change_tab_name(self, event=None):
-        """タブ名に「*」を入れる"""
-        current_tab = self.select()
+        """タブ名に「*」を入れる
+
+        eventを渡した場合は、選択中のタブではなく、変更されたエディタのタブに入れます。
+        プロジェクト全体の置換等で、選択していないエディタが変更されることがあるためです。
+
+        """
+        current_tab = self.select() if event is None else event.widget.master
         tab_name = self.tab(current_tab)['text'].replace('*', '')
         self.tab(current_tab, text='*' + tab_name)
 
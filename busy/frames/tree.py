@@ -5,6 +5,15 @@ import tkinter.ttk as ttk
 from tkinter import filedialog
 
 from busy import mediator
+from busy.frames import create_go_to_file_box
+from busy.codestyles.symbols import SymbolIndex
+from busy.fileindex import FileIndex
+from busy.ignore import DEFAULT_IGNORE, IgnoreMatcher
+from busy.watch import create_watcher
+
+WATCH_INTERVAL = 300  # 開いているディレクトリの変更を確認する間隔(ミリ秒)
+INSERT_CHUNK_SIZE = 200  # 1回のアイドル時に挿入する子ノードの数
+MAX_CHILDREN = mediator.busy_settings.get('tree_max_children', 1000)  # 最初に表示する子ノードの数
 
 
 class PathTreeFrame(ttk.Frame):
@@ -20,8 +29,17 @@ class PathTreeFrame(ttk.Frame):
         """
         super().__init__(master, **kwargs)
         self.root_path = os.path.abspath(path)
-        self.nodes = {}
+        self.nodes = {}  # ノード: (中身を読んだか, 絶対パス, ディレクトリか)
+        self.watcher = create_watcher()
+        self.watched = {}  # 変更を監視している、開いたディレクトリのパス: ノード
+        self.loading = {}  # 子ノードを挿入中のノード: (afterの識別子, 「loading…」のノード)
+        self.more_nodes = {}  # 「show more…」のノード: 親ノード
+        self.limits = {}  # 「show more…」を選んだノード: 表示する子ノードの数
+        self.create_ignore()
         self.create_widgets()
+        self.create_symbol_index()
+        self.create_file_index()
+        self.after(WATCH_INTERVAL, self.check_changes)
 
     def create_widgets(self):
         """ウィジェットの作成."""
@@ -43,75 +61,291 @@ class PathTreeFrame(ttk.Frame):
         self.columnconfigure(0, weight=1)
         self.rowconfigure(0, weight=1)
 
-        # ディレクトリを開いた際と、ダブルクリック(ファイル選択)を関連付け
+        # ディレクトリを開いた・閉じた際と、ダブルクリック(ファイル選択)を関連付け
         self.tree.bind('<<TreeviewOpen>>', self.open_node)
+        self.tree.bind('<<TreeviewClose>>', self.close_node)
         self.tree.bind('<Double-1>', self.choose_file)
 
-    def insert_node(self, parent, text, abspath):
+    def create_ignore(self):
+        """ツリーに表示しないパスの判定を、設定の無視リストと.gitignoreから作る."""
+        patterns = mediator.busy_settings.get('ignore', DEFAULT_IGNORE)
+        self.ignore = IgnoreMatcher(self.root_path, patterns)
+
+    def create_symbol_index(self):
+        """ルートディレクトリ以下のシンボルの索引を、バックグラウンドで作り始める."""
+        self.symbol_index = SymbolIndex(self.root_path)
+        self.symbol_index.start()
+
+    def create_file_index(self):
+        """ルートディレクトリ以下のファイルの索引を、バックグラウンドで作り始める."""
+        patterns = mediator.busy_settings.get('ignore', DEFAULT_IGNORE)
+        self.file_index = FileIndex(self.root_path, patterns)
+        self.file_index.start()
+
+    def insert_node(self, parent, text, abspath, is_dir=None, index='end'):
         """Treeviewにノードを追加する.
 
         args:
             parent: 親ノード
             text: 表示するパス名
             abspath: 絶対パス
+            is_dir: ディレクトリならばTrue。Noneならば調べる
+            index: 親ノードの中での位置
 
         """
+        if is_dir is None:
+            is_dir = os.path.isdir(abspath)
+
         # まずノードを追加する
-        node = self.tree.insert(parent, 'end', text=text, open=False)
+        node = self.tree.insert(parent, index, text=text, open=False)
 
         # ディレクトリならば、空の子要素を追加し開けるようにしておく
-        if os.path.isdir(abspath):
+        if is_dir:
             self.tree.insert(node, 'end')
-            self.nodes[node] = (False, abspath)
+            self.nodes[node] = (False, abspath, True)
         else:
-            self.nodes[node] = (True, abspath)
+            self.nodes[node] = (True, abspath, False)
+        return node
+
+    def forget_node(self, node):
+        """ノードとその子孫を、self.nodesから取り除く. Treeviewからの削除は呼び出し側で行う."""
+        self.cancel_loading(node)
+        for child in self.tree.get_children(node):
+            self.forget_node(child)
+        self.more_nodes.pop(node, None)
+        self.limits.pop(node, None)
+        value = self.nodes.pop(node, None)
+        if value is not None and value[1] in self.watched:
+            self.unwatch_node(value[1])
+
+    def list_dir(self, node, abspath):
+        """ツリーに表示する、ディレクトリの中身を返す.
+
+        無視するパスは除き、名前順に並べます。
+        表示する数の上限を超えた分は、無視するかの判定もしません。
+
+        return:
+            ([(名前, ディレクトリか), ...], 上限を超えた分があるか)
+        """
+        try:
+            # DirEntry.is_dir()は、scandirで読んだ情報を使うのでstatを呼ばない
+            entries = sorted((entry.name, entry.is_dir()) for entry in os.scandir(abspath))
+        except OSError:
+            return [], False
+
+        rel_dir = self.ignore.to_rel_dir(abspath)
+        self.ignore.forget(rel_dir)  # .gitignoreが変更されているかもしれない
+        limit = self.limits.get(node, MAX_CHILDREN)
+        shown = []
+        for name, is_dir in entries:
+            if self.ignore.is_ignored_name(rel_dir, name, is_dir):
+                continue
+            if len(shown) >= limit:
+                return shown, True
+            shown.append((name, is_dir))
+        return shown, False
+
+    def sync_children(self, node):
+        """ディレクトリの中身を読み、増えたパスと消えたパスの分だけ子ノードを更新する.
+
+        変わっていない子ノードはそのまま残すので、開いた状態や選択も残ります。
+
+        """
+        _, abspath, _ = self.nodes[node]
+        self.cancel_loading(node)
+        entries, has_more = self.list_dir(node, abspath)
+
+        # 今の子ノードを、(名前, ディレクトリか)で引けるようにする
+        old = {}
+        placeholders = []
+        for child in self.tree.get_children(node):
+            if child in self.nodes:
+                _, child_path, is_dir = self.nodes[child]
+                old[(os.path.basename(child_path), is_dir)] = child
+            else:
+                # 開けるようにするための空の子要素と、「show more…」
+                placeholders.append(child)
+
+        new_keys = set(entries)
+        removed = placeholders + [child for key, child in old.items() if key not in new_keys]
+        if removed:
+            for child in removed:
+                self.forget_node(child)
+            self.tree.delete(*removed)
+
+        new_entries = [
+            (index, name, is_dir)
+            for index, (name, is_dir) in enumerate(entries) if (name, is_dir) not in old
+        ]
+        self.nodes[node] = (True, abspath, True)
+        self.insert_children(node, abspath, new_entries, has_more)
+
+    def insert_children(self, node, abspath, entries, has_more):
+        """子ノードを挿入する.
+
+        INSERT_CHUNK_SIZE個ずつに分けて、残りはアイドル時に挿入します。
+        その間は「loading…」のノードを表示し、エディタの操作を止めないようにします。
+
+        args:
+            node: 親ノード
+            abspath: 親ノードのディレクトリのパス
+            entries: [(親ノードの中での位置, 名前, ディレクトリか), ...] 位置の順
+            has_more: 表示する数の上限を超えた分があれば、最後に「show more…」を表示する
+
+        """
+        # 名前順に並んでいる、残った子ノードの間に挿入していく
+        for index, name, is_dir in entries[:INSERT_CHUNK_SIZE]:
+            self.insert_node(node, name, os.path.join(abspath, name), is_dir, index)
+
+        rest = entries[INSERT_CHUNK_SIZE:]
+        if rest:
+            loading_node = self.tree.insert(node, 'end', text='loading…')
+            job = self.after_idle(self.continue_loading, node, abspath, rest, has_more)
+            self.loading[node] = (job, loading_node)
+        elif has_more:
+            more_node = self.tree.insert(node, 'end', text='show more…')
+            self.more_nodes[more_node] = node
+
+    def continue_loading(self, node, abspath, entries, has_more):
+        """アイドル時に、残りの子ノードを挿入する."""
+        _, loading_node = self.loading.pop(node)
+        self.tree.delete(loading_node)
+        self.insert_children(node, abspath, entries, has_more)
+
+    def cancel_loading(self, node):
+        """子ノードの挿入中ならば、やめる."""
+        if node in self.loading:
+            job, loading_node = self.loading.pop(node)
+            self.after_cancel(job)
+            self.tree.delete(loading_node)
+
+    def show_more(self, more_node):
+        """「show more…」を選んだ際に、表示する子ノードを増やす."""
+        node = self.more_nodes[more_node]
+        self.limits[node] = self.limits.get(node, MAX_CHILDREN) + MAX_CHILDREN
+        self.sync_children(node)
+
+    def load_node(self, node):
+        """ディレクトリのノードを読み直す. 開いているサブディレクトリも読み直します."""
+        # 読んでいる間の変更を取りこぼさないよう、読む前に監視を始める
+        _, abspath, _ = self.nodes[node]
+        self.watched[abspath] = node
+        self.watcher.watch(abspath)
+        self.sync_children(node)
+        for child in self.tree.get_children(node):
+            if child in self.nodes:
+                self.refresh_node(child)
+
+    def refresh_node(self, node):
+        """開いているディレクトリならば読み直す.
+
+        開いていないが一度読んだディレクトリは、次に開いた時に読み直すよう印を付けるだけにします。
+        そのため、更新にかかる時間は開いているディレクトリの数で決まります。
+
+        """
+        loaded, abspath, is_dir = self.nodes[node]
+        if not is_dir:
+            return
+        if self.tree.item(node, 'open'):
+            self.load_node(node)
+        elif loaded:
+            self.nodes[node] = (False, abspath, True)
+            self.unwatch_node(abspath)
+
+    def unwatch_node(self, abspath):
+        """ディレクトリの変更の監視をやめる."""
+        self.watcher.unwatch(abspath)
+        self.watched.pop(abspath, None)
 
     def open_node(self, event):
-        """ディレクトリを開いた際に呼び出される..
+        """ディレクトリを開いた際に呼び出される.
 
-        self.nodes[node][0]がFalseの場合はまだ開かれたことがないと判断し、
+        self.nodes[node][0]がFalseの場合はまだ読んでいないか、読み直しが必要と判断し、
         そのディレクトリ内のパスを追加する
 
-        一度開いたか、又はファイルの場合はself.nodes[node][0]はTrueになります
+        一度読んだか、又はファイルの場合はself.nodes[node][0]はTrueになります
 
         """
         node = self.tree.focus()
-        already_open, abspath = self.nodes[node]
+        loaded, abspath, is_dir = self.nodes[node]
+        if is_dir and not loaded:
+            self.load_node(node)
+
+    def close_node(self, event):
+        """ディレクトリを閉じた際に呼び出される.
+
+        中のディレクトリも含めて監視をやめ、次に開いた時に読み直すよう印を付けます。
 
-        # まだ開かれたことのないディレクトリならば
-        if not already_open:
+        """
+        self.stale_node(self.tree.focus())
+
+    def stale_node(self, node):
+        """読んだディレクトリのノードとその子孫に、読み直しが必要な印を付ける."""
+        loaded, abspath, is_dir = self.nodes[node]
+        if not (is_dir and loaded):
+            return
+        self.nodes[node] = (False, abspath, True)
+        self.unwatch_node(abspath)
+        for child in self.tree.get_children(node):
+            if child in self.nodes:
+                self.stale_node(child)
 
-            # 空白の要素が追加されているので、消去
-            self.tree.delete(self.tree.get_children(node))
+    def check_changes(self):
+        """前回の確認から変更された、開いているディレクトリのノードだけを更新する.
 
-            # ディレクトリ内の全てのファイル・ディレクトリを取得し、Treeviewに追加
-            for entry in sorted(os.scandir(abspath), key=lambda path: path.name):
-                self.insert_node(
-                    node, entry.name, os.path.join(abspath, entry.path)
-                )
+        短い間に何度変更されても、ディレクトリごとに1回の更新にまとめられます。
 
-            # 一度開いたディレクトリはTrueにする
-            self.nodes[node] = (True, abspath)
+        """
+        for abspath in self.watcher.poll():
+            node = self.watched.get(abspath)
+            if node in self.nodes:
+                self.sync_children(node)
+                self.file_index.update_dir(abspath)
+        self.after(WATCH_INTERVAL, self.check_changes)
 
     def choose_file(self, event):
         """ツリーをダブルクリックで呼ばれる."""
         node = self.tree.focus()
+        if node in self.more_nodes:
+            self.show_more(node)
         # ツリーのノード自体をダブルクリックしているか?
-        if node:
-            already_open, abspath = self.nodes[node]
+        elif node in self.nodes:
+            _, abspath, _ = self.nodes[node]
             if os.path.isfile(abspath):
                 mediator.event.open_file(file_path=abspath)
 
     def update_dir(self, event=None):
-        """ツリーの一覧を更新する."""
-        self.create_widgets()
+        """ツリーの一覧を更新する. 開いているディレクトリだけを読み直します."""
+        for node in self.tree.get_children(''):
+            self.refresh_node(node)
+        self.symbol_index.refresh()
+        self.file_index.refresh()
+
+    def go_to_file(self, event=None):
+        """ルートディレクトリ以下のファイルを、パスのあいまい検索で開くボックスを作成する."""
+        create_go_to_file_box(self.file_index)
+        return 'break'
 
     def change_dir(self, event=None):
         """ツリーのルートディレクトリを変更する."""
         dir_name = filedialog.askdirectory()
         if dir_name:
-            self.root_path = dir_name
-            self.create_widgets()
+            self.root_path = os.path.abspath(dir_name)
+            self.tree.delete(*self.tree.get_children(''))
+            self.nodes.clear()
+            self.watcher.clear()
+            self.watched.clear()
+            for job, _ in self.loading.values():
+                self.after_cancel(job)
+            self.loading.clear()
+            self.more_nodes.clear()
+            self.limits.clear()
+            self.create_ignore()
+            self.insert_node('', self.root_path, self.root_path)
+            self.symbol_index.stop()
+            self.create_symbol_index()
+            self.file_index.stop()
+            self.create_file_index()
 
 
 if __name__ == '__main__':
@@ -121,6 +355,7 @@ if __name__ == '__main__':
     app.grid(column=0, row=0, sticky=(tk.N, tk.S, tk.E, tk.W))
     root.bind('<F4>', app.change_dir)
     root.bind('<F5>', app.update_dir)
+    root.bind('<Control-p>', app.go_to_file)
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
     root.mainloop()
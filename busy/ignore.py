@@ -0,0 +1,252 @@
+""".gitignoreと設定の無視リストで、パスを無視するか判定する機能を提供するモジュール.
+
+パターンは.gitignoreと同じ書き方です。
+
+    *.pyc       どの階層でも、名前が一致すれば無視
+    build/      ディレクトリだけ無視
+    /docs/_build  ルートからのパス
+    docs/**/*.png
+    !keep.pyc   それより前のパターンで無視したものを、無視しない
+
+パターンは読み込んだ際に正規表現にまとめてコンパイルするので、判定の度に解析はしません。
+.gitignoreはディレクトリごとに、最初に必要になった時に読み込みます。
+
+"""
+import os
+import re
+
+# 設定で無視リストを指定しなかった場合に使うパターン
+DEFAULT_IGNORE = ['.git/', '.hg/', '.svn/', '__pycache__/', '*.pyc', '.DS_Store']
+
+
+def translate(pattern):
+    """.gitignoreのパターン(先頭の!と末尾の/は除いたもの)を、正規表現の文字列にする."""
+    # /を含むパターンは.gitignoreのあるディレクトリからのパス、含まなければ名前に一致する
+    anchored = '/' in pattern
+    pattern = pattern.lstrip('/')
+    result = [] if anchored else ['(?:.*/)?']
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            result.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            result.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            result.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            result.append('[^/]')
+            i += 1
+        elif pattern[i] == '[':
+            end = pattern.find(']', i + 2)
+            if end < 0:
+                result.append(re.escape('['))
+                i += 1
+                continue
+            body = pattern[i+1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            result.append('[{0}]'.format(body.replace('\\', '\\\\')))
+            i = end + 1
+        else:
+            if pattern[i] == '\\' and i + 1 < len(pattern):
+                i += 1
+            result.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(result)
+
+
+class IgnoreRules:
+    """1つの.gitignore(又は無視リスト)のパターンを、コンパイルしたもの."""
+
+    def __init__(self, patterns):
+        """初期化.
+
+        args:
+            patterns: .gitignoreの各行のリスト
+
+        """
+        self.rules = []  # (正規表現, 否定か, ディレクトリだけか)
+        for line in patterns:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            negate = line.startswith('!')
+            if negate:
+                line = line[1:]
+            dir_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                self.rules.append((translate(line), negate, dir_only))
+
+        # 否定がなければ、全てのパターンを1つの正規表現にまとめる
+        self.has_negation = any(negate for _, negate, _ in self.rules)
+        if self.has_negation:
+            self.compiled = [
+                (re.compile(regex + r'\Z'), negate, dir_only)
+                for regex, negate, dir_only in self.rules
+            ]
+        else:
+            self.file_regex = self._join(
+                regex for regex, _, dir_only in self.rules if not dir_only)
+            self.dir_regex = self._join(regex for regex, _, _ in self.rules)
+
+    @staticmethod
+    def _join(regexes):
+        regexes = list(regexes)
+        if not regexes:
+            return None
+        return re.compile('(?:{0})\\Z'.format('|'.join(regexes)))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def match(self, rel_path, is_dir):
+        """パスを無視するならTrue、無視しないならFalse、どのパターンにも一致しなければNone.
+
+        args:
+            rel_path: .gitignoreのあるディレクトリからの、/区切りのパス
+            is_dir: ディレクトリならばTrue
+
+        """
+        if not self.has_negation:
+            regex = self.dir_regex if is_dir else self.file_regex
+            if regex is not None and regex.match(rel_path):
+                return True
+            return None
+
+        # 否定がある場合は、最後に一致したパターンで決まる
+        result = None
+        for regex, negate, dir_only in self.compiled:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                result = not negate
+        return result
+
+
+class IgnoreMatcher:
+    """ルートディレクトリ以下のパスを、無視リストと.gitignoreで判定するクラス."""
+
+    def __init__(self, root_path, patterns=DEFAULT_IGNORE):
+        """初期化.
+
+        args:
+            root_path: ルートディレクトリ
+            patterns: .gitignoreに加えて使う、無視するパターンのリスト
+
+        """
+        self.root_path = os.path.abspath(root_path)
+        self.global_rules = IgnoreRules(patterns)
+        self.dir_rules = {}  # ルートからの/区切りのディレクトリのパス: IgnoreRules
+        self.chains = {}  # ルートからの/区切りのディレクトリのパス: get_chainの結果
+
+    def get_rules(self, rel_dir):
+        """ディレクトリの.gitignoreのIgnoreRulesを返す. 一度読んだものは使い回す."""
+        rules = self.dir_rules.get(rel_dir)
+        if rules is None:
+            path = os.path.join(self.root_path, rel_dir, '.gitignore')
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    rules = IgnoreRules(file.read().splitlines())
+            except (OSError, UnicodeDecodeError):
+                rules = IgnoreRules([])
+            self.dir_rules[rel_dir] = rules
+        return rules
+
+    def get_chain(self, rel_dir):
+        """ルートからrel_dirまでの各ディレクトリの、パターンのある.gitignoreのリストを返す.
+
+        return:
+            [(ルートからの/区切りのディレクトリのパス, IgnoreRules), ...] 浅い順
+        """
+        chain = self.chains.get(rel_dir)
+        if chain is None:
+            if rel_dir:
+                parent, _, _ = rel_dir.rpartition('/')
+                chain = list(self.get_chain(parent))
+            else:
+                chain = []
+            rules = self.get_rules(rel_dir)
+            if rules:
+                chain.append((rel_dir, rules))
+            self.chains[rel_dir] = chain
+        return chain
+
+    def forget(self, rel_dir):
+        """ディレクトリの.gitignoreが変更された場合に、読み直すようにする."""
+        self.dir_rules.pop(rel_dir, None)
+        self.chains.clear()
+
+    def to_rel_dir(self, path):
+        """ディレクトリの絶対パスを、ルートからの/区切りのパスにする. ルートならば空文字."""
+        rel_dir = os.path.relpath(path, self.root_path).replace(os.sep, '/')
+        return '' if rel_dir == '.' else rel_dir
+
+    def is_ignored(self, path, is_dir):
+        """パスを無視するならばTrueを返す.
+
+        親ディレクトリは無視されていないものとして、そのパス自体を判定します。
+
+        args:
+            path: ルートディレクトリ以下の絶対パス
+            is_dir: ディレクトリならばTrue
+
+        """
+        rel_dir = self.to_rel_dir(os.path.dirname(path))
+        return self.is_ignored_name(rel_dir, os.path.basename(path), is_dir)
+
+    def is_ignored_name(self, rel_dir, name, is_dir):
+        """ディレクトリ内の名前を無視するならばTrueを返す.
+
+        同じディレクトリの多くのパスを判定する場合は、is_ignoredよりもこちらが速くなります。
+
+        args:
+            rel_dir: to_rel_dirで作った、ディレクトリのパス
+            name: ファイル・ディレクトリ名
+            is_dir: ディレクトリならばTrue
+
+        """
+        rel_path = rel_dir + '/' + name if rel_dir else name
+        result = self.global_rules.match(rel_path, is_dir)
+
+        # 深い階層の.gitignoreほど優先される
+        for base, rules in self.get_chain(rel_dir):
+            matched = rules.match(rel_path[len(base) + 1:] if base else rel_path, is_dir)
+            if matched is not None:
+                result = matched
+        return bool(result)
+
+
+def iter_files(root_path, patterns=DEFAULT_IGNORE):
+    """ルートディレクトリ以下の、無視するパス以外のファイルの絶対パスを返すイテレータ.
+
+    シンボリックリンクのディレクトリは、循環しないよう辿りません。
+
+    """
+    matcher = IgnoreMatcher(root_path, patterns)
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        dir_path = os.path.join(matcher.root_path, rel_dir)
+        try:
+            entries = sorted(os.scandir(dir_path), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        sub_dirs = []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                if is_dir and entry.is_symlink():
+                    continue
+            except OSError:
+                continue
+            if matcher.is_ignored_name(rel_dir, entry.name, is_dir):
+                continue
+            if is_dir:
+                sub_dirs.append(rel_dir + '/' + entry.name if rel_dir else entry.name)
+            else:
+                yield entry.path
+        stack.extend(reversed(sub_dirs))
@@ -0,0 +1,531 @@
+"""flake8をバックグラウンドで実行する機能を提供するモジュール.
+
+flake8の実行は、常駐させたlintサーバー(busy.lintserver)のプロセスで行い、Tkのスレッドは止めません。
+サーバーは最初のチェックの際に起動し、異常終了した場合は次のチェックで起動し直します。
+サーバーを起動できない場合は、このプロセスのスレッドでflake8を実行します。
+
+結果はスレッドセーフなキューに入り、Tkのスレッドが定期的に取り出してコールバックに渡します。
+実行中に新しいチェックを依頼した場合、古いチェックの結果は捨てられます。
+
+LintCacheは、ファイルの内容、flake8の設定とバージョンから作ったキーで結果を保存します。
+内容を変えずに保存し直した場合は、flake8を実行せずに前回の結果を使えます。
+
+ProjectLinterは、ディレクトリ以下の全てのPythonファイルを、CPUの数のプロセスで分担してチェックします。
+
+"""
+import atexit
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import subprocess
+import sys
+import threading
+import traceback
+from collections import OrderedDict
+from concurrent.futures import (
+    Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor,
+)
+
+from busy import mediator
+from busy.lintserver import handle_request, lint_sources
+from busy.utils import get_flake8_config_key, iter_python_files
+
+POLL_INTERVAL = 50  # 結果を確認する間隔(ミリ秒)
+MAX_FAILURES = 3  # サーバーが続けてこの回数異常終了したら、起動をやめる
+LINT_CACHE_SIZE = 4096  # メモリに保持しておく結果の数。プロジェクト全体のチェックの分も入る
+PROJECT_CHUNK_SIZE = 8  # プロジェクトのチェックで、1つのプロセスにまとめて渡すファイルの数
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.busy_cache', 'lint')
+
+_server = None
+_cache = None
+_project_executor = None
+
+
+def set_future_result(future, result):
+    """Futureに結果を設定する. 取り消されていれば何もしない."""
+    try:
+        future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+class LintServer:
+    """lintサーバーのプロセスを管理し、チェックを依頼するクラス."""
+
+    def __init__(self):
+        self.process = None
+        self.pending = {}  # 依頼の番号: (Future, 依頼の辞書, 依頼したプロセス)
+        self.next_id = 0
+        self.failures = 0  # サーバーが続けて異常終了した回数
+        self.lock = threading.Lock()
+        self.fallback = None  # サーバーを使えない場合に、flake8を実行するスレッド
+
+    def start(self):
+        """サーバーのプロセスを起動する."""
+        # カレントディレクトリがどこでも、このbusyパッケージをインポートできるようにする
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(
+            path for path in (PACKAGE_ROOT, env.get('PYTHONPATH')) if path)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'busy.lintserver'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, encoding='utf-8', bufsize=1, env=env,
+        )
+        thread = threading.Thread(
+            target=self._read, args=(self.process,), daemon=True)
+        thread.start()
+
+    def stop(self):
+        """サーバーのプロセスを終了する."""
+        process = self.process
+        self.process = None
+        if process is not None and process.poll() is None:
+            try:
+                process.stdin.close()  # 標準入力を閉じると、サーバーは終了する
+                process.wait(timeout=1)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+
+    def submit(self, *paths):
+        """ファイルのflake8のチェックを依頼する.
+
+        return:
+            結果出力の文字列を受け取るFuture
+        """
+        return self.request({'paths': list(paths)})
+
+    def submit_source(self, source, path=None):
+        """保存されていないソースコードの、flake8のチェックを依頼する.
+
+        args:
+            source: チェックするソースコード
+            path: 結果に表示するファイルのパス
+
+        return:
+            結果出力の文字列を受け取るFuture
+        """
+        return self.request({'source': source, 'path': path})
+
+    def request(self, request):
+        """サーバーに依頼を送る. サーバーを使えなければ、このプロセスで実行する.
+
+        返したFutureを取り消すと、サーバーにも取消を送ります。
+
+        """
+        if self.failures < MAX_FAILURES:
+            future = Future()
+            try:
+                if self.process is None or self.process.poll() is not None:
+                    self.start()
+                with self.lock:
+                    self.next_id += 1
+                    request_id = self.next_id
+                    self.pending[request_id] = (future, request, self.process)
+                self._write(dict(request, id=request_id))
+                future.add_done_callback(
+                    lambda future: self._on_done(request_id, future))
+                return future
+            except OSError:
+                # 起動できなかったか、書き込む前に終了していた
+                self.failures += 1
+                with self.lock:
+                    if self.next_id in self.pending:
+                        del self.pending[self.next_id]
+        return self.run_fallback(request)
+
+    def _write(self, message):
+        """サーバーの標準入力に、1行のJSONを書き込む."""
+        self.process.stdin.write(json.dumps(message) + '\n')
+        self.process.stdin.flush()
+
+    def _on_done(self, request_id, future):
+        """Futureが取り消された場合、サーバーにも取消を送る."""
+        if not future.cancelled():
+            return
+        with self.lock:
+            entry = self.pending.pop(request_id, None)
+        if entry is not None and entry[2] is self.process:
+            try:
+                self._write({'cancel': request_id})
+            except (OSError, ValueError):
+                pass
+
+    def run_fallback(self, request):
+        """このプロセスのスレッドで、flake8を実行する."""
+        if self.fallback is None:
+            self.fallback = ThreadPoolExecutor(max_workers=1)
+        return self.fallback.submit(handle_request, request)
+
+    def _read(self, process):
+        """サーバーからの結果を読み、Futureに設定する. スレッドで実行されます."""
+        for line in process.stdout:
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            with self.lock:
+                future, _, _ = self.pending.pop(
+                    response.get('id'), (None, None, None))
+            if future is not None:
+                self.failures = 0
+                set_future_result(future, response.get('output', ''))
+
+        # サーバーが終了した。結果の返っていない依頼は、このプロセスで実行し直す
+        with self.lock:
+            lost = [
+                (request_id, future, request)
+                for request_id, (future, request, owner) in self.pending.items()
+                if owner is process
+            ]
+            for request_id, _, _ in lost:
+                del self.pending[request_id]
+        if process.wait() != 0 and process is self.process:
+            self.failures += 1
+        for _, future, request in lost:
+            if not future.cancelled():
+                self.run_fallback(request).add_done_callback(
+                    lambda done, future=future:
+                        set_future_result(future, done.result()))
+
+
+class LintCache:
+    """flake8の結果を、ファイルの内容のハッシュ等をキーにして保存するクラス.
+
+    メモリ上には最近使ったsize個の結果を保持します。
+    cache_dirを渡した場合は、ディスクにも保存します。
+
+    """
+
+    def __init__(self, size=LINT_CACHE_SIZE, cache_dir=None):
+        """初期化.
+
+        args:
+            size: メモリに保持しておく結果の数
+            cache_dir: 結果を保存するディレクトリ。Noneならばディスクには保存しない
+
+        """
+        self.size = size
+        self.cache_dir = cache_dir
+        self.cache = OrderedDict()  # キー: 結果出力
+        self.lock = threading.Lock()  # プロジェクトのチェックでは、他のスレッドからも使う
+
+    @staticmethod
+    def get_key(path, src):
+        """キーを返す.
+
+        結果出力にはファイルのパスが含まれるので、パスもキーに含めます。
+
+        args:
+            path: ファイルのパス
+            src: ファイルの内容
+
+        """
+        digest = hashlib.sha1(get_flake8_config_key().encode('utf-8'))
+        digest.update(os.path.abspath(path).encode('utf-8') + b'\0')
+        digest.update(src.encode('utf-8', 'surrogatepass'))
+        return digest.hexdigest()
+
+    def get_cache_path(self, key):
+        """結果をディスクに保存するパスを返す."""
+        return os.path.join(self.cache_dir, key + '.txt')
+
+    def get(self, key):
+        """保存した結果出力を返す. なければNoneを返す."""
+        with self.lock:
+            output = self.cache.get(key)
+            if output is not None:
+                self.cache.move_to_end(key)
+                return output
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self.get_cache_path(key), 'r', encoding='utf-8') as file:
+                output = file.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+        self._add(key, output)
+        return output
+
+    def set(self, key, output):
+        """結果出力を保存する."""
+        self._add(key, output)
+        if self.cache_dir is None:
+            return
+        cache_path = self.get_cache_path(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as file:
+                file.write(output)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+
+    def _add(self, key, output):
+        """メモリ上に結果出力を追加し、古いものを捨てる."""
+        with self.lock:
+            self.cache[key] = output
+            self.cache.move_to_end(key)
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+
+def get_lint_cache():
+    """全てのエディタで共有する、flake8の結果のキャッシュを返す.
+
+    busy_settings.jsonで"lint_cache_disk"をtrueにすると、ディスクにも保存します。
+
+    """
+    global _cache
+    if _cache is None:
+        use_disk = mediator.busy_settings.get('lint_cache_disk', False)
+        _cache = LintCache(cache_dir=LINT_CACHE_DIR if use_disk else None)
+    return _cache
+
+
+def get_project_executor():
+    """プロジェクトのチェックに使うプロセスプールを返す.
+
+    Tkのプロセスをforkしないよう、プロセスはspawnで作ります。
+    各プロセスはflake8のスタイルガイドを使い回すので、2回目以降のチェックは速くなります。
+
+    """
+    global _project_executor
+    if _project_executor is None:
+        _project_executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _project_executor
+
+
+def reset_project_executor():
+    """壊れたプロセスプールを捨てる. 次のチェックで作り直されます."""
+    global _project_executor
+    if _project_executor is not None:
+        _project_executor.shutdown(wait=False, cancel_futures=True)
+        _project_executor = None
+
+
+def get_lint_server():
+    """lintサーバーを返す. サーバーのプロセスは最初のチェックの際に起動します."""
+    global _server
+    if _server is None:
+        _server = LintServer()
+        atexit.register(_server.stop)
+    return _server
+
+
+class LintRunner:
+    """flake8をバックグラウンドで実行し、最新の結果だけをコールバックに渡すクラス."""
+
+    def __init__(self, widget, callback):
+        """初期化.
+
+        args:
+            widget: afterでの定期実行に使うウィジェット
+            callback: flake8の結果出力を受け取る関数。Tkのスレッドから呼ばれます
+
+        """
+        self.widget = widget
+        self.callback = callback
+        self.results = queue.Queue()  # (番号, Future)
+        self.generation = 0  # チェックを依頼する度に増える番号
+        self.future = None  # 最新のチェック
+        self.poll_job = None
+
+    def submit(self, *path):
+        """ファイルのflake8のチェックを依頼する. 前のチェックの結果は不要になる."""
+        self._submit(lambda server: server.submit(*path))
+
+    def submit_source(self, source, path=None):
+        """保存されていないソースコードの、flake8のチェックを依頼する."""
+        self._submit(lambda server: server.submit_source(source, path))
+
+    def _submit(self, func):
+        """funcにlintサーバーを渡して依頼し、結果を待つ. 前のチェックは取り消す."""
+        self.generation += 1
+        generation = self.generation
+        if self.future is not None:
+            self.future.cancel()  # まだ始まっていなければ取り消す
+
+        self.future = func(get_lint_server())
+        self.future.add_done_callback(
+            lambda future: self.results.put((generation, future)))
+
+        if self.poll_job is None:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def _poll(self):
+        """キューに届いた結果のうち、最新のチェックの結果をコールバックに渡す."""
+        self.poll_job = None
+        latest = None
+        while True:
+            try:
+                generation, future = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self.generation and not future.cancelled():
+                latest = future
+
+        if latest is not None:
+            self.future = None
+            try:
+                output = latest.result()
+            except Exception:
+                output = traceback.format_exc()
+            self.callback(output)
+
+        if self.future is not None:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def cancel(self):
+        """実行中のチェックの結果を受け取らないようにする."""
+        self.generation += 1
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+        if self.poll_job is not None:
+            self.widget.after_cancel(self.poll_job)
+            self.poll_job = None
+
+
+class ProjectLinter:
+    """ディレクトリ以下の全てのPythonファイルに、flake8を並列に実行するクラス.
+
+    ファイルの一覧作りと読み込みはスレッドで行い、読んだそばからプロセスプールに渡します。
+    内容が前回のチェックから変わっていないファイルは、LintCacheの結果を使います。
+    結果はファイルごとに、チェックが終わった順にコールバックへ渡されます。
+
+    """
+
+    def __init__(self, widget, on_result, on_progress):
+        """初期化.
+
+        args:
+            widget: afterでの定期実行に使うウィジェット
+            on_result: 結果出力のリストを受け取る関数。問題のなかったファイルの分は含まれません
+            on_progress: (チェックしたファイル数, 全体のファイル数, 終わったか)を受け取る関数
+
+        全体のファイル数は、ファイルの一覧を作り終わるまではNoneです。
+        どちらの関数もTkのスレッドから呼ばれます。
+
+        """
+        self.widget = widget
+        self.on_result = on_result
+        self.on_progress = on_progress
+        self.results = queue.Queue()  # (番号, 結果出力のリスト, ファイル数) か (番号, None, 全体のファイル数)
+        self.generation = 0  # チェックを始める度に増える番号
+        self.futures = set()  # 実行中のチェック
+        self.lock = threading.Lock()
+        self.checked = 0
+        self.total = None
+        self.poll_job = None
+
+    def start(self, root_path):
+        """root_path以下のチェックを始める. 前のチェックは取り消す."""
+        self.cancel()
+        self.checked = 0
+        self.total = None
+        thread = threading.Thread(
+            target=self._collect, args=(self.generation, root_path), daemon=True)
+        thread.start()
+        self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def cancel(self):
+        """チェックを取り消す. 実行中のファイルの結果は受け取らない."""
+        self.generation += 1
+        with self.lock:
+            futures, self.futures = self.futures, set()
+        for future in futures:
+            future.cancel()
+        if self.poll_job is not None:
+            self.widget.after_cancel(self.poll_job)
+            self.poll_job = None
+
+    def _collect(self, generation, root_path):
+        """ファイルを読んでプロセスプールに渡す. スレッドで実行されます."""
+        cache = get_lint_cache()
+        chunk = []
+        total = 0
+        for path in iter_python_files(root_path):
+            if generation != self.generation:
+                return
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    source = file.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            total += 1
+            key = cache.get_key(path, source)
+            output = cache.get(key)
+            if output is not None:
+                self.results.put((generation, [output], 1))
+                continue
+            chunk.append((key, path, source))
+            if len(chunk) >= PROJECT_CHUNK_SIZE:
+                self._submit(generation, chunk)
+                chunk = []
+        if chunk:
+            self._submit(generation, chunk)
+        self.results.put((generation, None, total))
+
+    def _submit(self, generation, chunk):
+        """ファイルのまとまりを、プロセスプールに渡す."""
+        try:
+            future = get_project_executor().submit(lint_sources, chunk)
+        except RuntimeError:
+            # プロセスプールが壊れているか、終了している
+            reset_project_executor()
+            future = get_project_executor().submit(lint_sources, chunk)
+        with self.lock:
+            if generation != self.generation:
+                future.cancel()
+                return
+            self.futures.add(future)
+        future.add_done_callback(
+            lambda future: self._on_done(generation, future, len(chunk)))
+
+    def _on_done(self, generation, future, count):
+        """チェックが終わったまとまりの結果を、保存してキューに入れる."""
+        with self.lock:
+            self.futures.discard(future)
+        if future.cancelled():
+            return
+        try:
+            results = future.result()
+        except Exception:
+            reset_project_executor()
+            self.results.put((generation, [traceback.format_exc()], count))
+            return
+        cache = get_lint_cache()
+        for key, _, output in results:
+            cache.set(key, output)
+        self.results.put((generation, [output for _, _, output in results], count))
+
+    def _poll(self):
+        """キューに届いた結果と進み具合を、コールバックに渡す."""
+        self.poll_job = None
+        outputs = []
+        while True:
+            try:
+                generation, chunk, count = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation:
+                continue
+            if chunk is None:
+                self.total = count
+            else:
+                self.checked += count
+                outputs.extend(output for output in chunk if output)
+
+        if outputs:
+            self.on_result(outputs)
+        finished = self.total is not None and self.checked >= self.total
+        self.on_progress(self.checked, self.total, finished)
+        if not finished:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
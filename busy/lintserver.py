@@ -0,0 +1,145 @@
+"""flake8を常駐させて実行する、lintサーバーのモジュール.
+
+flake8のプラグインの読み込みや設定の解析は時間がかかるので、
+サーバーはスタイルガイドを一度だけ作り、チェックの度に使い回します。
+設定ファイル(setup.cfg、tox.ini、.flake8)が変更された場合だけ、作り直します。
+
+標準入力から1行1つのJSONで依頼を受け取り、標準出力に1行1つのJSONで結果を返します。
+
+    依頼: {"id": 1, "paths": ["a.py"]}
+    依頼: {"id": 2, "source": "import os\n", "path": "a.py"}  # 保存されていない内容のチェック
+    取消: {"cancel": 2}  # まだ始めていない依頼を取り消す。結果は返さない
+    結果: {"id": 1, "output": "a.py:1:1: F401 ..."}
+
+標準入力が閉じられると終了します。
+
+    python -m busy.lintserver
+    python -m busy.lintserver --benchmark a.py  # 1回のチェックにかかる時間を比べる
+
+"""
+import argparse
+import json
+import queue
+import statistics
+import sys
+import threading
+import time
+
+from flake8.api import legacy as flake8
+
+from busy.utils import OutputFormatter, run_flake8, run_flake8_source
+
+
+def handle_request(request):
+    """依頼の内容でflake8を実行し、結果出力を返す."""
+    if 'source' in request:
+        return run_flake8_source(request['source'], request.get('path'))
+    return run_flake8(*request.get('paths', []))
+
+
+def lint_sources(sources):
+    """複数のソースコードをチェックする. プロジェクトのチェックで、プロセスプールから呼ばれます.
+
+    args:
+        sources: (キー, ファイルのパス, ソースコード)のリスト
+
+    return:
+        (キー, ファイルのパス, 結果出力)のリスト
+    """
+    return [
+        (key, path, run_flake8_source(source, path))
+        for key, path, source in sources
+    ]
+
+
+def serve(stdin, stdout):
+    """依頼を受け取り、結果を返す. 標準入力が閉じられるまで続けます.
+
+    依頼はスレッドで読んでキューに溜めるので、チェックの実行中に届いた取消も反映されます。
+
+    """
+    requests = queue.Queue()
+    cancelled = set()  # 取り消された依頼の番号
+    lock = threading.Lock()
+
+    def read():
+        for line in stdin:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                continue
+            if 'cancel' in request:
+                with lock:
+                    cancelled.add(request['cancel'])
+            else:
+                requests.put(request)
+        requests.put(None)
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        request_id = request.get('id')
+        with lock:
+            skip = request_id in cancelled
+            if isinstance(request_id, int):
+                # 番号は増えていくので、これより前の取消はもう使われない
+                cancelled.difference_update(
+                    [i for i in cancelled if i <= request_id])
+        if skip:
+            continue
+        response = {'id': request_id, 'output': handle_request(request)}
+        stdout.write(json.dumps(response) + '\n')
+        stdout.flush()
+
+
+def benchmark(paths, count=10):
+    """1回のチェックにかかる時間を、方法ごとに比べて表示する.
+
+    args:
+        paths: チェックするファイルのパスのリスト
+        count: 各方法でチェックする回数
+
+    """
+    from busy.lint import LintServer
+
+    def measure(name, func):
+        times = []
+        for _ in range(count):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+        print('{0}: median {1:.1f}ms, max {2:.1f}ms'.format(
+            name, statistics.median(times), max(times)))
+
+    def cold():
+        # 以前の方法。チェックの度にスタイルガイドを作る
+        style_guide = flake8.get_style_guide()
+        style_guide.init_report(OutputFormatter)
+        style_guide.check_files(paths)
+
+    server = LintServer()
+    server.submit(*paths).result()  # サーバーの起動は計測に含めない
+    measure('cold style guide per save', cold)
+    measure('warm in-process', lambda: run_flake8(*paths))
+    measure('lint server', lambda: server.submit(*paths).result())
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='flake8 lint server')
+    parser.add_argument('--benchmark', nargs='+', metavar='PATH')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark)
+        return
+
+    # flake8が標準出力に何か書いても結果のJSONと混ざらないよう、標準エラー出力に向けておく
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    serve(sys.stdin, stdout)
+
+
+if __name__ == '__main__':
+    main()
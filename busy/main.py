@@ -50,8 +50,13 @@ class Busy(ttk.Frame):
         self.master.bind('<Control-KeyPress-d>', mediator.event.delete_tab)
         self.master.bind('<Control-KeyPress-n>', mediator.event.new_file)
         self.master.bind('<Control-KeyPress-o>', mediator.event.open_file)
+        self.master.bind('<Control-KeyPress-p>', mediator.event.go_to_file)
         self.master.bind('<F4>', mediator.event.change_dir)
         self.master.bind('<F5>', mediator.event.update_dir)
+        self.master.bind('<F6>', mediator.event.lint_project)
+        self.master.bind('<Control-Shift-KeyPress-F>', mediator.event.find_in_files)
+        self.master.bind('<F9>', mediator.event.run_file)
+        self.master.bind('<Shift-F9>', mediator.event.stop_run)
 
 
 def main():
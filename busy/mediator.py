@@ -91,6 +91,33 @@ class EventMediator(MockMediator):
         """スタイルチェック欄を更新する."""
         return self.info_frame.update_lint(text)
 
+    def lint_project(self, event=None):
+        """ツリーのルートディレクトリ以下を、全てスタイルチェックする."""
+        return self.info_frame.lint_project(self.path_frame.root_path)
+
+    def find_in_files(self, event=None):
+        """ツリーのルートディレクトリ以下の、全てのファイルから検索する."""
+        self.info_frame.find_in_files(self.path_frame.root_path)
+        return 'break'
+
+    def run_file(self, event=None):
+        """開いているファイルを保存して実行する."""
+        # 開いているエディタがなければ処理しない
+        if not self.note_frame.tabs():
+            return 'break'
+        current_editor = self.note_frame.get_current_editor()
+        if current_editor.changed or not current_editor.path:
+            self.save_file()
+        # 保存をキャンセルされた場合は実行しない
+        if current_editor.path:
+            self.info_frame.run_file(current_editor.path)
+        return 'break'
+
+    def stop_run(self, event=None):
+        """実行中のファイルを止める."""
+        self.info_frame.stop_run()
+        return 'break'
+
     def update_dir(self, event=None):
         """ツリーのディレクトリを更新する."""
         return self.path_frame.update_dir(event=event)
@@ -99,6 +126,14 @@ class EventMediator(MockMediator):
         """ツリーのルートディレクトリを変更する."""
         return self.path_frame.change_dir(event=event)
 
+    def get_symbol_index(self):
+        """ルートディレクトリ以下のシンボルの索引を返す."""
+        return self.path_frame.symbol_index
+
+    def go_to_file(self, event=None):
+        """ルートディレクトリ以下のファイルを、パスのあいまい検索で開く."""
+        return self.path_frame.go_to_file(event=event)
+
     def indent(self, event=None):
         """インデント."""
         # 開いているエディタがなければ処理しない
@@ -123,6 +158,22 @@ class EventMediator(MockMediator):
         current_editor = self.note_frame.get_current_editor()
         return current_editor.all_highlight(event=event)
 
+    def highlight_stats(self, event=None):
+        """ハイライトのタグ範囲の数等を表示する(デバッグ用)."""
+        # 開いているエディタがなければ処理しない
+        if not self.note_frame.tabs():
+            return 'break'
+        current_editor = self.note_frame.get_current_editor()
+        return current_editor.highlight_stats(event=event)
+
+    def go_to_line(self, line_no, event=None):
+        """開いているファイルの、指定した行に移動する."""
+        # 開いているエディタがなければ処理しない
+        if not self.note_frame.tabs():
+            return 'break'
+        current_editor = self.note_frame.get_current_editor()
+        return current_editor.go_to_line(line_no)
+
     def select_all(self, event=None):
         """テキスト全選択."""
         # 開いているエディタがなければ処理しない
@@ -149,7 +200,11 @@ class EventMediator(MockMediator):
 
     def change_tab_name(self, event=None):
         """タブ名に*を入れる"""
-        return self.note_frame.change_tab_name()
+        return self.note_frame.change_tab_name(event=event)
+
+    def get_editors(self):
+        """開いている全てのエディタを返す."""
+        return self.note_frame.get_editors()
 
     def save_as(self, event=None):
         """別名で保存."""
@@ -190,6 +245,30 @@ class SimpleMediator(EventMediator):
         """スタイルチェック欄を更新する."""
         pass
 
+    def lint_project(self, event=None):
+        """ツリーがないので、プロジェクトのチェックもない."""
+        pass
+
+    def find_in_files(self, event=None):
+        """ツリーがないので、ファイルを横断した検索もない."""
+        pass
+
+    def run_file(self, event=None):
+        """実行結果を表示する欄がないので、実行しない."""
+        pass
+
+    def stop_run(self, event=None):
+        """実行結果を表示する欄がないので、実行しない."""
+        pass
+
+    def get_symbol_index(self):
+        """ツリーがないので、シンボルの索引もない."""
+        return None
+
+    def go_to_file(self, event=None):
+        """ツリーがないので、ファイルの索引もない."""
+        pass
+
 
 event = MockMediator()
 
@@ -0,0 +1,192 @@
+"""エディタで開いているファイルを実行する機能を提供するモジュール.
+
+プロセスの出力はスレッドで読み、Tkのスレッドが定期的にまとめて受け取ります。
+読んだ出力は上限のあるバッファに溜めるので、大量に出力するプログラムでもTkが止まることはありません。
+上限を超えた分は古いものから捨て、捨てた文字数を代わりに表示します。
+
+"""
+import atexit
+import codecs
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+POLL_INTERVAL = 50  # 出力を確認する間隔(ミリ秒)
+READ_SIZE = 65536  # 一度に読む出力のバイト数
+MAX_PENDING = 256 * 1024  # Tkのスレッドに渡す前に溜めておく出力の文字数の上限
+KILL_TIMEOUT = 2000  # 停止を依頼してから、強制終了するまでの時間(ミリ秒)
+
+
+class OutputBuffer:
+    """スレッドから書き込み、Tkのスレッドから取り出す、上限のある出力のバッファ."""
+
+    def __init__(self, size=MAX_PENDING):
+        self.size = size
+        self.chunks = []
+        self.length = 0  # chunksの合計の文字数
+        self.dropped = 0  # 上限を超えて捨てた文字数
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        """出力を追加する. 上限を超えた分は、古いものから捨てる."""
+        with self.lock:
+            self.chunks.append(text)
+            self.length += len(text)
+            while self.length > self.size and len(self.chunks) > 1:
+                chunk = self.chunks.pop(0)
+                self.length -= len(chunk)
+                self.dropped += len(chunk)
+            if self.length > self.size:
+                # 1つの出力だけで上限を超えた場合は、末尾だけ残す
+                chunk = self.chunks[0]
+                self.chunks[0] = chunk[-self.size:]
+                self.dropped += len(chunk) - self.size
+                self.length = self.size
+
+    def read(self):
+        """溜まっている出力を全て取り出す."""
+        with self.lock:
+            text = ''.join(self.chunks)
+            if self.dropped:
+                text = '[... {0} characters skipped ...]\n'.format(self.dropped) + text
+            self.chunks = []
+            self.length = 0
+            self.dropped = 0
+        return text
+
+
+class ProcessRunner:
+    """コマンドをバックグラウンドで実行し、出力と終了を知らせるクラス."""
+
+    def __init__(self, widget, on_output, on_exit):
+        """初期化.
+
+        args:
+            widget: afterでの定期実行に使うウィジェット
+            on_output: 出力の文字列を受け取る関数
+            on_exit: (終了コード, 実行時間の秒数, 停止したか)を受け取る関数
+
+        どちらの関数もTkのスレッドから呼ばれます。
+
+        """
+        self.widget = widget
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.process = None
+        self.buffer = None
+        self.finished = None  # プロセスの出力を読み終え、終了したらセットされる
+        self.stopped = False
+        self.start_time = None
+        self.poll_job = None
+        self.kill_job = None
+        # 別のプロセスグループで実行するので、エディタを閉じても残らないようにする
+        atexit.register(self.kill)
+
+    @property
+    def running(self):
+        """実行中ならばTrue."""
+        return self.process is not None
+
+    def start(self, cmd, cwd=None):
+        """コマンドを実行する. 実行中のコマンドは強制終了する.
+
+        args:
+            cmd: 実行するコマンドのリスト
+            cwd: 実行するディレクトリ
+
+        """
+        self.kill()
+        self.stopped = False
+        self.buffer = OutputBuffer()
+        self.finished = threading.Event()
+
+        # 出力がバッファに溜まらず、すぐに読めるようにする
+        env = dict(os.environ, PYTHONUNBUFFERED='1', PYTHONIOENCODING='utf-8')
+        kwargs = {}
+        if sys.platform != 'win32':
+            # 子プロセスが作ったプロセスもまとめて止められるよう、プロセスグループを分ける
+            kwargs['start_new_session'] = True
+        self.process = subprocess.Popen(
+            cmd, cwd=cwd, env=env, stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs
+        )
+        self.start_time = time.perf_counter()
+        thread = threading.Thread(
+            target=self._read, args=(self.process, self.buffer, self.finished), daemon=True)
+        thread.start()
+        self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+
+    def _read(self, process, buffer, finished):
+        """プロセスの出力を読み、バッファに溜める. スレッドで実行されます."""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        fd = process.stdout.fileno()
+        while True:
+            # os.readは、読めた分だけをすぐに返す
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                break
+            buffer.write(decoder.decode(data))
+        buffer.write(decoder.decode(b'', final=True))
+        process.stdout.close()
+        process.wait()
+        finished.set()
+
+    def _poll(self):
+        """溜まった出力をまとめてコールバックに渡し、終了していれば知らせる."""
+        self.poll_job = None
+        finished = self.finished.is_set()  # 出力を取り出す前に確認し、取りこぼしを防ぐ
+        text = self.buffer.read()
+        if text:
+            self.on_output(text)
+        if not finished:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self._poll)
+            return
+
+        returncode = self.process.returncode
+        elapsed = time.perf_counter() - self.start_time
+        self.process = None
+        if self.kill_job is not None:
+            self.widget.after_cancel(self.kill_job)
+            self.kill_job = None
+        self.on_exit(returncode, elapsed, self.stopped)
+
+    def _send_signal(self, sig):
+        """プロセスに(プロセスグループがあればグループ全体に)シグナルを送る."""
+        try:
+            if sys.platform == 'win32':
+                if sig == signal.SIGTERM:
+                    self.process.terminate()
+                else:
+                    self.process.kill()
+            else:
+                os.killpg(self.process.pid, sig)
+        except OSError:
+            pass  # 既に終了していた
+
+    def stop(self):
+        """実行中のプロセスを停止する. 終了しなければ、しばらく後に強制終了する."""
+        if self.process is None or self.stopped:
+            return
+        self.stopped = True
+        self._send_signal(signal.SIGTERM)
+        self.kill_job = self.widget.after(KILL_TIMEOUT, self._kill)
+
+    def _kill(self):
+        """停止しなかったプロセスを、強制終了する."""
+        self.kill_job = None
+        if self.process is not None:
+            self._send_signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+
+    def kill(self):
+        """実行中のプロセスをすぐに強制終了する. 終了は知らせません."""
+        if self.process is None:
+            return
+        self._send_signal(getattr(signal, 'SIGKILL', signal.SIGTERM))
+        for job in (self.poll_job, self.kill_job):
+            if job is not None:
+                self.widget.after_cancel(job)
+        self.poll_job = self.kill_job = None
+        self.process = None
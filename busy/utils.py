@@ -1,17 +1,36 @@
 """便利な機能を集めたモジュール."""
 from contextlib import contextmanager
+import hashlib
 import io
+import operator
+import os
 import subprocess
 import sys
+import threading
 import traceback
 
+# SourceFileChecker等はflake8の内部のAPIを使うので、setup.pyでflake8のバージョンを6以上8未満に限る
+import flake8 as flake8_package
 from flake8.api import legacy as flake8
+from flake8.checker import FileChecker
+from flake8.formatting.default import Default
+from flake8.main.options import JobsArgument
+from flake8.processor import FileProcessor
 
 if sys.platform == 'win32':
     encoding = 'cp932'
 else:
     encoding = 'utf-8'
 
+FLAKE8_CONFIG_FILES = ('setup.cfg', 'tox.ini', '.flake8')
+SKIP_DIRS = {'__pycache__', 'node_modules'}  # プロジェクトのファイルを探す際に、辿らないディレクトリ名
+
+_style_guide = None  # プロセスごとに作る、flake8のスタイルガイド
+_style_guide_stamp = None  # スタイルガイドを作った時の、設定ファイルの更新日時
+_style_guide_lock = threading.Lock()
+_config_key = None  # 設定ファイルの内容のハッシュ
+_config_key_stamp = None  # _config_keyを作った時の、設定ファイルの更新日時
+
 
 def run_cmd(cmd):
     """コマンドを実行する.
@@ -40,26 +59,157 @@ def stdout_io():
     sys.stdout = old
 
 
+def iter_python_files(root_path):
+    """ルートディレクトリ以下の.pyファイルのパスを返すイテレータ."""
+    for dir_path, dir_names, file_names in os.walk(root_path):
+        dir_names[:] = [
+            name for name in dir_names
+            if not name.startswith('.') and name not in SKIP_DIRS
+        ]
+        for name in file_names:
+            if name.endswith('.py'):
+                yield os.path.join(dir_path, name)
+
+
+class OutputFormatter(Default):
+    """flake8の結果を、標準出力ではなくリストに溜めるフォーマッター."""
+
+    def after_init(self):
+        super().after_init()
+        self.lines = []
+
+    def _write(self, output):
+        self.lines.append(output)
+
+
+class SourceFileChecker(FileChecker):
+    """ファイルを読まず、渡された文字列をチェックするFileChecker."""
+
+    def __init__(self, *, source, **kwargs):
+        self.source = source
+        super().__init__(**kwargs)
+
+    def _make_processor(self):
+        return FileProcessor(
+            self.filename, self.options, lines=self.source.splitlines(True))
+
+
+def get_flake8_config_stamp():
+    """flake8が読む可能性のある設定ファイルの、(パス, 更新日時)のタプルを返す.
+
+    flake8はカレントディレクトリから親ディレクトリへと設定ファイルを探すので、
+    同じように辿って、存在するものを集めます。
+
+    """
+    stamp = []
+    directory = os.path.abspath(os.curdir)
+    while True:
+        for name in FLAKE8_CONFIG_FILES:
+            path = os.path.join(directory, name)
+            try:
+                stamp.append((path, os.stat(path).st_mtime))
+            except OSError:
+                pass
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return tuple(stamp)
+        directory = parent
+
+
+def get_flake8_config_key():
+    """flake8のバージョンと、読まれる設定ファイルの内容から作ったハッシュを返す.
+
+    設定ファイルは、更新日時が変わった場合だけ読み直します。
+
+    """
+    global _config_key, _config_key_stamp
+    stamp = get_flake8_config_stamp()
+    if _config_key is None or stamp != _config_key_stamp:
+        digest = hashlib.sha1(flake8_package.__version__.encode('utf-8'))
+        for path, _ in stamp:
+            digest.update(path.encode('utf-8'))
+            try:
+                with open(path, 'rb') as file:
+                    digest.update(file.read())
+            except OSError:
+                pass
+        _config_key = digest.hexdigest()
+        _config_key_stamp = stamp
+    return _config_key
+
+
+def get_style_guide():
+    """flake8のスタイルガイドを返す.
+
+    スタイルガイドの作成は時間がかかるので、一度作ったものを使い回します。
+    設定ファイルが変更されていれば作り直します。
+
+    """
+    global _style_guide, _style_guide_stamp
+    stamp = get_flake8_config_stamp()
+    if _style_guide is None or stamp != _style_guide_stamp:
+        # ファイルごとにプロセスを作らないよう、flake8自体の並列実行は行わない
+        style_guide = flake8.get_style_guide(jobs=JobsArgument('1'))
+        style_guide.init_report(OutputFormatter)
+        _style_guide = style_guide
+        _style_guide_stamp = stamp
+    return _style_guide
+
+
 def run_flake8(*path):
     """flake8を実行する.
 
     flake8を実行する場合は、run_cmdにflake8コマンドを渡すよりも
     こちらのほうが、一般的にパフォーマンスがよくなります
 
+    結果はsys.stdoutを差し替えずにフォーマッターから受け取るので、
+    他のスレッドの出力と混ざることはありません。
+
     args:
         path: flake8を実行するためのパス。複数渡せます
 
     return:
         flake8の結果出力
     """
-    output = ''
-    with stdout_io() as stdout:
-        error = ''
+    with _style_guide_lock:
+        try:
+            style_guide = get_style_guide()
+            formatter = style_guide._application.formatter
+            formatter.lines = []
+            style_guide.check_files(list(path))
+            return ''.join(line + '\n' for line in formatter.lines)
+        except Exception:
+            return traceback.format_exc()
+
+
+def run_flake8_source(source, path=None):
+    """保存されていないソースコードに、flake8を実行する.
+
+    ファイルに書き出さず、メモリ上の文字列をそのままチェックします。
+
+    args:
+        source: チェックするソースコード
+        path: 結果に表示するファイルのパス。per-file-ignores等の設定にも使われます
+
+    return:
+        flake8の結果出力
+    """
+    with _style_guide_lock:
         try:
-            style_guide = flake8.get_style_guide()
-            style_guide.check_files(path)
-        except:
-            error = traceback.format_exc()
-        finally:
-            output = stdout.getvalue() + error
-    return output
+            application = get_style_guide()._application
+            application.formatter.lines = []
+            checker = SourceFileChecker(
+                source=source, filename=path or 'stdin',
+                plugins=application.plugins.checkers, options=application.options,
+            )
+            filename, results, _ = checker.run_checks()
+            results.sort(key=operator.itemgetter(1, 2))
+            with application.guide.processing_file(filename):
+                for code, line_number, column, text, physical_line in results:
+                    application.guide.handle_error(
+                        code=code, filename=filename, line_number=line_number,
+                        column_number=column, text=text, physical_line=physical_line,
+                    )
+            return ''.join(line + '\n' for line in application.formatter.lines)
+        except Exception:
+            return traceback.format_exc()
@@ -0,0 +1,175 @@
+"""ディレクトリの変更を監視する機能を提供するモジュール.
+
+Linuxではinotifyを、それ以外では更新日時の比較を使います。
+どちらもpollを呼んだ時に、前回から中身が変わったディレクトリのパスをまとめて返すので、
+短い間に大量のファイルが変更されても、ディレクトリごとに1回の更新で済みます。
+
+    watcher = create_watcher()
+    watcher.watch('/path/to/dir')
+    changed = watcher.poll()  # {'/path/to/dir'}
+
+"""
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+
+# inotifyの定数(/usr/include/linux/inotify.h)
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+WATCH_MASK = (
+    IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_STRUCT = struct.Struct('iIII')  # wd, mask, cookie, len
+READ_SIZE = 65536
+
+
+def get_mtime(path):
+    """ディレクトリの更新日時を返す. なければNoneを返す."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class PollingWatcher:
+    """ディレクトリの更新日時を比べて、変更を調べるクラス.
+
+    ディレクトリの更新日時は、中のファイルが作成、削除、名前変更された際に変わります。
+    pollの度に、監視しているディレクトリの数だけstatを行います。
+
+    """
+
+    def __init__(self):
+        self.stamps = {}  # パス: 更新日時
+
+    def watch(self, path):
+        """ディレクトリの監視を始める."""
+        self.stamps[path] = get_mtime(path)
+
+    def unwatch(self, path):
+        """ディレクトリの監視をやめる."""
+        self.stamps.pop(path, None)
+
+    def clear(self):
+        """全てのディレクトリの監視をやめる."""
+        self.stamps.clear()
+
+    def poll(self):
+        """前回から中身が変わったディレクトリの、パスのsetを返す."""
+        changed = set()
+        for path, stamp in list(self.stamps.items()):
+            new_stamp = get_mtime(path)
+            if new_stamp != stamp:
+                self.stamps[path] = new_stamp
+                changed.add(path)
+        return changed
+
+
+class InotifyWatcher(PollingWatcher):
+    """inotifyで、ディレクトリの変更を調べるクラス.
+
+    イベントはpollの際にまとめて読みます(ノンブロッキング)。スレッドは使いません。
+    監視数の上限等でinotifyに登録できなかったディレクトリは、更新日時の比較で監視します。
+
+    """
+
+    def __init__(self, libc):
+        super().__init__()
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.wds = {}  # ウォッチ記述子: パス
+        self.paths = {}  # パス: ウォッチ記述子
+
+    def watch(self, path):
+        if path in self.paths:
+            return
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            super().watch(path)
+            return
+        self.wds[wd] = path
+        self.paths[path] = wd
+
+    def unwatch(self, path):
+        wd = self.paths.pop(path, None)
+        if wd is None:
+            super().unwatch(path)
+            return
+        self.wds.pop(wd, None)
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def clear(self):
+        for path in list(self.paths):
+            self.unwatch(path)
+        super().clear()
+
+    def poll(self):
+        changed = super().poll()
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self.fd, READ_SIZE)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+
+        offset = 0
+        while offset + EVENT_STRUCT.size <= len(data):
+            wd, mask, _, length = EVENT_STRUCT.unpack_from(data, offset)
+            offset += EVENT_STRUCT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # イベントを取りこぼしたので、全てのディレクトリを変更されたものとする
+                changed.update(self.paths)
+                continue
+            path = self.wds.get(wd)
+            if path is None:
+                continue
+            changed.add(path)
+            if mask & IN_IGNORED:
+                # ディレクトリが削除された等で、監視が外れた
+                del self.wds[wd]
+                del self.paths[path]
+        return changed
+
+    def close(self):
+        """inotifyのファイル記述子を閉じる."""
+        os.close(self.fd)
+
+
+def load_libc():
+    """inotifyを使えるlibcを返す. 使えなければNoneを返す."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+def create_watcher():
+    """使える中で最も効率の良い監視クラスのインスタンスを返す."""
+    libc = load_libc()
+    if libc is not None:
+        try:
+            return InotifyWatcher(libc)
+        except OSError:
+            pass
+    return PollingWatcher()
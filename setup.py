@@ -27,5 +27,6 @@ setup(
         'busy = busy.main:main',
         'busy-simple = busy.simple:main',
     ]},
-    install_requires=['flake8', 'Pygments'],
+    # busy.utilsはflake8の内部のAPIを使うので、動作を確かめたバージョンに限る
+    install_requires=['flake8>=6,<8', 'Pygments'],
 )
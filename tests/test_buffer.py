@@ -0,0 +1,70 @@
+import random
+import unittest
+from unittest import mock
+
+from busy.buffer import TextBuffer
+
+
+class TextBufferTest(unittest.TestCase):
+
+    def assertSameLines(self, buffer, lines):
+        self.assertEqual(buffer.get_lines(), lines)
+        self.assertEqual(buffer.line_count, len(lines))
+        self.assertEqual(buffer.char_count, len('\n'.join(lines)))
+
+    def test_replace_lines(self):
+        buffer = TextBuffer('a\nb\nc\nd')
+        buffer.replace_lines(2, 3, ['x'])
+        self.assertSameLines(buffer, ['a', 'x', 'd'])
+        buffer.replace_lines(1, 1, ['p', 'q', 'r'])
+        self.assertSameLines(buffer, ['p', 'q', 'r', 'x', 'd'])
+
+    def test_replace_all_lines(self):
+        buffer = TextBuffer('a\nb\nc')
+        buffer.replace_lines(1, 3, [])
+        self.assertSameLines(buffer, [''])
+
+    def test_offsets(self):
+        buffer = TextBuffer('spam\nham\negg')
+        self.assertEqual(buffer.index_to_offset(2, 1), 6)
+        self.assertEqual(buffer.offset_to_index(6), (2, 1))
+        self.assertEqual(buffer.offset_to_index(9), (3, 0))
+        self.assertEqual(buffer.get((1, 2), (3, 1)), 'am\nham\ne')
+
+    def test_copy(self):
+        # 複製は、元のバッファを編集しても変わらない
+        buffer = TextBuffer('a\nb\nc')
+        snapshot = buffer.copy()
+        buffer.replace_lines(2, 2, ['x', 'y'])
+        self.assertSameLines(snapshot, ['a', 'b', 'c'])
+        self.assertSameLines(buffer, ['a', 'x', 'y', 'c'])
+
+    def test_word_before(self):
+        buffer = TextBuffer('x = os.path\n    spam')
+        self.assertEqual(buffer.get_word_before(1, 11), ('os.path', 4))
+        self.assertEqual(buffer.get_word_before(2, 8), ('spam', 4))
+        self.assertEqual(buffer.get_word_before(2, 4), ('', 4))
+
+    @mock.patch('busy.buffer.BLOCK_SIZE', 4)
+    def test_random_edits(self):
+        # ブロックの分割とまとめが起きるよう、小さなブロックで試す
+        rand = random.Random(0)
+        lines = ['line{0}'.format(i) for i in range(50)]
+        buffer = TextBuffer('\n'.join(lines))
+        for _ in range(500):
+            first = rand.randint(1, len(lines))
+            last = rand.randint(first, min(first + 10, len(lines)))
+            new_lines = ['n{0}'.format(rand.randint(0, 99)) for _ in range(rand.randint(0, 12))]
+            buffer.replace_lines(first, last, new_lines)
+            lines[first-1:last] = new_lines
+            if not lines:
+                lines = ['']
+            self.assertSameLines(buffer, lines)
+            line = rand.randint(1, len(lines))
+            self.assertEqual(buffer.get_line(line), lines[line-1])
+            offset = buffer.index_to_offset(line, 1)
+            self.assertEqual(buffer.offset_to_index(offset), (line, min(1, len(lines[line-1]))))
+
+
+if __name__ == '__main__':
+    unittest.main()
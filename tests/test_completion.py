@@ -0,0 +1,64 @@
+import unittest
+
+from busy.codestyles.completion import FuzzyCompleter, PrefixIndex, fuzzy_score, get_key
+
+
+class PrefixIndexTest(unittest.TestCase):
+
+    def test_search(self):
+        index = PrefixIndex(['spam', 'ham', 'spam_egg', 'sp', 'spam'])
+        self.assertEqual(len(index), 4)
+        self.assertEqual(index.search('spa'), ['spam', 'spam_egg'])
+        self.assertEqual(index.search('sp', limit=2), ['sp', 'spam'])
+        self.assertEqual(index.search('x'), [])
+
+    def test_add_discard(self):
+        index = PrefixIndex()
+        index.add('spam')
+        index.add('ham')
+        index.add('spam')
+        self.assertEqual(index.names, ['ham', 'spam'])
+        self.assertIn('spam', index)
+        index.discard('spam')
+        index.discard('egg')
+        self.assertNotIn('spam', index)
+        self.assertEqual(index.names, ['ham'])
+
+
+class FuzzyCompleterTest(unittest.TestCase):
+
+    def test_fuzzy_score(self):
+        self.assertIsNotNone(fuzzy_score('gsi', get_key('get_symbol_index')))
+        self.assertIsNone(fuzzy_score('gz', get_key('get_symbol_index')))
+        # 単語の区切りで一致する方が上位
+        self.assertGreater(
+            fuzzy_score('si', get_key('symbol_index')), fuzzy_score('si', get_key('basis')))
+
+    def test_search(self):
+        completer = FuzzyCompleter(lambda: [
+            PrefixIndex(['get_symbol_index', 'gsi_value']),
+            PrefixIndex(['GetSomeItem', 'print']),
+        ])
+        self.assertEqual(completer.search('gsi'), ['gsi_value', 'get_symbol_index', 'GetSomeItem'])
+        # 何も入力していなければ、全ての候補を返す
+        self.assertEqual(
+            completer.search('', limit=3), ['get_symbol_index', 'gsi_value', 'GetSomeItem'])
+
+    def test_narrow(self):
+        # 入力が続いた場合は、前回一致した名前から絞り込む
+        index = PrefixIndex(['spam', 'spam_egg', 'ham'])
+        completer = FuzzyCompleter(lambda: [index])
+        self.assertEqual(completer.search('sp'), ['spam', 'spam_egg'])
+        index.add('spx')
+        self.assertEqual(completer.search('spe'), ['spam_egg'])
+        completer.reset()
+        self.assertEqual(completer.search('spx'), ['spx'])
+
+    def test_recent(self):
+        completer = FuzzyCompleter(lambda: [PrefixIndex(['spam', 'spam_egg'])])
+        completer.use('spam_egg')
+        self.assertEqual(completer.search('sp'), ['spam_egg', 'spam'])
+
+
+if __name__ == '__main__':
+    unittest.main()
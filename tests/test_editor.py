@@ -0,0 +1,161 @@
+import tkinter as tk
+import unittest
+
+from busy.buffer import TextBuffer
+from busy.findfiles import compile_text_replace
+from busy.frames.editor import CustomText, EditorFrame
+
+
+class FakeText:
+    """on_editを、Tkを使わずに試すためのTextの代わり."""
+
+    def __init__(self, text):
+        self.widget = TextBuffer(text)  # ウィジェットの内容
+        self.buffer = TextBuffer(text)
+        self.edit_listeners = []
+        self.edits = []
+        self.edit_listeners.append(lambda *args: self.edits.append(args))
+
+    def get(self, start, end):
+        start_line = int(start.split('.')[0])
+        end_line = int(end.split('.')[0])
+        return '\n'.join(self.widget.get_lines(start_line, end_line + 1))
+
+    def delete_newline(self, line):
+        """line行目の末尾の改行を消し、次の行とつなげる."""
+        lines = self.widget.get_lines()
+        lines[line-1:line+1] = [lines[line-1] + lines[line]]
+        self.widget.set_text('\n'.join(lines))
+
+
+class OnEditTest(unittest.TestCase):
+
+    def test_join_lines_with_narrow_range(self):
+        # 以前のwidget_proxyは、"delete insert-1c"で行がつながっても、その行だけを通知していた
+        text = FakeText('a = 1\nb = 2\nc = 3\nd = 4')
+        text.delete_newline(2)
+        CustomText.on_edit(text, 2, 2, -1)
+        self.assertEqual(text.buffer.get_text(), 'a = 1\nb = 2c = 3\nd = 4')
+        self.assertEqual(text.edits, [(2, 3, -1)])
+
+    def test_join_lines(self):
+        text = FakeText('a = 1\nb = 2\nc = 3\nd = 4')
+        text.delete_newline(2)
+        CustomText.on_edit(text, 2, 3, -1)
+        self.assertEqual(text.buffer.get_text(), 'a = 1\nb = 2c = 3\nd = 4')
+        self.assertEqual(text.edits, [(2, 3, -1)])
+
+
+class ReplaceText:
+    """replaceの呼び出しを記録する、Textの代わり. 位置は'行.0'か'行.end'だけを受け付ける."""
+
+    def __init__(self, text):
+        self.buffer = TextBuffer(text)
+        self.replaces = []
+
+    def replace(self, start, end, chars):
+        self.replaces.append((start, end, chars))
+        first = int(start.split('.')[0])
+        last = int(end.split('.')[0])
+        self.buffer.replace_lines(first, last, chars.split('\n'))
+
+
+class FakeEditorFrame:
+
+    def __init__(self, text):
+        self.text = ReplaceText(text)
+
+    def get_src(self):
+        return self.text.buffer.get_text()
+
+
+class ReplaceAllTest(unittest.TestCase):
+
+    def replace_all(self, src, query, replacement, use_regex=False):
+        frame = FakeEditorFrame(src)
+        regex, template = compile_text_replace(query, replacement, use_regex)
+        count = EditorFrame.replace_all(frame, regex, template)
+        return frame, count
+
+    def test_one_edit(self):
+        # 一致した最初の行から最後の行までを、1度に書き換える
+        frame, count = self.replace_all('a\nspam = 1\nb\nham(spam)\nc', 'spam', 'egg')
+        self.assertEqual(count, 2)
+        self.assertEqual(frame.text.replaces, [('2.0', '4.end', 'egg = 1\nb\nham(egg)')])
+        self.assertEqual(frame.get_src(), 'a\negg = 1\nb\nham(egg)\nc')
+
+    def test_same_as_whole_text(self):
+        src = 'def spam(a):\n    return ham(a)\n\nx = (\n    1)\n'
+        for query, replacement in [(r'(\w+)\((\w)\)', r'\2(\1)'), (r'\($\n', '['), ('^', '# ')]:
+            with self.subTest(query=query):
+                frame, _ = self.replace_all(src, query, replacement, use_regex=True)
+                regex, template = compile_text_replace(query, replacement, True)
+                self.assertEqual(frame.get_src(), regex.sub(template, src))
+
+    def test_non_bmp(self):
+        # Tkと文字の数え方が違う文字があっても、行単位で書き換えるのでずれない
+        frame, count = self.replace_all('x = "\U0001F600" + spam\nspam', 'spam', 'egg')
+        self.assertEqual(count, 2)
+        self.assertEqual(frame.text.replaces[0][:2], ('1.0', '2.end'))
+        self.assertEqual(frame.get_src(), 'x = "\U0001F600" + egg\negg')
+
+    def test_not_found(self):
+        frame, count = self.replace_all('spam', 'egg', 'ham')
+        self.assertEqual(count, 0)
+        self.assertEqual(frame.text.replaces, [])
+
+
+class CustomTextTest(unittest.TestCase):
+
+    def setUp(self):
+        try:
+            self.root = tk.Tk()
+        except tk.TclError:
+            self.skipTest('no display')
+        self.root.withdraw()
+        self.text = CustomText(self.root)
+        self.text.insert('1.0', 'a = 1\nb = 2\nc = 3\nd = 4')
+
+    def tearDown(self):
+        self.root.destroy()
+
+    def assertBufferMatches(self):
+        self.assertEqual(self.text.buffer.get_text(), self.text.get('1.0', 'end-1c'))
+
+    def test_insert(self):
+        self.text.insert('2.3', 'x\ny')
+        self.assertBufferMatches()
+        self.text.insert('end', '\ne = 5')
+        self.assertBufferMatches()
+
+    def test_backspace(self):
+        # BackSpaceのバインドと同じ、1つだけのインデックスでの削除
+        self.text.mark_set('insert', '3.0')
+        self.text.delete('insert-1c')
+        self.assertBufferMatches()
+        self.text.delete('insert-1c')
+        self.assertBufferMatches()
+
+    def test_delete(self):
+        # Deleteのバインドと同じ、1つだけのインデックスでの削除
+        self.text.mark_set('insert', '2.end')
+        self.text.delete('insert')
+        self.assertBufferMatches()
+        self.text.delete('end-1c')
+        self.assertBufferMatches()
+
+    def test_delete_range(self):
+        self.text.delete('1.2', '3.2')
+        self.assertBufferMatches()
+        self.text.delete('1.0', 'end')
+        self.assertBufferMatches()
+
+    def test_paste(self):
+        self.text.replace('2.0', '3.end', 'x = [\n    1,\n    2,\n]')
+        self.assertBufferMatches()
+        self.text.insert('1.3', 'p\nq\nr\n')
+        self.assertBufferMatches()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import tempfile
+import unittest
+
+from busy.fileindex import FileIndex, FileSearch, path_score
+
+
+def search(query, paths, limit=50):
+    file_search = FileSearch(query, [[(path, path.lower()) for path in paths]], limit)
+    file_search.run(10)
+    return file_search
+
+
+class PathScoreTest(unittest.TestCase):
+
+    def score(self, query, path):
+        return path_score(query, path, path.lower())
+
+    def test_no_match(self):
+        self.assertIsNone(self.score('xyz', 'busy/mediator.py'))
+
+    def test_name_first(self):
+        # ファイル名だけで一致するものは、パスの途中で一致するものより上位
+        self.assertGreater(self.score('med', 'a/mediator.py'), self.score('med', 'med/x/a.py'))
+
+    def test_boundary(self):
+        # 単語の区切りで一致するものが上位
+        self.assertGreater(self.score('fi', 'find_index.py'), self.score('fi', 'profile.py'))
+
+
+class FileSearchTest(unittest.TestCase):
+
+    def test_results(self):
+        paths = ['busy/mediator.py', 'busy/main.py', 'README.rst', 'tests/test_main.py']
+        self.assertEqual(search('main', paths).results(), ['busy/main.py', 'tests/test_main.py'])
+        self.assertEqual(search('main', paths, limit=1).results(), ['busy/main.py'])
+
+    def test_timeout(self):
+        # 時間切れの場合は途中で止まり、続きから検索できる
+        paths = ['spam{0}.py'.format(i) for i in range(10000)]
+        file_search = FileSearch('spam', [[(path, path) for path in paths]])
+        self.assertFalse(file_search.run(0))
+        while not file_search.run(0):
+            pass
+        self.assertEqual(len(file_search.matches), 10000)
+
+    def test_narrow(self):
+        file_search = search('ma', ['main.py', 'mediator.py', 'spam.py'])
+        narrowed = file_search.narrow('mai')
+        narrowed.run(10)
+        self.assertEqual(narrowed.results(), ['main.py'])
+
+
+class FileIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        for name in ('spam.py', 'sub/ham.py', 'build/out.py', '.gitignore'):
+            self.create(name)
+        with open(os.path.join(self.root, '.gitignore'), 'w') as file:
+            file.write('build/\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create(self, name):
+        path = os.path.join(self.root, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+    def build(self):
+        index = FileIndex(self.root)
+        index.rebuild = True
+        index._run()
+        return index
+
+    def paths(self, index):
+        return sorted(path for files in index.snapshot() for path, _ in files)
+
+    def test_build(self):
+        index = self.build()
+        self.assertEqual(self.paths(index), ['.gitignore', 'spam.py', 'sub/ham.py'])
+        self.assertEqual(len(index), 3)
+
+    def test_update_dir(self):
+        # 変更されたディレクトリだけを読み直す
+        index = self.build()
+        self.create('sub/egg.py')
+        self.create('sub/new/a.py')
+        os.remove(os.path.join(self.root, 'spam.py'))
+        index.pending.add(os.path.join(self.root, 'sub'))
+        index._run()
+        expected = ['.gitignore', 'spam.py', 'sub/egg.py', 'sub/ham.py', 'sub/new/a.py']
+        self.assertEqual(self.paths(index), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
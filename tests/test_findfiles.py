@@ -0,0 +1,318 @@
+import os
+import re
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from busy.findfiles import (
+    MAX_FILE_MATCHES, ProjectReplacer, ProjectSearcher, compile_query, compile_replacement,
+    replace_file, search_data, search_files,
+)
+
+
+def compile_regex(query, use_regex=False, match_case=False):
+    pattern, flags, _ = compile_query(query, use_regex, match_case)
+    return re.compile(pattern, flags)
+
+
+class FakeWidget:
+    """afterで予約した関数を、すぐに実行できるようにするウィジェットの代わり."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.job_count = 0
+
+    def after(self, ms, func, *args):
+        self.job_count += 1
+        self.jobs[self.job_count] = (func, args)
+        return self.job_count
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run_jobs(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while self.jobs and time.monotonic() < deadline:
+            func, args = self.jobs.pop(min(self.jobs))
+            func(*args)
+
+
+class FakeExecutor:
+    """渡された関数をすぐに実行するか、失敗・取り消しさせるプロセスプールの代わり."""
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)  # 渡された順に、送出する例外か'cancel'。Noneなら実行する
+
+    def submit(self, func, *args):
+        future = Future()
+        error = self.errors.pop(0) if self.errors else None
+        if error == 'cancel':
+            future.cancel()
+        elif error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(func(*args))
+        return future
+
+
+class SearchDataTest(unittest.TestCase):
+
+    def test_line_numbers(self):
+        data = b'spam\nham\nspam egg spam\n\nspam'
+        matches = search_data(data, compile_regex('spam'))
+        # 同じ行で何度一致しても、1つだけ
+        self.assertEqual(matches, [
+            (1, 'spam', None), (3, 'spam egg spam', None), (5, 'spam', None),
+        ])
+
+    def test_match_at_line_end(self):
+        # 行末の改行の位置で一致しても、その行の結果にする
+        data = b'a\nb\n'
+        matches = search_data(data, compile_regex('$', use_regex=True))
+        self.assertEqual([line_no for line_no, _, _ in matches], [1, 2, 3])
+
+    def test_crlf(self):
+        matches = search_data(b'spam\r\nham\r\n', compile_regex('HAM'))
+        self.assertEqual(matches, [(2, 'ham', None)])
+
+    def test_match_case(self):
+        self.assertEqual(search_data(b'Spam\nspam\n', compile_regex('spam', match_case=True)),
+                         [(2, 'spam', None)])
+
+    def test_max_file_matches(self):
+        data = b'spam\n' * (MAX_FILE_MATCHES + 10)
+        self.assertEqual(len(search_data(data, compile_regex('spam'))), MAX_FILE_MATCHES)
+
+    def test_preview(self):
+        compiled = compile_query(r'(\w+) = (\d)', use_regex=True)
+        template = compile_replacement(compiled, r'\1 = \2\2', use_regex=True)
+        matches = search_data(b'spam = 1\nham\n', re.compile(*compiled[:2]), template)
+        self.assertEqual(matches, [(1, 'spam = 1', 'spam = 11')])
+
+
+class SearchFilesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        files = {
+            'spam.py': b'import os\nspam = 1\n', 'ham.py': b'ham = 2\n',
+            'image.png': b'\x89PNG\0spam', 'sub/egg.py': b'# SPAM\n',
+        }
+        for name, data in files.items():
+            path = os.path.join(self.root, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_search_files(self):
+        paths = [
+            os.path.join(self.root, name) for name in ('spam.py', 'ham.py', 'image.png')
+        ] + [os.path.join(self.root, 'sub', 'egg.py')]
+        results = search_files(paths, *compile_query('spam'))
+        # 一致しないファイルとバイナリファイルは含まない
+        self.assertEqual(results, [
+            (paths[0], [(2, 'spam = 1', None)]), (paths[3], [(1, '# SPAM', None)]),
+        ])
+
+    def test_project_searcher(self):
+        # プロセスを作らず、スレッドで検索する
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        widget = FakeWidget()
+        found = []
+        progress = []
+        searcher = ProjectSearcher(widget, found.extend, lambda *args: progress.append(args))
+        with mock.patch('busy.findfiles.get_search_executor', return_value=executor):
+            searcher.start(self.root, r'^\w+ = ', use_regex=True)
+            widget.run_jobs()
+        self.assertEqual(sorted(os.path.basename(path) for path, _ in found), ['ham.py', 'spam.py'])
+        self.assertEqual(progress[-1], (4, 4, True))
+        self.assertFalse(searcher.running)
+
+    def search_with(self, executor):
+        widget = FakeWidget()
+        found = []
+        progress = []
+        searcher = ProjectSearcher(widget, found.extend, lambda *args: progress.append(args))
+        with mock.patch('busy.findfiles.SEARCH_CHUNK_SIZE', 1), \
+                mock.patch('busy.findfiles.get_search_executor', return_value=executor), \
+                mock.patch('busy.findfiles.reset_search_executor') as reset:
+            searcher.start(self.root, 'spam')
+            widget.run_jobs()
+        return searcher, found, progress, reset
+
+    def test_chunk_error(self):
+        # 1つのまとまりが失敗しても、プロセスプールは捨てずに残りを検索し、終わる
+        searcher, found, progress, reset = self.search_with(FakeExecutor([ValueError()]))
+        self.assertEqual(progress[-1], (4, 4, True))
+        self.assertIn('ValueError', searcher.error)
+        self.assertFalse(reset.called)
+
+    def test_broken_pool(self):
+        searcher, found, progress, reset = self.search_with(
+            FakeExecutor([BrokenProcessPool()] * 4))
+        self.assertEqual(progress[-1], (4, 4, True))
+        self.assertTrue(reset.called)
+
+    def test_cancelled_chunk(self):
+        # 他から取り消されたまとまりも数え、検索が終わるようにする
+        searcher, found, progress, reset = self.search_with(FakeExecutor(['cancel', 'cancel']))
+        self.assertEqual(progress[-1], (4, 4, True))
+        self.assertFalse(searcher.running)
+
+    def test_sources(self):
+        # 渡した文字列があるファイルは、ファイルの内容ではなく文字列から探す
+        widget = FakeWidget()
+        found = []
+        searcher = ProjectSearcher(widget, found.extend, lambda *args: None)
+        sources = {
+            os.path.join(self.root, 'ham.py'): 'spam = 3\n',
+            os.path.join(self.root, 'spam.py'): 'ham = 1\n',
+        }
+        with mock.patch('busy.findfiles.get_search_executor', return_value=FakeExecutor()):
+            searcher.start(self.root, 'spam', replacement='egg', sources=sources)
+            widget.run_jobs()
+        self.assertEqual(sorted(found), [
+            (os.path.join(self.root, 'ham.py'), [(1, 'spam = 3', 'egg = 3')]),
+            (os.path.join(self.root, 'sub', 'egg.py'), [(1, '# SPAM', '# egg')]),
+        ])
+
+    def test_project_replacer(self):
+        # 置換は検索とは別のプロセスプールで行い、失敗したまとまりはエラーとして返す
+        paths = [os.path.join(self.root, name) for name in ('spam.py', 'ham.py')]
+        widget = FakeWidget()
+        found = []
+        progress = []
+        replacer = ProjectReplacer(widget, found.extend, lambda *args: progress.append(args))
+        executor = FakeExecutor([ValueError('spam')])
+        with mock.patch('busy.findfiles.REPLACE_CHUNK_SIZE', 1), \
+                mock.patch('busy.findfiles.get_search_executor') as get_search_executor, \
+                mock.patch('busy.findfiles.get_replace_executor', return_value=executor), \
+                mock.patch('busy.findfiles.reset_replace_executor') as reset:
+            replacer.start(paths, 'ham', 'egg')
+            widget.run_jobs()
+        self.assertEqual(found, [(paths[0], 0, 'ValueError: spam'), (paths[1], 1, None)])
+        self.assertEqual(progress[-1], (2, 2, True))
+        self.assertFalse(get_search_executor.called)
+        self.assertFalse(reset.called)
+        with open(paths[1], 'rb') as file:
+            self.assertEqual(file.read(), b'egg = 2\n')
+
+
+class PreviewTest(unittest.TestCase):
+    """置換のプレビューが、実際に置換したファイルと同じになるか."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'spam.txt')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def preview_and_replace(self, data, query, replacement, use_regex=False):
+        compiled = compile_query(query, use_regex)
+        template = compile_replacement(compiled, replacement, use_regex)
+        regex = re.compile(compiled[0], compiled[1])
+        with open(self.path, 'wb') as file:
+            file.write(data)
+        preview = search_data(data, regex, template)
+        count = replace_file(self.path, regex, template, compiled[2])
+        with open(self.path, 'rb') as file:
+            written = file.read().decode('utf-8').split('\n')
+        return preview, count, written
+
+    def assertPreviewMatches(self, data, query, replacement, use_regex=False):
+        preview, count, written = self.preview_and_replace(data, query, replacement, use_regex)
+        self.assertGreater(count, 0)
+        for line_no, _, new_line in preview:
+            self.assertEqual(new_line, written[line_no - 1])
+
+    def test_literal(self):
+        self.assertPreviewMatches(b'spam = 1\nham = spam + spam\negg\n', 'spam', 'x')
+
+    def test_groups(self):
+        self.assertPreviewMatches(
+            b'def spam(a):\n    return ham(a)\n', r'(\w+)\((\w)\)', r'\2(\1)', use_regex=True)
+
+    def test_lookahead_across_lines(self):
+        # 1行ずつ置換すると、次の行を見る先読みは一致しない
+        self.assertPreviewMatches(b'a = (\n    1)\nb = (2)\n', r'\($(?=\n)', '[', use_regex=True)
+
+    def test_match_across_lines(self):
+        preview, _, written = self.preview_and_replace(
+            b'x = 1\nspam\nham\ny = 2\n', r'spam\nham', 'egg', use_regex=True)
+        self.assertEqual(preview, [(2, 'spam', 'egg')])
+        self.assertEqual(written[1], 'egg')
+
+    def test_insert_newline(self):
+        preview, _, written = self.preview_and_replace(b'a, b\n', ', ', ',\n')
+        self.assertEqual(preview, [(1, 'a, b', 'a,\\nb')])
+        self.assertEqual(written[:2], ['a,', 'b'])
+
+
+class ReplaceFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'spam.txt')
+        with open(self.path, 'wb') as file:
+            file.write(b'spam = 1\nSPAM = 2\n')
+        os.chmod(self.path, 0o640)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def replace(self, path, query='spam', replacement='ham', match_case=False, dry_run=False):
+        compiled = compile_query(query, match_case=match_case)
+        template = compile_replacement(compiled, replacement)
+        regex = re.compile(compiled[0], compiled[1])
+        return replace_file(path, regex, template, compiled[2], dry_run)
+
+    def read(self):
+        with open(self.path, 'rb') as file:
+            return file.read()
+
+    def test_replace(self):
+        self.assertEqual(self.replace(self.path), 2)
+        self.assertEqual(self.read(), b'ham = 1\nham = 2\n')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+        # 一時ファイルは残らない
+        self.assertEqual(os.listdir(self.temp_dir.name), ['spam.txt'])
+
+    def test_match_case(self):
+        self.assertEqual(self.replace(self.path, match_case=True), 1)
+        self.assertEqual(self.read(), b'ham = 1\nSPAM = 2\n')
+
+    def test_dry_run(self):
+        self.assertEqual(self.replace(self.path, dry_run=True), 2)
+        self.assertEqual(self.read(), b'spam = 1\nSPAM = 2\n')
+
+    def test_not_found(self):
+        self.assertEqual(self.replace(self.path, query='egg'), 0)
+        self.assertEqual(self.read(), b'spam = 1\nSPAM = 2\n')
+
+    def test_binary(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'spam\0')
+        self.assertEqual(self.replace(self.path), 0)
+        self.assertEqual(self.read(), b'spam\0')
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'no symlink')
+    def test_symlink(self):
+        # シンボリックリンクは残し、リンク先のファイルを置換する
+        link = os.path.join(self.temp_dir.name, 'link.txt')
+        os.symlink(self.path, link)
+        self.assertEqual(self.replace(link), 2)
+        self.assertTrue(os.path.islink(link))
+        self.assertEqual(self.read(), b'ham = 1\nham = 2\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
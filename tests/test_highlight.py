@@ -0,0 +1,496 @@
+import unittest
+from collections import Counter
+from unittest import mock
+
+from pygments.lexers import CLexer, PythonLexer
+from pygments.token import Token
+
+from busy.buffer import TextBuffer
+from busy.codestyles.base import BaseCodeStyle
+from busy.codestyles.highlight import (
+    ROOT_STATE, Highlighter, is_incremental, lex_document, lex_lines, split_lines,
+)
+from busy.codestyles.registry import get_lexer_by_alias
+
+PYTHON_SRC = '''\
+import os
+
+
+class Spam:
+
+    def ham(self, value):
+        # comment
+        return os.path.join(value, 'egg')
+
+
+def main():
+    print(Spam().ham('x'))
+'''
+
+JS_SRC = '''\
+var a = 1;
+/* comment
+   var b = 2;
+*/
+function f(x) {
+    return "s" + x;  // line comment
+}
+'''
+
+CSS_SRC = '''\
+a { color: red; }
+/* comment
+   .b { margin: 0 }
+*/
+.c { padding: 0 }
+'''
+
+HTML_SRC = '''\
+<div class="a">
+<!-- comment
+<p>text</p>
+-->
+<script>
+var x = 1;
+</script>
+</div>
+'''
+
+
+class FakeText:
+    """ハイライトを、Tkを使わずに試すためのTextの代わり."""
+
+    def __init__(self, src, view=(1, 30)):
+        self.lines = src.split('\n')
+        self.tags = {}  # タグ名: {(行, 開始列, 終了列), ...}
+        self.view = view  # 見えている最初の行と最後の行
+        self.jobs = {}  # afterで予約した関数
+        self.job_count = 0
+
+    def _to_offset(self, index):
+        text = '\n'.join(self.lines) + '\n'
+        if index == 'end-1c':
+            return len(text) - 1
+        line, col = (int(x) for x in index.split('.'))
+        if line > len(self.lines):
+            return len(text)
+        offset = sum(len(x) + 1 for x in self.lines[:line-1])
+        return offset + min(col, len(self.lines[line-1]))
+
+    def index(self, index):
+        if index.startswith('@'):
+            y = int(index.split(',')[1])
+            return '{0}.0'.format(self.view[1] if y else self.view[0])
+        offset = self._to_offset(index)
+        before = ('\n'.join(self.lines) + '\n')[:offset]
+        return '{0}.{1}'.format(before.count('\n') + 1, len(before.rpartition('\n')[2]))
+
+    def get(self, start, end):
+        text = '\n'.join(self.lines) + '\n'
+        return text[self._to_offset(start):self._to_offset(end)]
+
+    def tag_add(self, tag, *indices):
+        for start, end in zip(indices[::2], indices[1::2]):
+            line, start_col = (int(x) for x in start.split('.'))
+            end_col = int(end.split('.')[1])
+            self.tags.setdefault(tag, set()).add((line, start_col, end_col))
+
+    def _to_position(self, index):
+        if index == 'end':
+            return len(self.lines) + 1, 0
+        line, col = index.split('.')
+        return int(line), float('inf') if col == 'end' else int(col)
+
+    def tag_remove(self, tag, *indices):
+        spans = self.tags.get(tag, set())
+        for start, end in zip(indices[::2], indices[1::2]):
+            first, last = self._to_position(start), self._to_position(end)
+            spans = {
+                span for span in spans
+                if not (first <= span[:2] and (span[0], span[2]) <= last)
+            }
+        self.tags[tag] = spans
+
+    def winfo_height(self):
+        return 400
+
+    def after(self, ms, func, *args):
+        self.job_count += 1
+        self.jobs[self.job_count] = (func, args)
+        return self.job_count
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run_jobs(self):
+        """予約された関数を、なくなるまで実行する."""
+        while self.jobs:
+            func, args = self.jobs.pop(min(self.jobs))
+            func(*args)
+
+    def replace_lines(self, first, last, lines):
+        """first行目からlast行目をlinesで置き換え、(first, last, 増えた行数)を返す."""
+        self.lines[first-1:last] = lines
+        delta = len(lines) - (last - first + 1)
+        # Textと同じく、消した行のタグは消え、後ろの行のタグは行と一緒に動く
+        for tag, spans in self.tags.items():
+            self.tags[tag] = {
+                (line + delta if line > last else line, start, end)
+                for line, start, end in spans if not first <= line <= last
+            }
+        return first, last, delta
+
+
+def get_tags(text):
+    return {tag: spans for tag, spans in text.tags.items() if spans}
+
+
+def create_highlighter(src):
+    text = FakeText(src)
+    highlighter = Highlighter(text, PythonLexer())
+    highlighter.highlight()
+    return highlighter, text
+
+
+class HighlighterTest(unittest.TestCase):
+
+    def assertSameAsFresh(self, highlighter, text):
+        """編集後のハイライトが、最初から解析し直した場合と同じか."""
+        fresh, fresh_text = create_highlighter('\n'.join(text.lines))
+        self.assertEqual(highlighter.line_spans, fresh.line_spans)
+        self.assertEqual(get_tags(text), get_tags(fresh_text))
+
+    def test_highlight(self):
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        lines = split_lines(PythonLexer().get_tokens_unprocessed(PYTHON_SRC))
+        self.assertEqual(highlighter.line_spans[0], highlighter.to_line(lines[0])[0])
+        self.assertIn((4, 6, 10), text.tags['Token.Name.Class'])
+
+    def test_tag_func(self):
+        # タグ名がNoneのトークンには、タグを付けない
+        text = FakeText(PYTHON_SRC)
+        highlighter = Highlighter(
+            text, PythonLexer(),
+            tag_func=lambda token: 'keyword' if token in Token.Keyword else None)
+        highlighter.highlight()
+        self.assertEqual(list(get_tags(text)), ['keyword'])
+        self.assertIn((4, 0, 5), text.tags['keyword'])
+
+    def test_merge_spans(self):
+        # 隣り合う同じタグの範囲は1つにまとめ、タグのないトークンは飛ばす
+        highlighter = Highlighter(
+            FakeText(''), PythonLexer(),
+            tag_func=lambda token: 'name' if token in Token.Name else None)
+        tokens = [
+            (0, Token.Name, 'os'), (2, Token.Operator, '.'), (3, Token.Name, 'path'),
+            (7, Token.Name.Attribute, 'sep'), (10, Token.Text, '\n'),
+        ]
+        spans, _ = highlighter.to_line(tokens)
+        self.assertEqual(spans, [('name', 0, 2), ('name', 3, 10)])
+
+    def test_apply_diff(self):
+        # 前回と同じ範囲は、Tkに送り直さない
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        calls = highlighter.stats.calls
+        highlighter.apply(0, len(highlighter.line_spans))
+        self.assertEqual(highlighter.stats.calls, calls)
+
+    def test_keep_other_tags(self):
+        # 選択範囲等、ハイライト以外のタグは外さない
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        text.tag_add('sel', '8.0', '8.10')
+        highlighter.edit(*text.replace_lines(7, 7, ['        x = 1']))
+        highlighter.highlight()
+        self.assertEqual(text.tags.pop('sel'), {(8, 0, 10)})
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_edit_line(self):
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        highlighter.edit(*text.replace_lines(7, 7, ["        # 'comment'"]))
+        highlighter.highlight()
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_insert_lines(self):
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        highlighter.edit(*text.replace_lines(2, 2, ['x = 1', 'class Egg:', '    pass', '']))
+        highlighter.highlight()
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_delete_lines(self):
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        highlighter.edit(*text.replace_lines(4, 8, ['class Spam: pass']))
+        highlighter.highlight()
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_stop_at_same_state(self):
+        # 変更した行の後は、状態が一致した時点で解析を打ち切る
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        lexed = []
+        highlighter.symbol_func = lambda token, content: lexed.append(content)
+        highlighter.edit(*text.replace_lines(1, 1, ['import sys']))
+        highlighter.highlight()
+        self.assertNotIn('main', lexed)
+
+
+class LexLinesTest(unittest.TestCase):
+
+    def test_state_inside_token(self):
+        # コメントの途中から始まる行には、状態を保存しない
+        lexer = get_lexer_by_alias('javascript')
+        lines = JS_SRC.split('\n')
+        _, end_states, _, _ = lex_lines(lexer, lines, 0, ROOT_STATE, [], lambda tokens: tokens)
+        self.assertIsNotNone(end_states[0])
+        self.assertEqual(end_states[1:3], [None, None])
+        self.assertIsNotNone(end_states[3])
+
+    def test_stop(self):
+        lexer = get_lexer_by_alias('javascript')
+        lines = JS_SRC.split('\n')
+        # 2行で打ち切る指定でも、コメントが終わる行までは解析する
+        results, _, converged, _ = lex_lines(
+            lexer, lines, 0, ROOT_STATE, [], lambda tokens: tokens, stop=2)
+        self.assertEqual(len(results), 4)
+        self.assertFalse(converged)
+
+    def test_open_lines(self):
+        # 閉じていないために一致しなかったコメントの行を返す. 行末までのコメントは含まない
+        lexer = get_lexer_by_alias('javascript')
+        lines = ['var a = 1;  // line', '/* open', 'var b = 2;']
+        *_, open_lines = lex_lines(lexer, lines, 0, ROOT_STATE, [], lambda tokens: tokens)
+        self.assertEqual(open_lines, [1])
+        *_, open_lines = lex_lines(lexer, JS_SRC.split('\n'), 0, ROOT_STATE, [],
+                                   lambda tokens: tokens)
+        self.assertEqual(open_lines, [])
+
+    def test_incremental(self):
+        self.assertTrue(is_incremental(get_lexer_by_alias('javascript')))
+        # get_tokens_unprocessedを上書きしているレキサーは、文書全体を解析する
+        self.assertFalse(is_incremental(CLexer()))
+
+
+class MultiLineTokenTest(unittest.TestCase):
+    """複数行にまたがるトークンが、文書全体を解析した場合と同じになるか."""
+
+    def create_highlighter(self, src, alias):
+        buffer = TextBuffer(src)
+        text = FakeText(src)
+        highlighter = Highlighter(text, get_lexer_by_alias(alias), buffer=buffer)
+        highlighter.highlight()
+        return highlighter, text, buffer
+
+    def edit(self, highlighter, text, buffer, first, last, lines):
+        buffer.replace_lines(first, last, lines)
+        highlighter.edit(*text.replace_lines(first, last, lines))
+        highlighter.highlight()
+
+    def assertSameAsDocument(self, highlighter, buffer):
+        results, _, _, _ = lex_document(highlighter.lexer, buffer.iter_lines(), highlighter.to_line)
+        self.assertEqual(highlighter.line_spans, [spans for spans, _ in results])
+
+    def test_languages(self):
+        for src, alias in [
+            (PYTHON_SRC, 'python'), (JS_SRC, 'javascript'), (CSS_SRC, 'css'),
+            (HTML_SRC, 'html'),
+        ]:
+            with self.subTest(alias=alias):
+                highlighter, _, buffer = self.create_highlighter(src, alias)
+                self.assertSameAsDocument(highlighter, buffer)
+
+    def test_docstring(self):
+        highlighter, _, _ = self.create_highlighter('def spam():\n    """Spam."""\n', 'python')
+        self.assertIn(('Token.Literal.String.Doc', 4, 15), highlighter.line_spans[1])
+
+    def test_open_comment(self):
+        highlighter, text, buffer = self.create_highlighter(JS_SRC, 'javascript')
+        self.edit(highlighter, text, buffer, 5, 5, ['/* function f(x) {'])
+        self.edit(highlighter, text, buffer, 6, 6, ['    return "s" + x;  */'])
+        self.assertSameAsDocument(highlighter, buffer)
+
+    def test_close_comment(self):
+        highlighter, text, buffer = self.create_highlighter(JS_SRC, 'javascript')
+        self.edit(highlighter, text, buffer, 4, 4, [''])
+        self.assertSameAsDocument(highlighter, buffer)
+
+    def test_close_open_comment_below(self):
+        # 編集より前の閉じていなかったコメントが、後ろの行で閉じられる
+        src = 'var a = 1;\n/* open\nvar b = 2;\nvar c = 3;\nvar d = 4;\n'
+        highlighter, text, buffer = self.create_highlighter(src, 'javascript')
+        self.edit(highlighter, text, buffer, 4, 4, ['*/'])
+        self.assertSameAsDocument(highlighter, buffer)
+        self.assertIn('Comment', highlighter.line_spans[2][0][0])
+        self.edit(highlighter, text, buffer, 4, 4, ['var c = 3;'])
+        self.assertSameAsDocument(highlighter, buffer)
+
+    def test_close_open_string_below(self):
+        # 編集範囲より前で始まった'''が、後ろの行で閉じられれば、その間の行も付け直す
+        src = "x = '''\ny = 1\nz = 2\nw = 3\n"
+        highlighter, text, buffer = self.create_highlighter(src, 'python')
+        self.edit(highlighter, text, buffer, 4, 4, ["w = 3'''"])
+        self.assertSameAsDocument(highlighter, buffer)
+        self.assertIn('String', highlighter.line_spans[2][0][0])
+
+    def test_edit_inside_comment(self):
+        highlighter, text, buffer = self.create_highlighter(HTML_SRC, 'html')
+        self.edit(highlighter, text, buffer, 3, 3, ['<p>text', '</p>'])
+        self.assertSameAsDocument(highlighter, buffer)
+
+
+class HighlighterEditTest(unittest.TestCase):
+    """行数が変わる編集で、行ごとの配列の長さが揃ったままか."""
+
+    def assertLineArrays(self, highlighter, line_count):
+        self.assertEqual(len(highlighter.states), line_count)
+        self.assertEqual(len(highlighter.line_spans), line_count)
+        self.assertEqual(len(highlighter.applied_spans), line_count)
+        self.assertEqual(len(highlighter.line_symbols), line_count)
+
+    def test_join_lines_with_narrow_range(self):
+        # 減った行を含まない範囲が知らされても、各行の配列の長さは揃ったままにする
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        text.replace_lines(6, 7, ['    def ham(self, value):        # comment'])
+        highlighter.edit(6, 6, -1)
+        self.assertLineArrays(highlighter, len(text.lines))
+        highlighter.highlight()
+        fresh, _ = create_highlighter('\n'.join(text.lines))
+        self.assertEqual(highlighter.line_spans, fresh.line_spans)
+
+    def test_delete_all(self):
+        highlighter, text = create_highlighter(PYTHON_SRC)
+        highlighter.edit(*text.replace_lines(1, len(text.lines), ['']))
+        self.assertLineArrays(highlighter, 1)
+        highlighter.highlight()
+        self.assertEqual(highlighter.line_spans, [[]])
+
+    def test_buffer(self):
+        # TextBufferから読む場合も、Textから読む場合と同じになる
+        text = FakeText(PYTHON_SRC)
+        buffer = TextBuffer(PYTHON_SRC)
+        highlighter = Highlighter(text, PythonLexer(), buffer=buffer)
+        highlighter.highlight()
+        lines = ['x = 1', 'class Egg:', '    pass']
+        buffer.replace_lines(2, 2, lines)
+        highlighter.edit(*text.replace_lines(2, 2, lines))
+        self.assertLineArrays(highlighter, buffer.line_count)
+        highlighter.highlight()
+        fresh, fresh_text = create_highlighter('\n'.join(text.lines))
+        self.assertEqual(highlighter.line_spans, fresh.line_spans)
+        self.assertEqual(get_tags(text), get_tags(fresh_text))
+
+
+class SymbolTest(unittest.TestCase):
+
+    def create_highlighter(self, src):
+        counts = Counter()
+
+        def on_symbols(removed, added):
+            counts.update(added)
+            counts.subtract(removed)
+
+        text = FakeText(src)
+        highlighter = Highlighter(
+            text, PythonLexer(),
+            symbol_func=lambda token, content: content if token in Token.Name.Class else None,
+            symbol_listener=on_symbols,
+        )
+        highlighter.highlight()
+        return highlighter, text, counts
+
+    def names(self, counts):
+        return {name for name, count in counts.items() if count > 0}
+
+    def test_symbols(self):
+        highlighter, text, counts = self.create_highlighter(PYTHON_SRC)
+        self.assertEqual(self.names(counts), {'Spam'})
+        self.assertEqual(highlighter.line_symbols[3], ('Spam',))
+
+    def test_edit(self):
+        # 行を変更・削除すると、その行にあった名前はなくなる
+        highlighter, text, counts = self.create_highlighter(PYTHON_SRC)
+        highlighter.edit(*text.replace_lines(4, 4, ['class Egg:']))
+        highlighter.highlight()
+        self.assertEqual(self.names(counts), {'Egg'})
+        highlighter.edit(*text.replace_lines(4, 8, []))
+        highlighter.highlight()
+        self.assertEqual(self.names(counts), set())
+
+    def test_same_name(self):
+        # 同じ名前が他の行にも残っていれば、なくならない
+        highlighter, text, counts = self.create_highlighter(PYTHON_SRC + 'class Spam: pass\n')
+        highlighter.edit(*text.replace_lines(4, 4, ['x = 1']))
+        highlighter.highlight()
+        self.assertEqual(self.names(counts), {'Spam'})
+
+
+class CodeStyleTagTest(unittest.TestCase):
+
+    def test_get_tag(self):
+        # 定義したタグの中で、最も近い親のタグを使う
+        style = BaseCodeStyle.__new__(BaseCodeStyle)
+        style.tag_names = {'Token.Keyword', 'Token.Literal.String'}
+        style.token_tags = {}
+        self.assertEqual(style.get_tag(Token.Literal.String.Double), 'Token.Literal.String')
+        self.assertEqual(style.get_tag(Token.Keyword), 'Token.Keyword')
+        self.assertIsNone(style.get_tag(Token.Punctuation))
+        self.assertIn(Token.Punctuation, style.token_tags)
+
+
+class BackgroundTest(unittest.TestCase):
+
+    def create_long_highlighter(self, view=(1, 20)):
+        src = PYTHON_SRC * 20
+        text = FakeText(src, view=view)
+        return Highlighter(text, PythonLexer()), text, src
+
+    def assertSameAsFresh(self, highlighter, text):
+        fresh, fresh_text = create_highlighter('\n'.join(text.lines))
+        self.assertEqual(highlighter.line_spans, fresh.line_spans)
+        self.assertEqual(get_tags(text), get_tags(fresh_text))
+
+    def test_schedule(self):
+        highlighter, text, src = self.create_long_highlighter()
+        highlighter.schedule()
+        text.run_jobs()
+        self.assertFalse(highlighter.dirty)
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_view_first(self):
+        # 見えている範囲に未解析の行があれば、そこから解析する
+        highlighter, text, src = self.create_long_highlighter(view=(40, 60))
+        start, stop, _ = highlighter._next_job()
+        self.assertEqual((start, stop), (39, 60))
+
+    def test_edit_while_lexing(self):
+        # 解析中にテキストが変更されたら、古い結果は捨てて解析し直す
+        highlighter, text, src = self.create_long_highlighter()
+        highlighter.schedule()
+        highlighter.edit(*text.replace_lines(2, 2, ['x = """', '"""']))
+        text.run_jobs()
+        highlighter.schedule()
+        text.run_jobs()
+        self.assertSameAsFresh(highlighter, text)
+
+    def test_apply_lines(self):
+        # アイドル時のタグ付けは、一度にAPPLY_LINES行まで
+        highlighter, text, src = self.create_long_highlighter()
+        highlighter.highlight()
+        line_count = len(highlighter.line_spans)
+        highlighter.unapplied = [(0, line_count)]
+        with mock.patch('busy.codestyles.highlight.APPLY_LINES', 10):
+            highlighter._apply_pending()
+        self.assertEqual(highlighter.unapplied, [(10, line_count)])
+        self.assertIsNotNone(highlighter.apply_job)
+
+    def test_clear(self):
+        highlighter, text, src = self.create_long_highlighter()
+        highlighter.highlight()
+        highlighter.schedule()
+        highlighter.clear()
+        self.assertFalse(text.jobs)
+        self.assertFalse(get_tags(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import re
+import tempfile
+import unittest
+
+from busy.ignore import IgnoreMatcher, IgnoreRules, iter_files, translate
+
+
+class TranslateTest(unittest.TestCase):
+
+    def assertMatches(self, pattern, path, expected=True):
+        matched = re.match(translate(pattern) + r'\Z', path) is not None
+        self.assertEqual(matched, expected, '{0} {1}'.format(pattern, path))
+
+    def test_name(self):
+        self.assertMatches('*.pyc', 'spam.pyc')
+        self.assertMatches('*.pyc', 'a/b/spam.pyc')
+        self.assertMatches('*.pyc', 'spam.py', False)
+
+    def test_anchored(self):
+        self.assertMatches('/docs/_build', 'docs/_build')
+        self.assertMatches('/docs/_build', 'a/docs/_build', False)
+        self.assertMatches('docs/*.png', 'docs/a/b.png', False)
+
+    def test_double_star(self):
+        self.assertMatches('docs/**/*.png', 'docs/a.png')
+        self.assertMatches('docs/**/*.png', 'docs/a/b/c.png')
+        self.assertMatches('**/build', 'a/build')
+        self.assertMatches('a/**', 'a/b/c')
+
+    def test_character_class(self):
+        self.assertMatches('spam[0-9]', 'spam1')
+        self.assertMatches('spam[!0-9]', 'spam1', False)
+        self.assertMatches('spam[!0-9]', 'spamx')
+        self.assertMatches('spam[', 'spam[')
+        self.assertMatches('spam?', 'spam/', False)
+
+    def test_escape(self):
+        self.assertMatches(r'\!important', '!important')
+        self.assertMatches('a.b', 'axb', False)
+
+
+class IgnoreRulesTest(unittest.TestCase):
+
+    def test_dir_only(self):
+        rules = IgnoreRules(['build/'])
+        self.assertTrue(rules.match('build', True))
+        self.assertIsNone(rules.match('build', False))
+
+    def test_negation(self):
+        rules = IgnoreRules(['*.log', '!keep.log', '# comment', ''])
+        self.assertTrue(rules.match('a.log', False))
+        self.assertFalse(rules.match('keep.log', False))
+        self.assertIsNone(rules.match('a.txt', False))
+
+
+class IgnoreMatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        files = {
+            '.gitignore': '*.log\nbuild/\n',
+            'spam.py': '', 'spam.log': '', 'spam.pyc': '',
+            'build/out.py': '',
+            'sub/.gitignore': '!keep.log\n',
+            'sub/keep.log': '', 'sub/other.log': '', 'sub/ham.py': '',
+        }
+        for name, src in files.items():
+            path = os.path.join(self.root, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(src)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_is_ignored(self):
+        matcher = IgnoreMatcher(self.root)
+        join = os.path.join
+        self.assertTrue(matcher.is_ignored(join(self.root, 'spam.log'), False))
+        self.assertTrue(matcher.is_ignored(join(self.root, 'spam.pyc'), False))
+        self.assertTrue(matcher.is_ignored(join(self.root, 'build'), True))
+        self.assertFalse(matcher.is_ignored(join(self.root, 'spam.py'), False))
+        # 深い階層の.gitignoreほど優先される
+        self.assertFalse(matcher.is_ignored(join(self.root, 'sub', 'keep.log'), False))
+        self.assertTrue(matcher.is_ignored(join(self.root, 'sub', 'other.log'), False))
+
+    def test_forget(self):
+        matcher = IgnoreMatcher(self.root)
+        path = os.path.join(self.root, 'sub', 'ham.py')
+        self.assertFalse(matcher.is_ignored(path, False))
+        with open(os.path.join(self.root, 'sub', '.gitignore'), 'a', encoding='utf-8') as file:
+            file.write('ham.py\n')
+        matcher.forget('sub')
+        self.assertTrue(matcher.is_ignored(path, False))
+
+    def test_iter_files(self):
+        paths = [
+            os.path.relpath(path, self.root).replace(os.sep, '/')
+            for path in iter_files(self.root)
+        ]
+        expected = ['.gitignore', 'spam.py', 'sub/.gitignore', 'sub/ham.py', 'sub/keep.log']
+        self.assertEqual(sorted(paths), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,231 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from busy import lint
+from busy.lint import LintCache, LintRunner, LintServer, ProjectLinter
+from busy.lintserver import serve
+from busy.utils import get_style_guide, run_flake8, run_flake8_source
+
+
+class FakeWidget:
+    """afterで予約した関数を、すぐに実行できるようにするウィジェットの代わり."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.job_count = 0
+
+    def after(self, ms, func, *args):
+        self.job_count += 1
+        self.jobs[self.job_count] = (func, args)
+        return self.job_count
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run_jobs(self):
+        while self.jobs:
+            func, args = self.jobs.pop(min(self.jobs))
+            func(*args)
+
+
+class RunFlake8Test(unittest.TestCase):
+
+    def test_internals(self):
+        # flake8を更新して内部のAPIが変わったら、ここで分かるようにする
+        application = get_style_guide()._application
+        for name in ('formatter', 'plugins', 'options', 'guide'):
+            self.assertTrue(hasattr(application, name), name)
+        self.assertTrue(hasattr(application.plugins, 'checkers'))
+        self.assertTrue(hasattr(application.guide, 'processing_file'))
+
+    def test_output(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'spam.py')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('import os\nx=1\n')
+            output = run_flake8(path)
+            self.assertIn('F401', output)
+            self.assertIn('E225', output)
+            # 2回目も、前回の結果は含まない
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('x = 1\n')
+            self.assertEqual(run_flake8(path), '')
+
+    def test_source(self):
+        # 保存されていない内容をチェックし、結果には渡したパスを使う
+        output = run_flake8_source('import os\nx=1\n', 'spam.py')
+        self.assertIn('spam.py:1:1: F401', output)
+        self.assertIn('spam.py:2:2: E225', output)
+        self.assertEqual(run_flake8_source('x = 1\n', 'spam.py'), '')
+
+
+class FakeServer:
+    """flake8を実行せず、パスをそのまま結果にするlintサーバーの代わり."""
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, *paths):
+        return self.executor.submit(lambda: ' '.join(paths))
+
+
+class LintRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        server = FakeServer()
+        self.addCleanup(server.executor.shutdown)
+        patcher = mock.patch('busy.lint.get_lint_server', return_value=server)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_latest_only(self):
+        # 新しいチェックを依頼したら、古いチェックの結果は渡さない
+        widget = FakeWidget()
+        outputs = []
+        runner = LintRunner(widget, outputs.append)
+        runner.submit('old.py')
+        runner.submit('new.py')
+        runner.future.result()
+        widget.run_jobs()
+        self.assertEqual(outputs, ['new.py'])
+
+    def test_cancel(self):
+        widget = FakeWidget()
+        outputs = []
+        runner = LintRunner(widget, outputs.append)
+        runner.submit('spam.py')
+        runner.future.result()
+        runner.cancel()
+        widget.run_jobs()
+        self.assertEqual(outputs, [])
+        self.assertFalse(widget.jobs)
+
+
+class LintServerTest(unittest.TestCase):
+
+    def test_serve(self):
+        requests = [
+            json.dumps({'id': 1, 'paths': ['a.py', 'b.py']}), 'broken', json.dumps({'id': 2}),
+        ]
+        stdout = io.StringIO()
+        with mock.patch('busy.lintserver.run_flake8', side_effect=lambda *paths: ','.join(paths)):
+            serve(io.StringIO('\n'.join(requests) + '\n'), stdout)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses, [{'id': 1, 'output': 'a.py,b.py'}, {'id': 2, 'output': ''}])
+
+    def test_cancel(self):
+        # 取り消された依頼には、結果を返さない
+        requests = [
+            {'id': 1, 'paths': ['a.py']}, {'cancel': 2},
+            {'id': 2, 'paths': ['b.py']}, {'id': 3, 'source': 'x', 'path': 'c.py'},
+        ]
+        stdin = io.StringIO(''.join(json.dumps(request) + '\n' for request in requests))
+        stdout = io.StringIO()
+        with mock.patch('busy.lintserver.run_flake8', side_effect=lambda *paths: 'file'), \
+                mock.patch('busy.lintserver.run_flake8_source', return_value='source'):
+            serve(stdin, stdout)
+        responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual(responses, [{'id': 1, 'output': 'file'}, {'id': 3, 'output': 'source'}])
+
+    def test_server_process(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'spam.py')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write('import os\n')
+            server = LintServer()
+            self.addCleanup(server.stop)
+            output = server.submit(path).result(timeout=60)
+            self.assertIn('F401', output)
+            self.assertIsNotNone(server.process)
+
+    def test_fallback(self):
+        # サーバーを起動できなければ、このプロセスで実行する
+        server = LintServer()
+        server.failures = lint.MAX_FAILURES
+        with mock.patch('busy.lint.handle_request', return_value='output'):
+            self.assertEqual(server.submit('spam.py').result(timeout=10), 'output')
+        self.assertIsNone(server.process)
+        server.fallback.shutdown()
+
+
+class LintCacheTest(unittest.TestCase):
+
+    def test_key(self):
+        key = LintCache.get_key('spam.py', 'x = 1\n')
+        self.assertEqual(key, LintCache.get_key('spam.py', 'x = 1\n'))
+        self.assertNotEqual(key, LintCache.get_key('spam.py', 'x = 2\n'))
+        # 結果出力にはパスが含まれるので、内容が同じでもパスが違えば別のキー
+        self.assertNotEqual(key, LintCache.get_key('ham.py', 'x = 1\n'))
+
+    def test_size(self):
+        cache = LintCache(size=2)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        self.assertEqual(cache.get('a'), 'A')  # aを最近使ったことにする
+        cache.set('c', 'C')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(cache.get('c'), 'C')
+
+    def test_disk(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_dir = os.path.join(temp_dir, 'lint')
+            LintCache(cache_dir=cache_dir).set('a', 'spam.py:1:1: E999\n')
+            self.assertEqual(LintCache(cache_dir=cache_dir).get('a'), 'spam.py:1:1: E999\n')
+            self.assertIsNone(LintCache(cache_dir=cache_dir).get('b'))
+
+
+class ProjectLinterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.root = self.temp_dir.name
+        files = {'spam.py': 'import os\n', 'ham.py': 'x = 1\n', 'sub/egg.py': 'y=2\n'}
+        for name, src in files.items():
+            path = os.path.join(self.root, *name.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(src)
+
+        # プロセスを作らず、スレッドでチェックする
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        self.cache = LintCache()
+        for target, value in (('get_project_executor', executor), ('get_lint_cache', self.cache)):
+            patcher = mock.patch('busy.lint.' + target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def lint_project(self):
+        widget = FakeWidget()
+        outputs = []
+        progress = []
+        linter = ProjectLinter(widget, outputs.extend, lambda *args: progress.append(args))
+        linter.start(self.root)
+        widget.run_jobs()
+        return sorted(outputs), progress[-1]
+
+    def test_lint_project(self):
+        outputs, progress = self.lint_project()
+        # 問題のなかったファイルの結果は渡さない
+        self.assertEqual(len(outputs), 2)
+        self.assertIn('spam.py:1:1: F401', ''.join(outputs))
+        self.assertIn('egg.py:1:2: E225', ''.join(outputs))
+        self.assertEqual(progress, (3, 3, True))
+
+    def test_cache(self):
+        # 2回目は、前回の結果を使う
+        expected = self.lint_project()
+        with mock.patch('busy.lint.lint_sources') as lint_sources:
+            self.assertEqual(self.lint_project(), expected)
+        lint_sources.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
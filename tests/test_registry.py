@@ -0,0 +1,26 @@
+import unittest
+
+from busy.codestyles import PythonCodeStyle, find_code_style_class, get_lexer_for_path
+from busy.codestyles.registry import get_lexer_by_alias
+
+
+class RegistryTest(unittest.TestCase):
+
+    def test_find_code_style_class(self):
+        self.assertIs(find_code_style_class('/path/to/spam.py'), PythonCodeStyle)
+        self.assertIs(find_code_style_class('spam.pyw'), PythonCodeStyle)
+        self.assertIsNone(find_code_style_class('spam.yaml'))
+
+    def test_lexer_cache(self):
+        # レキサーは一度だけ作り、全てのエディタで使い回す
+        lexer = get_lexer_for_path('spam.yaml')
+        self.assertIsNotNone(lexer)
+        self.assertIs(get_lexer_for_path('/other/ham.yaml'), lexer)
+        self.assertIs(get_lexer_by_alias('python'), get_lexer_by_alias('python'))
+
+    def test_plain_text(self):
+        self.assertIsNone(get_lexer_for_path('spam.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import unittest
+
+from busy.runner import OutputBuffer, ProcessRunner
+
+
+class FakeWidget:
+    """afterで予約した関数を、すぐに実行できるようにするウィジェットの代わり."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.job_count = 0
+
+    def after(self, ms, func, *args):
+        self.job_count += 1
+        self.jobs[self.job_count] = (func, args)
+        return self.job_count
+
+    def after_cancel(self, job):
+        self.jobs.pop(job, None)
+
+    def run_jobs(self):
+        while self.jobs:
+            func, args = self.jobs.pop(min(self.jobs))
+            func(*args)
+
+
+class OutputBufferTest(unittest.TestCase):
+
+    def test_read(self):
+        buffer = OutputBuffer()
+        buffer.write('spam\n')
+        buffer.write('ham\n')
+        self.assertEqual(buffer.read(), 'spam\nham\n')
+        self.assertEqual(buffer.read(), '')
+
+    def test_size(self):
+        # 上限を超えた分は古いものから捨て、捨てた文字数を表示する
+        buffer = OutputBuffer(size=6)
+        buffer.write('spam\n')
+        buffer.write('ham\n')
+        self.assertEqual(buffer.read(), '[... 5 characters skipped ...]\nham\n')
+        buffer.write('0123456789')
+        self.assertEqual(buffer.read(), '[... 4 characters skipped ...]\n456789')
+
+
+class ProcessRunnerTest(unittest.TestCase):
+
+    def run_process(self, code, stop=False):
+        widget = FakeWidget()
+        outputs = []
+        exits = []
+        runner = ProcessRunner(widget, outputs.append, lambda *args: exits.append(args))
+        self.addCleanup(runner.kill)
+        runner.start([sys.executable, '-c', code])
+        if stop:
+            runner.stop()
+        widget.run_jobs()
+        self.assertFalse(runner.running)
+        return ''.join(outputs), exits
+
+    def test_output(self):
+        output, exits = self.run_process(
+            'import sys\nprint("spam")\nprint("ham", file=sys.stderr)\nsys.exit(3)')
+        self.assertEqual(output.splitlines(), ['spam', 'ham'])
+        returncode, elapsed, stopped = exits[0]
+        self.assertEqual(returncode, 3)
+        self.assertFalse(stopped)
+
+    @unittest.skipIf(sys.platform == 'win32', 'uses process groups')
+    def test_stop(self):
+        _, exits = self.run_process('import time\ntime.sleep(60)', stop=True)
+        returncode, elapsed, stopped = exits[0]
+        self.assertNotEqual(returncode, 0)
+        self.assertTrue(stopped)
+        self.assertLess(elapsed, 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
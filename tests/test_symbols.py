@@ -0,0 +1,293 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+from importlib.machinery import PathFinder
+from unittest import mock
+
+from busy.codestyles.python import PythonCodeStyle, get_import_names
+from busy.codestyles.symbols import (
+    MemberCache, SymbolIndex, get_extension_members, parse_symbols, resolve_relative,
+)
+
+SYMBOLS_SRC = '''\
+import os.path
+from collections import OrderedDict as odict
+from spam import *
+
+try:
+    import ujson as json
+except ImportError:
+    json = None
+
+MAX_SIZE, (x, y) = 10, (1, 2)
+
+
+class Spam:
+
+    def ham(self):
+        local = 1
+
+
+async def main():
+    pass
+'''
+
+PACKAGE_INIT = '''\
+from .core import *
+from . import util as tools
+'''
+
+PACKAGE_CORE = '''\
+from ._impl import *
+
+
+def spam():
+    pass
+
+
+def _private():
+    pass
+'''
+
+PACKAGE_IMPL = '''\
+def ham():
+    pass
+'''
+
+
+class FakeEditor:
+    """補完の位置を調べるための、エディタの代わり."""
+
+    path = None
+
+    def __init__(self, src):
+        self.src = src
+
+    def get_src(self):
+        return self.src
+
+    def get_line_text_before_cursor(self):
+        return self.src.split('\n')[-1]
+
+
+class FakeStyle:
+
+    def __init__(self, src):
+        self.editor = FakeEditor(src)
+
+
+class ParseSymbolsTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_symbols(SYMBOLS_SRC), [
+            ('os', 'import'), ('odict', 'import'),
+            ('json', 'import'), ('json', 'name'),
+            ('MAX_SIZE', 'name'), ('x', 'name'), ('y', 'name'),
+            ('Spam', 'class'), ('ham', 'method'), ('main', 'function'),
+        ])
+
+    def test_syntax_error(self):
+        self.assertEqual(parse_symbols('def spam(:\n'), [])
+
+
+class SymbolIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.temp_dir.name, 'project')
+        self.cache_dir = os.path.join(self.temp_dir.name, 'cache')
+        self.write('spam.py', 'def spam_func():\n    pass\n')
+        self.write('sub/ham.py', 'class HamClass:\n    pass\n')
+        self.write('__pycache__/egg.py', 'egg_name = 1\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, name, src):
+        path = os.path.join(self.root, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(src)
+        return path
+
+    def build(self):
+        index = SymbolIndex(self.root, cache_dir=self.cache_dir)
+        index._build()
+        return index
+
+    def test_build(self):
+        index = self.build()
+        self.assertEqual(index.search('spam'), ['spam_func'])
+        self.assertEqual(index.search('Ham'), ['HamClass'])
+        self.assertEqual(index.search('egg'), [])
+
+    def test_update(self):
+        index = self.build()
+        path = self.write('spam.py', 'def spam_other():\n    pass\n')
+        os.utime(path, (0, 0))  # 同じ大きさでも、更新日時が変われば解析し直す
+        os.remove(os.path.join(self.root, 'sub', 'ham.py'))
+        index._build()
+        self.assertEqual(index.search('spam'), ['spam_other'])
+        self.assertEqual(index.search('Ham'), [])
+
+    def test_load(self):
+        self.build()
+        index = SymbolIndex(self.root, cache_dir=self.cache_dir)
+        index.load()
+        self.assertEqual(index.search('spam'), ['spam_func'])
+
+
+class MemberCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = MemberCache(os.path.join(self.temp_dir.name, 'cache'))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def create_package(self):
+        package_dir = os.path.join(self.temp_dir.name, 'src', 'busy_test_pkg')
+        os.makedirs(os.path.join(package_dir, 'sub'))
+        files = {
+            '__init__.py': 'from .util import helper\n\n\ndef spam():\n    pass\n',
+            'util.py': 'def helper():\n    pass\n\n\ndef __dunder():\n    pass\n',
+            'sub/__init__.py': '',
+        }
+        for name, src in files.items():
+            with open(os.path.join(package_dir, *name.split('/')), 'w', encoding='utf-8') as file:
+                file.write(src)
+        return os.path.dirname(package_dir)
+
+    def test_package(self):
+        root = self.create_package()
+        path, _, names = self.cache.load('busy_test_pkg', [root])
+        self.assertTrue(path.endswith('__init__.py'))
+        # モジュールレベルの名前と、サブモジュール
+        self.assertEqual(sorted(names), ['helper', 'spam', 'sub', 'util'])
+        self.assertEqual(self.cache.load('busy_test_pkg.util', [root])[2], ['helper'])
+
+    def test_not_found(self):
+        self.assertEqual(self.cache.load('busy_no_such_module', []), (None, None, []))
+
+    def test_builtin(self):
+        # ソースのない組み込みモジュールは、dir()で調べる
+        self.assertIn('getrecursionlimit', self.cache.load('sys', [])[2])
+
+    def test_disk_cache(self):
+        root = self.create_package()
+        expected = sorted(self.cache.load('busy_test_pkg', [root])[2])
+        self.assertTrue(os.listdir(self.cache.cache_dir))
+        cache = MemberCache(self.cache.cache_dir)
+        self.assertEqual(sorted(cache.load('busy_test_pkg', [root])[2]), expected)
+
+    def test_get(self):
+        # 解析中はNoneを返し、終われば属性名の索引を返す
+        root = self.create_package()
+        index = self.cache.get('busy_test_pkg', [root])
+        deadline = time.monotonic() + 5
+        while index is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+            index = self.cache.get('busy_test_pkg', [root])
+        self.assertEqual(index.search('he'), ['helper'])
+
+    def create_star_package(self):
+        package_dir = os.path.join(self.temp_dir.name, 'star', 'busy_star_pkg')
+        os.makedirs(package_dir)
+        files = {
+            '__init__.py': PACKAGE_INIT, 'core.py': PACKAGE_CORE,
+            '_impl.py': PACKAGE_IMPL, 'util.py': 'def helper():\n    pass\n',
+        }
+        for name, src in files.items():
+            with open(os.path.join(package_dir, name), 'w', encoding='utf-8') as file:
+                file.write(src)
+        return os.path.dirname(package_dir)
+
+    def test_star_import(self):
+        # os は from posix import * で、listdir等を持っている
+        names = self.cache.load('os', [])[2]
+        for name in ('listdir', 'getcwd', 'stat', 'path'):
+            self.assertIn(name, names)
+
+    def test_module_attribute(self):
+        # os.path はパッケージのサブモジュールではなく、osがimportしたモジュール
+        path, _, names = self.cache.load('os.path', [])
+        self.assertIsNotNone(path)
+        self.assertIn('join', names)
+
+    def test_relative_star_import(self):
+        root = self.create_star_package()
+        names = self.cache.load('busy_star_pkg', [root])[2]
+        self.assertIn('spam', names)
+        self.assertIn('ham', names)  # 2段階の*でのimport
+        self.assertNotIn('_private', names)
+        self.assertIn('tools', names)
+        self.assertIn('helper', self.cache.load('busy_star_pkg.tools', [root])[2])
+
+    def test_resolve_relative(self):
+        self.assertEqual(resolve_relative('x', 0, 'a.b'), 'x')
+        self.assertEqual(resolve_relative('x', 1, 'a.b'), 'a.b.x')
+        self.assertEqual(resolve_relative(None, 2, 'a.b'), 'a')
+        self.assertIsNone(resolve_relative('x', 3, 'a.b'))
+
+
+class ExtensionMembersTest(unittest.TestCase):
+
+    def test_builtin(self):
+        self.assertIn('getrecursionlimit', get_extension_members('sys'))
+
+    def test_shadowed(self):
+        # sys.pathの先頭に同じ名前のファイルがあっても、渡したファイルを読み込む
+        spec = PathFinder.find_spec('cmath')
+        if spec is None or not spec.has_location:
+            self.skipTest('cmath is not an extension module')
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with open(os.path.join(temp_dir, 'cmath.py'), 'w', encoding='utf-8') as file:
+                file.write('shadow = 1\n')
+            with mock.patch.object(sys, 'path', [temp_dir] + sys.path), \
+                    mock.patch.dict(sys.modules):
+                sys.modules.pop('cmath', None)
+                names = get_extension_members('cmath', spec.origin)
+        self.assertIn('sqrt', names)
+        self.assertNotIn('shadow', names)
+
+
+class ImportNamesTest(unittest.TestCase):
+
+    def test_import_names(self):
+        src = (
+            'import os.path\n'
+            'import numpy as np, sys\n'
+            'from collections import (\n    OrderedDict as odict, deque)\n'
+        )
+        self.assertEqual(get_import_names(src), {
+            'os.path': 'os.path', 'os': 'os', 'np': 'numpy', 'sys': 'sys',
+            'odict': 'collections.OrderedDict', 'deque': 'collections.deque',
+        })
+
+
+class MemberModuleTest(unittest.TestCase):
+
+    def get_member_module(self, src):
+        return PythonCodeStyle.get_member_module(FakeStyle(src))
+
+    def test_attribute(self):
+        self.assertEqual(self.get_member_module('import os\nos.path.jo'), 'os.path')
+        self.assertEqual(self.get_member_module('import numpy as np\nnp.ar'), 'numpy')
+        self.assertEqual(self.get_member_module('spam.ha'), '')
+        self.assertIsNone(self.get_member_module('import os\nlen'))
+
+    def test_from_import(self):
+        self.assertEqual(self.get_member_module('from os.path import jo'), 'os.path')
+        self.assertEqual(self.get_member_module('from os import '), 'os')
+        self.assertEqual(self.get_member_module('from os import (path, sep, li'), 'os')
+        self.assertEqual(self.get_member_module('from os import path as p, li'), 'os')
+        self.assertEqual(self.get_member_module('from .util import he'), 'util')
+        # 別名の入力中は補完しない
+        self.assertIsNone(self.get_member_module('from os import path as p'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from busy.codestyles import tagging
+from busy.codestyles.tagging import TagBatch, TagStats
+
+
+class RecordingText:
+    """呼ばれたタグ付けを記録する、Textの代わり."""
+
+    def __init__(self):
+        self.calls = []
+
+    def tag_add(self, tag, *indices):
+        self.calls.append(('add', tag) + indices)
+
+    def tag_remove(self, tag, *indices):
+        self.calls.append(('remove', tag) + indices)
+
+
+class TagBatchTest(unittest.TestCase):
+
+    def test_group_by_tag(self):
+        # 同じタグの範囲は、1回のtag_addにまとめる
+        text = RecordingText()
+        batch = TagBatch()
+        batch.add('Token.Keyword', 1, 0, 6)
+        batch.add('Token.Name', 1, 7, 9)
+        batch.add('Token.Keyword', 2, 0, 3)
+        batch.remove('Token.Keyword', 3, 0, 'end')
+        batch.remove('Token.Keyword', 4, 2, 5)
+        batch.apply(text)
+        self.assertEqual(text.calls, [
+            ('remove', 'Token.Keyword', '3.0', '3.end', '4.2', '4.5'),
+            ('add', 'Token.Keyword', '1.0', '1.6', '2.0', '2.3'),
+            ('add', 'Token.Name', '1.7', '1.9'),
+        ])
+        self.assertEqual(batch.stats.ranges, 3)
+        self.assertEqual(batch.stats.calls, 3)
+
+    def test_chunk(self):
+        text = RecordingText()
+        stats = TagStats()
+        batch = TagBatch(stats)
+        for line in range(1, tagging.CHUNK_SIZE + 2):
+            batch.add('Token.Name', line, 0, 1)
+        batch.apply(text)
+        self.assertEqual(len(text.calls), 2)
+        self.assertEqual(stats.ranges, tagging.CHUNK_SIZE + 1)
+        self.assertEqual(stats.saved_calls, stats.ranges * tagging.CALLS_PER_TOKEN - 2)
+
+    def test_apply_clears(self):
+        text = RecordingText()
+        batch = TagBatch()
+        batch.add('Token.Name', 1, 0, 1)
+        batch.apply(text)
+        batch.apply(text)
+        self.assertEqual(len(text.calls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
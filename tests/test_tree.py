@@ -0,0 +1,164 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from busy.frames.tree import PathTreeFrame
+from busy.ignore import DEFAULT_IGNORE, IgnoreMatcher
+from busy.watch import PollingWatcher
+
+
+class FakeTree:
+    """ノードの追加と削除を、Tkを使わずに試すためのTreeviewの代わり."""
+
+    def __init__(self):
+        self.children = {'': []}
+        self.items = {}
+        self.count = 0
+
+    def insert(self, parent, index, text='', open=False):
+        self.count += 1
+        node = 'I{0}'.format(self.count)
+        self.children[node] = []
+        self.items[node] = {'text': text, 'open': open}
+        siblings = self.children[parent]
+        siblings.insert(len(siblings) if index == 'end' else index, node)
+        return node
+
+    def delete(self, *nodes):
+        for node in nodes:
+            for siblings in self.children.values():
+                if node in siblings:
+                    siblings.remove(node)
+            self.delete(*self.children.pop(node))
+
+    def get_children(self, node):
+        return tuple(self.children[node])
+
+    def item(self, node, option):
+        return self.items[node][option]
+
+
+class SyncTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        for name in ('a.py', 'c.py', 'sub/x.py'):
+            self.create(name)
+        self.frame = PathTreeFrame.__new__(PathTreeFrame)
+        self.frame.tree = FakeTree()
+        self.frame.nodes = {}
+        self.frame.watcher = PollingWatcher()
+        self.frame.watched = {}
+        self.frame.after = lambda ms, func: None
+        self.frame.loading = {}
+        self.frame.more_nodes = {}
+        self.frame.limits = {}
+        self.frame.ignore = IgnoreMatcher(self.root, DEFAULT_IGNORE)
+        self.frame.file_index = mock.Mock()
+        self.jobs = {}
+        self.frame.after_idle = self.after_idle
+        self.frame.after_cancel = self.jobs.pop
+        self.root_node = self.frame.insert_node('', self.root, self.root)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def after_idle(self, func, *args):
+        job = len(self.jobs) + 1
+        self.jobs[job] = (func, args)
+        return job
+
+    def run_jobs(self):
+        while self.jobs:
+            func, args = self.jobs.pop(min(self.jobs))
+            func(*args)
+
+    def create(self, name):
+        path = os.path.join(self.root, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, 'w').close()
+
+    def names(self, node):
+        tree = self.frame.tree
+        return [tree.item(child, 'text') for child in tree.get_children(node)]
+
+    def find(self, node, name):
+        tree = self.frame.tree
+        return next(child for child in tree.get_children(node) if tree.item(child, 'text') == name)
+
+    def test_load(self):
+        self.frame.load_node(self.root_node)
+        self.assertEqual(self.names(self.root_node), ['a.py', 'c.py', 'sub'])
+        # 開いていないディレクトリは、開けるように空の子要素だけを持つ
+        self.assertEqual(len(self.names(self.find(self.root_node, 'sub'))), 1)
+
+    def test_sync(self):
+        # 変わっていないノードは残し、増えたパスは名前順の位置に入れる
+        self.frame.load_node(self.root_node)
+        sub = self.find(self.root_node, 'sub')
+        self.frame.tree.items[sub]['open'] = True
+        self.frame.load_node(sub)
+        self.create('b.py')
+        self.create('sub/y.py')
+        os.remove(os.path.join(self.root, 'c.py'))
+        self.frame.tree.items[self.root_node]['open'] = True
+        self.frame.refresh_node(self.root_node)
+        self.assertEqual(self.names(self.root_node), ['a.py', 'b.py', 'sub'])
+        self.assertEqual(self.find(self.root_node, 'sub'), sub)
+        self.assertEqual(self.names(sub), ['x.py', 'y.py'])
+        self.assertEqual(len(self.frame.nodes), 6)
+
+    def test_refresh_closed(self):
+        # 開いていないディレクトリは、次に開いた時に読み直す
+        self.frame.load_node(self.root_node)
+        self.frame.refresh_node(self.root_node)
+        self.assertFalse(self.frame.nodes[self.root_node][0])
+        self.assertEqual(self.frame.watched, {})
+
+    def test_check_changes(self):
+        # 監視している、開いたディレクトリの変更だけを反映する
+        self.frame.load_node(self.root_node)
+        self.assertEqual(self.frame.watched, {self.root: self.root_node})
+        self.create('b.py')
+        os.utime(self.root, ns=(0, 0))  # 更新日時の分解能が粗くても、変更が分かるように
+        self.frame.check_changes()
+        self.assertEqual(self.names(self.root_node), ['a.py', 'b.py', 'c.py', 'sub'])
+        self.frame.file_index.update_dir.assert_called_once_with(self.root)
+
+    def test_stale(self):
+        # 閉じたディレクトリは、中のディレクトリも含めて監視をやめる
+        self.frame.load_node(self.root_node)
+        sub = self.find(self.root_node, 'sub')
+        self.frame.load_node(sub)
+        self.frame.stale_node(self.root_node)
+        self.assertEqual(self.frame.watched, {})
+        self.assertFalse(self.frame.nodes[sub][0])
+
+    def test_ignore(self):
+        with open(os.path.join(self.root, '.gitignore'), 'w') as file:
+            file.write('c.py\n')
+        self.create('__pycache__/a.pyc')
+        self.frame.load_node(self.root_node)
+        self.assertEqual(self.names(self.root_node), ['.gitignore', 'a.py', 'sub'])
+
+    @mock.patch('busy.frames.tree.INSERT_CHUNK_SIZE', 2)
+    def test_insert_chunks(self):
+        # 一度に挿入するのはINSERT_CHUNK_SIZE個までで、残りはアイドル時に挿入する
+        self.frame.load_node(self.root_node)
+        self.assertEqual(self.names(self.root_node), ['a.py', 'c.py', 'loading…'])
+        self.run_jobs()
+        self.assertEqual(self.names(self.root_node), ['a.py', 'c.py', 'sub'])
+
+    @mock.patch('busy.frames.tree.MAX_CHILDREN', 2)
+    def test_show_more(self):
+        self.frame.load_node(self.root_node)
+        self.assertEqual(self.names(self.root_node), ['a.py', 'c.py', 'show more…'])
+        self.frame.show_more(self.find(self.root_node, 'show more…'))
+        self.assertEqual(self.names(self.root_node), ['a.py', 'c.py', 'sub'])
+        self.assertEqual(self.frame.more_nodes, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+
+from busy.watch import InotifyWatcher, PollingWatcher, create_watcher, load_libc
+
+
+class WatcherTestMixin:
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+        self.sub = os.path.join(self.root, 'sub')
+        os.mkdir(self.sub)
+        self.watcher = self.create_watcher()
+
+    def tearDown(self):
+        if hasattr(self.watcher, 'close'):
+            self.watcher.close()
+        self.temp_dir.cleanup()
+
+    def create(self, path):
+        open(path, 'w').close()
+        os.utime(os.path.dirname(path), ns=(0, 0))  # 更新日時の分解能が粗くても、変更が分かるように
+
+    def test_poll(self):
+        self.watcher.watch(self.root)
+        self.watcher.watch(self.sub)
+        self.assertEqual(self.watcher.poll(), set())
+        # 何度変更されても、1回のpollではディレクトリごとに1つ
+        self.create(os.path.join(self.sub, 'a.py'))
+        self.create(os.path.join(self.sub, 'b.py'))
+        self.assertEqual(self.watcher.poll(), {self.sub})
+        self.assertEqual(self.watcher.poll(), set())
+
+    def test_unwatch(self):
+        self.watcher.watch(self.sub)
+        self.watcher.unwatch(self.sub)
+        self.create(os.path.join(self.sub, 'a.py'))
+        self.assertEqual(self.watcher.poll(), set())
+
+
+class PollingWatcherTest(WatcherTestMixin, unittest.TestCase):
+
+    def create_watcher(self):
+        return PollingWatcher()
+
+
+@unittest.skipIf(load_libc() is None, 'inotify is not available')
+class InotifyWatcherTest(WatcherTestMixin, unittest.TestCase):
+
+    def create_watcher(self):
+        return InotifyWatcher(load_libc())
+
+    def test_create_watcher(self):
+        watcher = create_watcher()
+        self.assertIsInstance(watcher, InotifyWatcher)
+        watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()